@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+API响应基准测试 - 对比标准库JSON无压缩响应与orjson+压缩+ETag条件请求的字节数和耗时
+"""
+
+import argparse
+import gzip
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from monitor.responses import EncodedJSON, brotli, dumps
+
+DETECTIONS = ["异常区域检测", "重点水利设施检测", "地物分类", "水体自动提取"]
+
+
+def make_result(index):
+    """生成一个包含中文键的检测结果"""
+    return {
+        name: {
+            "数量": index % 17,
+            "面积": round(index * 1.37, 2),
+            "区域": [{"类别": f"类别{j}", "置信度": 0.5 + j / 100, "坐标": [j, j + 1, j + 2, j + 3]} for j in range(5)],
+        }
+        for name in DETECTIONS
+    }
+
+
+def make_history(count):
+    """模拟 /api/tasks/history 的响应"""
+    return {
+        "tasks": [
+            {
+                "id": f"detect_result_{i:08d}",
+                "timestamp": "2024-01-01T00:00:00",
+                "status": "completed",
+                "result_path": f"/data/detected_result_json_files/detect_result_{i:08d}.json",
+                "image_files": [f"/data/detected_result_images/result_{i:08d}.png"],
+                "summary": make_result(i),
+            }
+            for i in range(count)
+        ],
+        "total": count,
+        "next_cursor": None,
+    }
+
+
+def timed(fn, repeat):
+    """返回多次执行的中位耗时(毫秒)和最后一次的结果"""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations), result
+
+
+def bench_encoding(payload, repeat):
+    """序列化和压缩: 单次响应体的字节数和耗时"""
+    rows = []
+    ms, body = timed(lambda: json.dumps(payload, ensure_ascii=False).encode("utf-8"), repeat)
+    rows.append(("json.dumps 无压缩 (原实现)", len(body), ms))
+    ms, body = timed(lambda: dumps(payload), repeat)
+    rows.append(("orjson 无压缩", len(body), ms))
+    ms, body = timed(lambda: gzip.compress(dumps(payload), compresslevel=5), repeat)
+    rows.append(("orjson + gzip", len(body), ms))
+    if brotli is not None:
+        ms, body = timed(lambda: brotli.compress(dumps(payload), quality=4), repeat)
+        rows.append(("orjson + brotli", len(body), ms))
+    encoded = EncodedJSON.encode(payload)
+    encoded.compressed("gzip")
+    ms, body = timed(lambda: encoded.compressed("gzip"), repeat)
+    rows.append(("缓存命中(已压缩)", len(body), ms))
+    return rows
+
+
+def bench_endpoint(count, repeat):
+    """通过TestClient轮询 /api/tasks/history: 首次请求、重复请求和条件请求"""
+    root = Path(tempfile.mkdtemp(prefix="bench_api_"))
+    cwd = os.getcwd()
+    os.chdir(root)
+    os.environ["MONITOR_WATCH"] = "0"
+    json_dir = root / "data" / "detected_result_json_files"
+    json_dir.mkdir(parents=True)
+    for i in range(count):
+        ts = time.strftime("%Y%m%d_%H%M%S", time.localtime(1_700_000_000 + i * 60))
+        with open(json_dir / f"detect_result_{ts}.json", "w", encoding="utf-8") as f:
+            json.dump(make_result(i), f, ensure_ascii=False)
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import monitor_web
+    from fastapi.testclient import TestClient
+
+    rows = []
+    try:
+        with TestClient(monitor_web.app) as client:
+            client.get("/api/tasks/history")  # 建立索引
+            for label, headers in (
+                ("不压缩", {"Accept-Encoding": "identity"}),
+                ("gzip", {"Accept-Encoding": "gzip"}),
+            ):
+                sizes = []
+
+                def poll():
+                    response = client.get("/api/tasks/history", headers=headers)
+                    sizes.append(int(response.headers.get("content-length", len(response.content))))
+                    return response
+
+                ms, response = timed(poll, repeat)
+                rows.append((f"200 {label}", sizes[-1], ms))
+            etag = response.headers["etag"]
+
+            def conditional():
+                return client.get("/api/tasks/history", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+
+            ms, response = timed(conditional, repeat)
+            rows.append((f"{response.status_code} If-None-Match", len(response.content), ms))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root, ignore_errors=True)
+    return rows
+
+
+def print_rows(title, rows):
+    print(title)
+    print(f"{'方式':<28} {'字节数':>12} {'耗时(ms)':>10}")
+    for label, size, ms in rows:
+        print(f"{label:<28} {size:>12,} {ms:>10.2f}")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API响应基准测试")
+    parser.add_argument("--tasks", type=int, default=5000, help="历史任务数")
+    parser.add_argument("--repeat", type=int, default=20, help="每项重复次数(取中位数)")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"API响应基准测试 (历史任务数 {args.tasks})")
+    print("=" * 60)
+    print_rows("序列化与压缩:", bench_encoding(make_history(args.tasks), args.repeat))
+    print_rows("GET /api/tasks/history 轮询 (TestClient):", bench_endpoint(args.tasks, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+事件循环延迟基准测试 - 对比阻塞操作在事件循环中执行与交给工作池执行时，
+慢请求(历史记录重建、缩略图生成)对廉价请求(/api/tasks/current)的影响
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+
+
+def make_dataset(root, tasks, images):
+    """生成结果JSON和大尺寸结果图片"""
+    from PIL import Image
+
+    json_dir = root / "data" / "detected_result_json_files"
+    images_dir = root / "data" / "detected_result_images"
+    json_dir.mkdir(parents=True)
+    images_dir.mkdir(parents=True)
+    (root / "logs").mkdir()
+    (root / "logs" / "monitor.log").write_text("定时任务结束\n", encoding="utf-8")
+    base = 1_700_000_000
+    for i in range(tasks):
+        timestamp_str = time.strftime("%Y%m%d_%H%M%S", time.localtime(base + i * 60))
+        data = {"异常区域检测": {"数量": i}, "地物分类": {"forest": i % 7}, "水体自动提取": {}}
+        (json_dir / f"detect_result_{timestamp_str}.json").write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    for i in range(images):
+        Image.effect_noise((4000, 3000), 64).convert("RGB").save(images_dir / f"result_big_{i}.png")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run_load(duration, slow_concurrency):
+    """在慢请求持续压测的同时测量廉价请求延迟和事件循环延迟"""
+    import httpx
+    import monitor_web
+
+    lags = []
+    cheap_ms = []
+    stop = asyncio.Event()
+
+    async def probe():
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            expected = loop.time() + 0.01
+            await asyncio.sleep(0.01)
+            lags.append(max(0.0, loop.time() - expected) * 1000)
+
+    transport = httpx.ASGITransport(app=monitor_web.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        images = [p.name for p in monitor_web.DETECTED_IMAGES_DIR.iterdir()]
+
+        async def slow_worker(worker_id):
+            i = worker_id
+            while not stop.is_set():
+                if i % 2 == 0:
+                    monitor_web.clear_cache()
+                    await client.get("/api/tasks/history")
+                else:
+                    # 每次清空缩略图缓存，模拟未命中
+                    monitor_web.thumbnail_cache._entries.clear()
+                    await client.get(f"/api/images/{images[i % len(images)]}/thumbnail")
+                i += 1
+
+        async def cheap_worker():
+            await client.get("/api/tasks/current")
+            while not stop.is_set():
+                start = time.perf_counter()
+                await client.get("/api/tasks/current")
+                cheap_ms.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.01)
+
+        tasks = [asyncio.create_task(probe()), asyncio.create_task(cheap_worker())]
+        tasks += [asyncio.create_task(slow_worker(i)) for i in range(slow_concurrency)]
+        await asyncio.sleep(duration)
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {
+        "loop_lag_p50_ms": round(percentile(lags, 0.5), 2),
+        "loop_lag_p99_ms": round(percentile(lags, 0.99), 2),
+        "loop_lag_max_ms": round(max(lags), 2),
+        "cheap_requests": len(cheap_ms),
+        "cheap_p50_ms": round(statistics.median(cheap_ms), 2) if cheap_ms else None,
+        "cheap_p99_ms": round(percentile(cheap_ms, 0.99), 2) if cheap_ms else None,
+    }
+
+
+def run_mode(args):
+    """子进程入口: 在数据目录中导入monitor_web并压测"""
+    os.chdir(args.root)
+    sys.path.insert(0, str(PACKAGE_DIR))
+    result = asyncio.run(run_load(args.duration, args.slow_concurrency))
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="事件循环延迟基准测试")
+    parser.add_argument("--tasks", type=int, default=5000, help="结果JSON数量")
+    parser.add_argument("--images", type=int, default=4, help="4000x3000结果图片数量")
+    parser.add_argument("--duration", type=float, default=10.0, help="每种模式压测秒数")
+    parser.add_argument("--slow-concurrency", type=int, default=4, help="并发慢请求数")
+    parser.add_argument("--mode", choices=["inline", "pool"], help=argparse.SUPPRESS)
+    parser.add_argument("--root", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args)
+        return
+
+    root = Path(tempfile.mkdtemp(prefix="bench_loop_lag_"))
+    try:
+        print(f"生成测试数据: {args.tasks} 个结果JSON, {args.images} 张大图 ...")
+        make_dataset(root, args.tasks, args.images)
+        results = {}
+        for mode in ("inline", "pool"):
+            env = dict(os.environ, MONITOR_WATCH="0", MONITOR_WORKERS_INLINE="1" if mode == "inline" else "0")
+            for name in ("result_index.db", "thumbnail_cache"):
+                target = root / "data" / name
+                if target.is_dir():
+                    shutil.rmtree(target)
+                elif target.exists():
+                    target.unlink()
+            output = subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--root", str(root),
+                 "--duration", str(args.duration), "--slow-concurrency", str(args.slow_concurrency)],
+                env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            results[mode] = json.loads(output.strip().splitlines()[-1])
+
+        print("=" * 72)
+        print(f"{'指标':<20} {'事件循环内执行':>18} {'工作池执行':>18}")
+        print("=" * 72)
+        for key in results["inline"]:
+            print(f"{key:<20} {str(results['inline'][key]):>18} {str(results['pool'][key]):>18}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
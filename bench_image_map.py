@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+图片-任务关联基准测试 - 对比逐任务glob与单次scandir映射的耗时
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from monitor.image_map import ImageTimestampMap
+
+IMAGE_EXTENSIONS = ["*.png", "*.jpg", "*.jpeg", "*.tif"]
+
+
+def make_dataset(root, count):
+    """生成count个任务时间戳，每个任务对应一张结果图片"""
+    images_dir = root / "detected_result_images"
+    images_dir.mkdir(parents=True)
+    timestamps = []
+    base = 1_700_000_000
+    for i in range(count):
+        timestamp_str = time.strftime("%Y%m%d_%H%M%S", time.localtime(base + i * 60))
+        timestamps.append(timestamp_str)
+        (images_dir / f"result_{timestamp_str}.png").touch()
+    return images_dir, timestamps
+
+
+def glob_per_task(images_dir, timestamps):
+    """原实现: 每个任务对目录做4次glob"""
+    for timestamp_str in timestamps:
+        for img_ext in IMAGE_EXTENSIONS:
+            list(images_dir.glob(f"*{timestamp_str}*{img_ext[1:]}"))
+
+
+def map_lookup(images_dir, timestamps):
+    """新实现: 单次scandir建立映射后逐任务查表"""
+    image_map = ImageTimestampMap(images_dir)
+    image_map.rebuild()
+    for timestamp_str in timestamps:
+        image_map.get(timestamp_str)
+
+
+def run(count, sample):
+    """在count个文件规模下测试，glob方式按sample个任务抽样后外推"""
+    root = Path(tempfile.mkdtemp(prefix="bench_image_map_"))
+    try:
+        images_dir, timestamps = make_dataset(root, count)
+
+        start = time.perf_counter()
+        glob_per_task(images_dir, timestamps[:sample])
+        glob_sample = time.perf_counter() - start
+        glob_total = glob_sample / min(sample, count) * count
+
+        start = time.perf_counter()
+        map_lookup(images_dir, timestamps)
+        map_total = time.perf_counter() - start
+
+        return {
+            "files": count,
+            "glob_s": glob_total,
+            "map_s": map_total,
+            "speedup": glob_total / map_total if map_total else float("inf"),
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片-任务关联基准测试")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="文件数量，逗号分隔")
+    parser.add_argument("--sample", type=int, default=50, help="glob方式抽样的任务数")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("图片-任务关联基准测试 (任务数 = 图片数)")
+    print("=" * 60)
+    print(f"{'文件数':>10} {'逐任务glob(外推)':>18} {'scandir映射':>14} {'加速比':>10}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        result = run(size, args.sample)
+        print(f"{result['files']:>10} {result['glob_s']:>17.2f}s {result['map_s']:>13.3f}s {result['speedup']:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
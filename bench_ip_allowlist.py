@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+IP白名单中间件基准测试 - 对比原 BaseHTTPMiddleware 实现(列表线性查找)与纯ASGI前缀树实现的单请求开销
+
+直接以ASGI调用应用(不经过网络和HTTP客户端)，测量无中间件、旧中间件、新中间件三种情况下的平均耗时，
+中间件开销 = 有中间件的耗时 - 无中间件的耗时。同时测量流式响应和白名单规模的影响。
+
+示例:
+    python bench_ip_allowlist.py --requests 20000 --allowed 10,1000
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(PACKAGE_DIR))
+
+from utils.ip_allowlist import IPAllowList, IPAllowListMiddleware  # noqa: E402
+
+CLIENT_IP = "10.20.30.40"
+
+
+class LegacyIPAuthMiddleware(BaseHTTPMiddleware):
+    """main.py 中原来的实现"""
+
+    def __init__(self, app, allowed_ips):
+        super().__init__(app)
+        self.allowed_ips = allowed_ips
+
+    async def dispatch(self, request: Request, call_next):
+        client_ip = request.client.host
+        if client_ip not in self.allowed_ips:
+            return JSONResponse(
+                status_code=403,
+                content={"detail": f"IP {client_ip} not allowed."}
+            )
+        return await call_next(request)
+
+
+def make_allowed(count):
+    """生成count个单独的IP，客户端IP排在最后(线性查找的最坏情况)"""
+    base = int(ipaddress.ip_address("192.168.0.1"))
+    return [str(ipaddress.ip_address(base + i)) for i in range(count - 1)] + [CLIENT_IP]
+
+
+def make_app(middleware=None, **options):
+    app = FastAPI()
+
+    @app.get("/plain")
+    async def plain():
+        return PlainTextResponse("ok")
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for _ in range(64):
+                yield b"x" * 1024
+        return StreamingResponse(chunks())
+
+    if middleware is not None:
+        app.add_middleware(middleware, **options)
+    return app
+
+
+async def call(app, path, client):
+    """以ASGI直接调用一次应用，返回状态码"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": [], "client": (client, 50000), "server": ("bench", 80),
+    }
+    disconnected = asyncio.Event()
+    sent = False
+    status = None
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    disconnected.set()
+    return status
+
+
+async def measure(app, path, requests, client=CLIENT_IP, rounds=5):
+    """多轮测量取每轮平均耗时的中位数(微秒/请求)"""
+    for _ in range(min(requests, 500)):
+        await call(app, path, client)
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(requests):
+            await call(app, path, client)
+        samples.append((time.perf_counter() - start) / requests * 1e6)
+    status = await call(app, path, client)
+    return statistics.median(samples), status
+
+
+def bench_lookup(allowed, lookups):
+    """只比较地址判断本身: 列表线性查找与前缀树(不使用结果缓存)"""
+    allow_list = IPAllowList(allowed)
+    start = time.perf_counter()
+    for _ in range(lookups):
+        CLIENT_IP in allowed
+    linear = (time.perf_counter() - start) / lookups * 1e9
+    start = time.perf_counter()
+    for _ in range(lookups):
+        CLIENT_IP in allow_list
+    trie = (time.perf_counter() - start) / lookups * 1e9
+    return linear, trie
+
+
+async def run(requests, sizes, lookups):
+    for path in ("/plain", "/stream"):
+        baseline, _ = await measure(make_app(), path, requests)
+        print(f"\n{path}  无中间件: {baseline:8.1f} us/请求")
+        for size in sizes:
+            allowed = make_allowed(size)
+            legacy, legacy_status = await measure(make_app(LegacyIPAuthMiddleware, allowed_ips=allowed), path, requests)
+            asgi, asgi_status = await measure(make_app(IPAllowListMiddleware, allowed_ips=allowed), path, requests)
+            denied, denied_status = await measure(
+                make_app(IPAllowListMiddleware, allowed_ips=allowed), path, requests, client="172.31.0.1"
+            )
+            print(f"  白名单 {size:>6} 条  BaseHTTPMiddleware: {legacy:8.1f} us (+{legacy - baseline:7.1f})  "
+                  f"纯ASGI: {asgi:8.1f} us (+{asgi - baseline:7.1f})  拒绝: {denied:8.1f} us  "
+                  f"状态码 {legacy_status}/{asgi_status}/{denied_status}")
+
+    print(f"\n地址判断 ({lookups} 次，客户端IP在列表末尾)")
+    for size in sizes:
+        linear, trie = bench_lookup(make_allowed(size), lookups)
+        print(f"  白名单 {size:>6} 条  列表查找: {linear:9.1f} ns  前缀树: {trie:9.1f} ns")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IP白名单中间件基准测试")
+    parser.add_argument("--requests", type=int, default=2000, help="每轮请求数")
+    parser.add_argument("--allowed", default="1,100,10000", help="白名单条目数，逗号分隔")
+    parser.add_argument("--lookups", type=int, default=100000, help="地址判断次数")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.allowed.split(",")]
+    asyncio.run(run(args.requests, sizes, args.lookups))
+
+
+if __name__ == "__main__":
+    main()
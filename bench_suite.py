@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+基准测试套件 - 生成指定规模的模拟结果目录和日志，在进程内驱动监控服务，
+按并发级别统计各接口的 p50/p95/p99 延迟和吞吐量，结果保存为JSON，可与基线对比检查性能回退
+
+示例:
+    python bench_suite.py --results 10000 --log-mb 256 --output bench_results.json
+    python bench_suite.py --results 10000 --log-mb 256 --baseline bench_results.json --threshold 0.2
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+
+DETECTIONS = ["异常区域检测", "重点水利设施检测", "地物分类", "水体自动提取"]
+DEFAULT_ENDPOINTS = [
+    "/api/tasks/current",
+    "/api/tasks/history?limit=50",
+    "/api/tasks/{task_id}",
+    "/api/stats",
+    "/api/logs?limit=100",
+    "/api/images?limit=100",
+    "/api/json-files?limit=100",
+]
+
+
+def make_png():
+    """生成一张小尺寸PNG，所有结果图片共用同一份内容"""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), (40, 120, 200)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def generate_dataset(root, results, log_mb, base=1_700_000_000):
+    """生成 data/detected_result_json_files、data/detected_result_images 和 logs 目录
+
+    每个结果JSON对应一张同时间戳的结果图片，日志文件写到 log_mb MB，最后一行为任务结束标记。
+    """
+    json_dir = root / "data" / "detected_result_json_files"
+    images_dir = root / "data" / "detected_result_images"
+    logs_dir = root / "logs"
+    for directory in (json_dir, images_dir, logs_dir):
+        directory.mkdir(parents=True, exist_ok=True)
+
+    png = make_png()
+    for i in range(results):
+        timestamp = base + i * 60
+        timestamp_str = time.strftime("%Y%m%d_%H%M%S", time.localtime(timestamp))
+        data = {
+            name: {"数量": (i + j) % 17, "面积": round(i * 1.37, 2), "类别": {"forest": i % 7, "water": i % 5}}
+            for j, name in enumerate(DETECTIONS)
+        }
+        data["最终检测结果路径"] = str(images_dir / f"result_{timestamp_str}.png")
+        json_path = json_dir / f"detect_result_{timestamp_str}.json"
+        json_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        (images_dir / f"result_{timestamp_str}.png").write_bytes(png)
+        os.utime(json_path, (timestamp, timestamp))
+
+    # 按1MB的块写日志，GB级日志也只需几秒
+    line = "2024-01-01 00:00:00,000 - INFO - 处理影像分块 {:08d} 完成，检测到 3 个目标\n"
+    chunk = "".join(line.format(i) for i in range(12000)).encode("utf-8")
+    chunk = chunk[:chunk.rfind(b"\n", 0, 1024 * 1024) + 1]
+    with open(logs_dir / "monitor.log", "wb") as f:
+        for _ in range(log_mb):
+            f.write(chunk)
+        f.write("2024-01-01 00:00:00,000 - INFO - 定时任务结束\n".encode("utf-8"))
+
+
+def percentile(sorted_values, q):
+    """最近秩百分位"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+async def measure(client, path, concurrency, requests):
+    """以固定并发发送requests个请求，返回延迟分布和吞吐量(完成请求数/总耗时)"""
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+                ok = response.status_code == 200
+            except Exception:
+                ok = False
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "max_ms": round(latencies[-1], 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+    }
+
+
+async def run_suite(endpoints, levels, requests, warmup, uncached):
+    """启动应用(含startup/shutdown事件)，依次压测每个接口和并发级别"""
+    import httpx
+    import monitor_web
+
+    if uncached:
+        # 接口缓存立即过期，测量每次都重新计算的开销(并发请求仍会合并计算)
+        monitor_web.CACHE_DURATION = 0
+        monitor_web.CACHE_TTLS = {}
+
+    results = []
+    await monitor_web.app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=monitor_web.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            task_id = None
+            for endpoint in endpoints:
+                if "{task_id}" in endpoint:
+                    if task_id is None:
+                        history = (await client.get("/api/tasks/history?limit=1")).json()
+                        task_id = history["tasks"][0]["id"] if history.get("tasks") else "missing"
+                    path = endpoint.replace("{task_id}", task_id)
+                else:
+                    path = endpoint
+                # 首次请求包含建立索引等冷启动开销，单独记录
+                start = time.perf_counter()
+                response = await client.get(path)
+                cold_ms = round((time.perf_counter() - start) * 1000, 3)
+                for _ in range(warmup):
+                    await client.get(path)
+                for concurrency in levels:
+                    row = await measure(client, path, concurrency, requests)
+                    row.update(endpoint=endpoint, concurrency=concurrency, cold_ms=cold_ms, status=response.status_code)
+                    results.append(row)
+                    print(f"{endpoint:<32} c={concurrency:<4} p50 {row['p50_ms']:>9.2f}ms  p95 {row['p95_ms']:>9.2f}ms  "
+                          f"p99 {row['p99_ms']:>9.2f}ms  {row['throughput_rps']:>9.1f} req/s  错误 {row['errors']}")
+    finally:
+        await monitor_web.app.router.shutdown()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """与基线对比: p95延迟升高或吞吐量下降超过threshold比例视为回退，返回回退列表"""
+    previous = {(row["endpoint"], row["concurrency"]): row for row in baseline["results"]}
+    regressions = []
+    for row in results:
+        base = previous.get((row["endpoint"], row["concurrency"]))
+        if base is None:
+            continue
+        if row["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            regressions.append((row["endpoint"], row["concurrency"], "p95_ms", base["p95_ms"], row["p95_ms"]))
+        if row["throughput_rps"] < base["throughput_rps"] * (1 - threshold):
+            regressions.append(
+                (row["endpoint"], row["concurrency"], "throughput_rps", base["throughput_rps"], row["throughput_rps"])
+            )
+        if row["errors"] > base["errors"]:
+            regressions.append((row["endpoint"], row["concurrency"], "errors", base["errors"], row["errors"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="监控服务基准测试套件")
+    parser.add_argument("--results", type=int, default=1000, help="结果JSON数量(同时生成同等数量的结果图片)")
+    parser.add_argument("--log-mb", type=int, default=64, help="日志文件大小(MB)")
+    parser.add_argument("--root", help="数据目录，已存在时直接复用(不重新生成)，默认使用临时目录")
+    parser.add_argument("--concurrency", default="1,8,32", help="并发级别，逗号分隔")
+    parser.add_argument("--requests", type=int, default=500, help="每个接口每个并发级别的请求数")
+    parser.add_argument("--warmup", type=int, default=20, help="预热请求数")
+    parser.add_argument("--endpoints", nargs="+", default=DEFAULT_ENDPOINTS, help="压测的接口")
+    parser.add_argument("--uncached", action="store_true", help="关闭接口缓存，测量每次重新计算的延迟")
+    parser.add_argument("--output", default="bench_results.json", help="结果JSON路径")
+    parser.add_argument("--baseline", help="基线结果JSON，存在回退时以状态码1退出")
+    parser.add_argument("--threshold", type=float, default=0.2, help="允许的回退比例")
+    args = parser.parse_args()
+
+    output = Path(args.output).resolve()
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8")) if args.baseline else None
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    temporary = args.root is None
+    root = Path(args.root).resolve() if args.root else Path(tempfile.mkdtemp(prefix="bench_suite_"))
+    if temporary or not (root / "data" / "detected_result_json_files").exists():
+        print(f"生成测试数据: {args.results} 个结果JSON和图片, {args.log_mb}MB 日志 -> {root}")
+        start = time.perf_counter()
+        generate_dataset(root, args.results, args.log_mb)
+        print(f"数据生成耗时 {time.perf_counter() - start:.1f}s")
+
+    cwd = os.getcwd()
+    os.chdir(root)
+    os.environ["MONITOR_WATCH"] = "0"
+    sys.path.insert(0, str(PACKAGE_DIR))
+    try:
+        print("=" * 100)
+        results = asyncio.run(run_suite(args.endpoints, levels, args.requests, args.warmup, args.uncached))
+    finally:
+        os.chdir(cwd)
+        if temporary:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "results": args.results,
+            "log_mb": args.log_mb,
+            "requests": args.requests,
+            "uncached": args.uncached,
+        },
+        "results": results,
+    }
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n结果已保存到 {output}")
+
+    if baseline is not None:
+        for key in ("results", "log_mb", "uncached"):
+            if baseline["meta"].get(key) != report["meta"][key]:
+                print(f"警告: 基线的 {key}={baseline['meta'].get(key)} 与本次 {report['meta'][key]} 不一致")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n性能回退 (阈值 {args.threshold:.0%}):")
+            for endpoint, concurrency, metric, before, after in regressions:
+                print(f"  {endpoint} c={concurrency} {metric}: {before} -> {after}")
+            sys.exit(1)
+        print(f"\n与基线相比无超过 {args.threshold:.0%} 的回退")
+
+
+if __name__ == "__main__":
+    main()
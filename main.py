@@ -1,9 +1,10 @@
-from fastapi import FastAPI, Request
+import asyncio
+from fastapi import Depends, FastAPI
 from utils.config_loader import load_config
 from utils.model_loader import load_models
 from routers import detection_router    
-from starlette.middleware.base import BaseHTTPMiddleware
-from fastapi.responses import JSONResponse
+from utils.ip_allowlist import IPAllowListMiddleware
+from utils.model_registry import ModelNotReady, ModelRegistry, model_not_ready_handler, ready_response, require_loaded
 import uvicorn
 from utils.log_config import setup_logging
 
@@ -11,35 +12,63 @@ setup_logging()  # 日志初始化，必须在其它import之前
 import logging
 logger = logging.getLogger(__name__)
 
-class IPAuthMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, allowed_ips):
-        super().__init__(app)
-        self.allowed_ips = allowed_ips
-
-    async def dispatch(self, request: Request, call_next):
-        client_ip = request.client.host
-        if client_ip not in self.allowed_ips:
-            return JSONResponse(
-                status_code=403,
-                content={"detail": f"IP {client_ip} not allowed."}
-            )
-        return await call_next(request)
-
 app = FastAPI()
 
 # 先加载一次config用于中间件
 config = load_config()
 allowed_ips = config.get("allowed_ips", [])
-app.add_middleware(IPAuthMiddleware, allowed_ips=allowed_ips)
+# 白名单支持CIDR网段，修改配置后无需重启，每隔reload_interval秒重新读取
+app.add_middleware(
+    IPAllowListMiddleware,
+    allowed_ips=allowed_ips,
+    loader=lambda: load_config().get("allowed_ips", []),
+    reload_interval=config.get("allowed_ips_reload_interval", 5),
+)
+
+def load_model(name, model_config):
+    """用load_models只加载单个模型；在独立线程的事件循环中执行，多个模型可以并行加载"""
+    models = asyncio.run(load_models({**config, "models": {name: model_config}}))
+    if name in models:
+        return models[name]
+    if len(models) == 1:
+        return next(iter(models.values()))
+    raise ValueError(f"load_models 没有返回模型 {name}，返回了: {list(models)}")
+
+def load_all_models():
+    """按原有方式用load_models一次加载配置中的全部模型"""
+    return asyncio.run(load_models(config))
 
 # Load configuration and models on startup
+# 模型在后台加载，不阻塞服务启动。config 中有 models 段 ({名称: 模型配置}) 时各模型并行加载，
+# lazy: true 的模型在第一次被请求时才加载；没有 models 段时由 load_models(config) 在后台一次加载全部模型。
+# 检测路由先等待启动时开始加载的模型加载结束(超时返回503)；Depends(require_model(name)) 和同步路由中的
+# app.state.models[name] 也会等待未就绪的模型(如lazy模型)，加载失败返回503
+app.add_exception_handler(ModelNotReady, model_not_ready_handler)
+
 @app.on_event("startup")
 async def startup_event():  
     app.state.config = config
-    app.state.models = await load_models(app.state.config)
+    wait_timeout = config.get("model_wait_timeout", 120)
+    if config.get("models"):
+        app.state.model_registry = ModelRegistry(
+            config["models"],
+            load_model,
+            concurrency=config.get("model_load_concurrency", 4),
+            wait_timeout=wait_timeout,
+        )
+    else:
+        app.state.model_registry = ModelRegistry.all_at_once(load_all_models, wait_timeout=wait_timeout)
+    # 加载完成的模型陆续放入 app.state.models
+    app.state.models = app.state.model_registry.mapping()
+    app.state.model_registry.start()
+
+@app.get("/ready")
+async def ready():
+    """就绪检查: 各模型的加载状态和耗时，所有非lazy模型就绪前返回503"""
+    return ready_response(app.state.model_registry)
 
 # Include routers for different functionalities
-app.include_router(detection_router.router, prefix="/detect", tags=["Detection"])
+app.include_router(detection_router.router, prefix="/detect", tags=["Detection"], dependencies=[Depends(require_loaded())])
 
 if __name__ == "__main__":
     uvicorn.run("main:app",host="0.0.0.0", port=8085, reload=True)
\ No newline at end of file
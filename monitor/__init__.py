@@ -0,0 +1 @@
+"""监控系统内部组件"""
@@ -0,0 +1,305 @@
+"""批量检测 - 解压上传的压缩包，每景影像提交一个检测任务，按批次汇总进度"""
+
+import hashlib
+import json
+import logging
+import os
+import tarfile
+import threading
+import time
+import uuid
+import zipfile
+from datetime import datetime
+from pathlib import PurePosixPath
+
+from monitor.uploads import unique_upload_path
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".tif", ".tiff", ".jpg", ".jpeg", ".png")
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class BatchTooLarge(ValueError):
+    """批次超过影像数、条目数或解压大小上限"""
+
+
+class BatchCancelled(Exception):
+    """批次创建失败或客户端断开，停止解压"""
+
+
+def is_archive(filename):
+    """是否为支持的压缩包"""
+    name = (filename or "").lower()
+    return name.endswith(".zip") or name.endswith(TAR_SUFFIXES)
+
+
+def _is_scene(member_name):
+    """压缩包内的条目是否为待检测影像，跳过隐藏文件和macOS元数据"""
+    parts = PurePosixPath(member_name.replace("\\", "/")).parts
+    if not parts or any(part.startswith(".") or part == "__MACOSX" for part in parts):
+        return False
+    return parts[-1].lower().endswith(IMAGE_EXTENSIONS)
+
+
+class ExtractBudget:
+    """一个批次的解压预算，防止压缩炸弹写满上传目录
+
+    限制单个文件的解压大小、所有文件的解压总大小和压缩包条目数(含非影像条目)；
+    条目声明的大小在解压前检查，实际写入的字节数在写入时检查。
+    """
+
+    def __init__(self, max_member_bytes, max_total_bytes, max_members):
+        self.max_member_bytes = max_member_bytes
+        self.max_total_bytes = max_total_bytes
+        self.max_members = max_members
+        self.members = 0
+        self.total_bytes = 0
+
+    def add_members(self, count=1):
+        """计入压缩包条目"""
+        self.members += count
+        if self.members > self.max_members:
+            raise BatchTooLarge(f"压缩包条目数超过上限 {self.max_members}")
+
+    def check_size(self, name, size):
+        """解压前按声明的大小检查"""
+        if size > self.max_member_bytes:
+            raise BatchTooLarge(f"{name} 解压后 {size} 字节，超过单个文件上限 {self.max_member_bytes} 字节")
+        if self.total_bytes + size > self.max_total_bytes:
+            raise BatchTooLarge(f"批次解压总大小超过上限 {self.max_total_bytes} 字节")
+
+    def consume(self, name, written, size):
+        """写入size字节前检查，written为写入后该文件的总字节数"""
+        if written > self.max_member_bytes:
+            raise BatchTooLarge(f"{name} 解压后超过单个文件上限 {self.max_member_bytes} 字节")
+        if self.total_bytes + size > self.max_total_bytes:
+            raise BatchTooLarge(f"批次解压总大小超过上限 {self.max_total_bytes} 字节")
+        self.total_bytes += size
+
+    def release(self, size):
+        """写入失败的文件已删除，归还其占用的预算"""
+        self.total_bytes -= size
+
+
+def save_stream(src, upload_dir, original_filename, budget=None):
+    """把数据流写入上传目录，同时计算SHA-256，返回 (文件路径, sha256)
+
+    超出解压预算时删除已写入的部分并抛出BatchTooLarge。
+    """
+    hasher = hashlib.sha256()
+    image_path = unique_upload_path(upload_dir, original_filename)
+    tmp_path = image_path.with_name(image_path.name + ".part")
+    accepted = 0
+    try:
+        with open(tmp_path, "wb") as dest:
+            while True:
+                data = src.read(COPY_CHUNK_SIZE)
+                if not data:
+                    break
+                if budget is not None:
+                    budget.consume(original_filename, accepted + len(data), len(data))
+                accepted += len(data)
+                hasher.update(data)
+                dest.write(data)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        if budget is not None:
+            budget.release(accepted)
+        raise
+    os.replace(tmp_path, image_path)
+    return image_path, hasher.hexdigest()
+
+
+def extract_archive(fileobj, filename, upload_dir, max_items, on_scene, budget=None):
+    """逐个解压压缩包中的影像到上传目录
+
+    TAR按流式模式(r|*)顺序读取，ZIP按中央目录逐个读取；只取文件名部分，
+    不会写出上传目录。每解压出一景调用 on_scene(原始文件名, 文件路径, sha256)。
+    budget(ExtractBudget)限制条目数和解压大小，超出时抛出BatchTooLarge，
+    已解压并提交的影像保留。
+    """
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    count = 0
+
+    def accept(name):
+        nonlocal count
+        count += 1
+        if count > max_items:
+            raise BatchTooLarge(f"批次影像数超过上限 {max_items}")
+        return PurePosixPath(name.replace("\\", "/")).name
+
+    fileobj.seek(0)
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(fileobj) as zf:
+            infos = zf.infolist()
+            if budget is not None:
+                budget.add_members(len(infos))
+            for info in infos:
+                if info.is_dir() or not _is_scene(info.filename):
+                    continue
+                original_name = accept(info.filename)
+                if budget is not None:
+                    budget.check_size(original_name, info.file_size)
+                with zf.open(info) as src:
+                    image_path, sha256 = save_stream(src, upload_dir, original_name, budget)
+                on_scene(original_name, image_path, sha256)
+    else:
+        with tarfile.open(fileobj=fileobj, mode="r|*") as tf:
+            for member in tf:
+                if budget is not None:
+                    budget.add_members()
+                if not member.isfile() or not _is_scene(member.name):
+                    continue
+                original_name = accept(member.name)
+                if budget is not None:
+                    budget.check_size(original_name, member.size)
+                src = tf.extractfile(member)
+                image_path, sha256 = save_stream(src, upload_dir, original_name, budget)
+                on_scene(original_name, image_path, sha256)
+    return count
+
+
+class BatchStore:
+    """批次记录，保存在 batches_dir/{batch_id}.json
+
+    每个条目记录原始文件名、上传文件名、sha256，以及对应的检测任务ID
+    或命中缓存时的检测结果；条目状态从任务队列实时获取。
+    """
+
+    def __init__(self, batches_dir):
+        self.batches_dir = batches_dir
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    def create(self, params):
+        """创建空批次"""
+        batch = {
+            "id": uuid.uuid4().hex,
+            "created_at": datetime.now().isoformat(),
+            "started": time.time(),
+            "params": params,
+            "items": [],
+        }
+        with self._lock:
+            self._batches[batch["id"]] = batch
+        return batch
+
+    def add_item(self, batch, item):
+        """追加批次条目"""
+        with self._lock:
+            batch["items"].append(item)
+
+    def save(self, batch):
+        """持久化批次记录"""
+        self.batches_dir.mkdir(parents=True, exist_ok=True)
+        path = self.batches_dir / f"{batch['id']}.json"
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with self._lock:
+            data = json.dumps(batch, ensure_ascii=False)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, batch_id):
+        """获取批次记录，内存中没有时从磁盘读取"""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+        if batch is not None:
+            return batch
+        path = self.batches_dir / f"{batch_id}.json"
+        if not path.is_file():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            batch = json.load(f)
+        with self._lock:
+            return self._batches.setdefault(batch_id, batch)
+
+    def discard(self, batch):
+        """创建失败时删除批次"""
+        with self._lock:
+            self._batches.pop(batch["id"], None)
+        try:
+            os.remove(self.batches_dir / f"{batch['id']}.json")
+        except FileNotFoundError:
+            pass
+
+
+def item_state(item, get_job):
+    """合并批次条目和任务状态"""
+    state = {
+        "original_filename": item["original_filename"],
+        "uploaded_file": item["uploaded_file"],
+        "sha256": item["sha256"],
+        "job_id": item.get("job_id"),
+        "cached": item.get("cached", False),
+    }
+    if item.get("result") is not None:
+        state.update(status="done", result=item["result"], run_ms=0.0, error=None, finished_at=None)
+        return state
+    job = get_job(item["job_id"]) if item.get("job_id") else None
+    if job is None:
+        state.update(status="unknown", result=None, run_ms=None, error="任务记录不存在", finished_at=None)
+    else:
+        state.update(
+            status=job["status"], result=job["result"], run_ms=job["run_ms"], error=job["error"],
+            finished_at=job["finished_at"]
+        )
+    return state
+
+
+def batch_status(batch, get_job, include_results=False):
+    """批次进度和吞吐量"""
+    items = [item_state(item, get_job) for item in batch["items"]]
+    counts = {}
+    for item in items:
+        counts[item["status"]] = counts.get(item["status"], 0) + 1
+    finished = counts.get("done", 0) + counts.get("failed", 0)
+    complete = finished == len(items)
+    cached = sum(1 for item in items if item["cached"])
+    finished_times = [datetime.fromisoformat(item["finished_at"]).timestamp() for item in items if item["finished_at"]]
+    # 批次完成后按最后一景完成的时间计算耗时
+    end = max(finished_times) if complete and finished_times else time.time()
+    elapsed = max(end - batch["started"], 1e-6)
+    run_ms = [item["run_ms"] for item in items if item["status"] == "done" and item["run_ms"]]
+    if not include_results:
+        for item in items:
+            item.pop("result")
+    return {
+        "batch_id": batch["id"],
+        "created_at": batch["created_at"],
+        "params": batch["params"],
+        "total": len(items),
+        "counts": counts,
+        "finished": finished,
+        "complete": complete,
+        "progress": round(finished / len(items), 4) if items else 1.0,
+        "cached": cached,
+        "elapsed_seconds": round(elapsed, 1),
+        # 命中缓存的影像没有经过推理，不计入吞吐量
+        "throughput_per_minute": round((finished - cached) / elapsed * 60, 2),
+        "avg_run_ms": round(sum(run_ms) / len(run_ms), 1) if run_ms else None,
+        "items": items,
+    }
+
+
+def batch_archive_entries(status, images_dir):
+    """批次结果压缩包的条目: 汇总清单、每景的检测结果JSON和结果图片"""
+    manifest = {key: value for key, value in status.items() if key != "items"}
+    manifest["items"] = []
+    for index, item in enumerate(status["items"], 1):
+        result = item.get("result")
+        folder = f"{index:04d}_{os.path.splitext(item['original_filename'])[0]}"
+        entry = {key: value for key, value in item.items() if key != "result"}
+        entry["folder"] = folder
+        manifest["items"].append(entry)
+        if item["status"] != "done" or not result:
+            continue
+        yield f"{folder}/result.json", json.dumps(result.get("result_json"), ensure_ascii=False, indent=2).encode("utf-8")
+        for filename in result.get("result_images", []):
+            yield f"{folder}/{filename}", images_dir / filename
+    yield "manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8")
@@ -0,0 +1,393 @@
+"""接口缓存后端 - 进程内字典、SQLite(WAL)共享缓存、可选Redis，多个工作进程共享缓存和失效"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 1000
+ACCESS_RESOLUTION = 1.0  # SQLite后端记录最近访问时间的精度(秒)，避免轮询时每次读取都写库
+
+
+class MemoryCacheBackend:
+    """进程内缓存，仅适用于单个工作进程"""
+
+    name = "memory"
+    shared = False
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # 键 -> (写入时间, 值, 是否已失效)
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, max_age=None):
+        """读取缓存，超过max_age秒视为未命中"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            created, value, stale = entry
+            if stale or (max_age is not None and time.time() - created >= max_age):
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def get_entry(self, key):
+        """读取缓存条目(包括已过期和已失效的)，返回 (值, 写入时间, 是否已失效)，不存在返回None"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            created, value, stale = entry
+            return value, created, stale
+
+    def set(self, key, value):
+        """写入缓存"""
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.time(), value, False)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def touch(self, key):
+        """数据来源未变化时延长条目有效期，条目不存在或已失效返回False"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[2]:
+                return False
+            self._data[key] = (time.time(), entry[1], False)
+            return True
+
+    def delete(self, key):
+        """删除单个键"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefixes(self, *prefixes):
+        """按键前缀删除"""
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefixes)]:
+                del self._data[key]
+
+    def expire_prefixes(self, *prefixes):
+        """按键前缀标记失效，保留旧值供重建期间读取"""
+        with self._lock:
+            for key, (created, value, _) in list(self._data.items()):
+                if key.startswith(prefixes):
+                    self._data[key] = (created, value, True)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def try_lock(self, name, ttl):
+        """获取计算锁，成功返回令牌，已被持有返回None"""
+        now = time.time()
+        with self._lock:
+            holder = self._locks.get(name)
+            if holder is not None and holder[1] > now:
+                return None
+            token = uuid.uuid4().hex
+            self._locks[name] = (token, now + ttl)
+            return token
+
+    def unlock(self, name, token):
+        """释放计算锁"""
+        with self._lock:
+            holder = self._locks.get(name)
+            if holder is not None and holder[0] == token:
+                del self._locks[name]
+
+    def trim(self):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.name, "entries": len(self._data), "max_entries": self.max_entries}
+
+    def close(self):
+        pass
+
+
+class SQLiteCacheBackend:
+    """SQLite(WAL)共享缓存，同一台机器上的所有工作进程读写同一个数据库文件
+
+    按最近访问时间(accessed)做LRU，写入新条目后超出上限时立即淘汰最久未访问的条目。
+    """
+
+    name = "sqlite"
+    shared = True
+
+    def __init__(self, db_path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                stale INTEGER NOT NULL DEFAULT 0,
+                accessed REAL NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS locks (
+                name TEXT PRIMARY KEY,
+                token TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+        """)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(cache)")}
+        # 旧版本创建的数据库
+        if "stale" not in columns:
+            conn.execute("ALTER TABLE cache ADD COLUMN stale INTEGER NOT NULL DEFAULT 0")
+        if "accessed" not in columns:
+            conn.execute("ALTER TABLE cache ADD COLUMN accessed REAL NOT NULL DEFAULT 0")
+            conn.execute("UPDATE cache SET accessed = created")
+        conn.execute("DROP INDEX IF EXISTS idx_cache_created")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed)")
+
+    def _conn(self):
+        """每个线程一个连接，autocommit模式"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _read(self, key):
+        """读取条目并更新最近访问时间"""
+        conn = self._conn()
+        row = conn.execute("SELECT value, created, stale, accessed FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            now = time.time()
+            if now - row[3] >= ACCESS_RESOLUTION:
+                conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return row
+
+    def get(self, key, max_age=None):
+        row = self._read(key)
+        if row is None or row[2]:
+            return None
+        if max_age is not None and time.time() - row[1] >= max_age:
+            return None
+        return json.loads(row[0])
+
+    def get_entry(self, key):
+        row = self._read(key)
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], bool(row[2])
+
+    def set(self, key, value):
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, created, stale, accessed) VALUES (?, ?, ?, 0, ?)",
+            (key, json.dumps(value, ensure_ascii=False, default=str), now, now),
+        )
+        self._evict(conn)
+
+    def touch(self, key):
+        cursor = self._conn().execute(
+            "UPDATE cache SET created = ? WHERE key = ? AND stale = 0", (time.time(), key)
+        )
+        return cursor.rowcount > 0
+
+    def _evict(self, conn):
+        """条目数超过上限时删除最久未访问的条目"""
+        count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def trim(self):
+        """淘汰超出上限的条目(其他进程写入的旧版本可能未淘汰)并清理过期的锁"""
+        conn = self._conn()
+        self._evict(conn)
+        conn.execute("DELETE FROM locks WHERE expires < ?", (time.time(),))
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def delete_prefixes(self, *prefixes):
+        conn = self._conn()
+        for prefix in prefixes:
+            escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conn.execute("DELETE FROM cache WHERE key LIKE ? ESCAPE '\\'", (escaped + "%",))
+
+    def expire_prefixes(self, *prefixes):
+        conn = self._conn()
+        for prefix in prefixes:
+            escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conn.execute("UPDATE cache SET stale = 1 WHERE key LIKE ? ESCAPE '\\'", (escaped + "%",))
+
+    def clear(self):
+        self._conn().execute("DELETE FROM cache")
+
+    def try_lock(self, name, ttl):
+        conn = self._conn()
+        token = uuid.uuid4().hex
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT expires FROM locks WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] > now:
+                return None
+            conn.execute(
+                "INSERT OR REPLACE INTO locks (name, token, expires) VALUES (?, ?, ?)",
+                (name, token, now + ttl),
+            )
+            return token
+        finally:
+            conn.execute("COMMIT")
+
+    def unlock(self, name, token):
+        self._conn().execute("DELETE FROM locks WHERE name = ? AND token = ?", (name, token))
+
+    def stats(self):
+        count = self._conn().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {"backend": self.name, "entries": count, "max_entries": self.max_entries, "path": str(self.db_path)}
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class RedisCacheBackend:
+    """Redis共享缓存，可跨机器共享；url为 fakeredis:// 时使用本地替身(测试用)"""
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url, namespace="monitor", max_age_limit=3600):
+        if url.startswith("fakeredis://"):
+            try:
+                import fakeredis
+            except ImportError:
+                raise RuntimeError("使用fakeredis需要安装可选依赖: pip install -r requirements-optional.txt")
+            self._redis = fakeredis.FakeRedis()
+        else:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("使用Redis缓存后端需要安装可选依赖: pip install -r requirements-optional.txt")
+            self._redis = redis.Redis.from_url(url)
+        self.url = url
+        self.namespace = namespace
+        # 缓存条目的最长保存时间，防止长期不失效的键堆积
+        self.max_age_limit = max_age_limit
+
+    def _key(self, key):
+        return f"{self.namespace}:cache:{key}"
+
+    def get(self, key, max_age=None):
+        raw = self._redis.get(self._key(key))
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        if entry.get("stale") or (max_age is not None and time.time() - entry["created"] >= max_age):
+            return None
+        return entry["value"]
+
+    def get_entry(self, key):
+        raw = self._redis.get(self._key(key))
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        return entry["value"], entry["created"], bool(entry.get("stale"))
+
+    def set(self, key, value):
+        raw = json.dumps({"created": time.time(), "value": value}, ensure_ascii=False, default=str)
+        self._redis.set(self._key(key), raw, ex=self.max_age_limit)
+
+    def _rewrite(self, redis_key, **changes):
+        """修改条目的元数据，保留剩余的过期时间"""
+        raw = self._redis.get(redis_key)
+        if raw is None:
+            return False
+        entry = json.loads(raw)
+        if entry.get("stale") and "created" in changes:
+            return False
+        entry.update(changes)
+        self._redis.set(redis_key, json.dumps(entry, ensure_ascii=False), keepttl=True)
+        return True
+
+    def touch(self, key):
+        return self._rewrite(self._key(key), created=time.time())
+
+    def _delete_matching(self, pattern):
+        batch = []
+        for key in self._redis.scan_iter(match=pattern, count=500):
+            batch.append(key)
+            if len(batch) >= 500:
+                self._redis.delete(*batch)
+                batch = []
+        if batch:
+            self._redis.delete(*batch)
+
+    def delete(self, key):
+        self._redis.delete(self._key(key))
+
+    def delete_prefixes(self, *prefixes):
+        for prefix in prefixes:
+            escaped = "".join("\\" + c if c in "*?[]\\" else c for c in prefix)
+            self._delete_matching(self._key(escaped) + "*")
+
+    def expire_prefixes(self, *prefixes):
+        for prefix in prefixes:
+            escaped = "".join("\\" + c if c in "*?[]\\" else c for c in prefix)
+            for redis_key in self._redis.scan_iter(match=self._key(escaped) + "*", count=500):
+                self._rewrite(redis_key, stale=True)
+
+    def clear(self):
+        self._delete_matching(self._key("*"))
+
+    def trim(self):
+        # 条目由Redis按过期时间清理
+        pass
+
+    def try_lock(self, name, ttl):
+        token = uuid.uuid4().hex
+        if self._redis.set(f"{self.namespace}:lock:{name}", token, nx=True, px=int(ttl * 1000)):
+            return token
+        return None
+
+    def unlock(self, name, token):
+        key = f"{self.namespace}:lock:{name}"
+        current = self._redis.get(key)
+        if current is not None and current.decode() == token:
+            self._redis.delete(key)
+
+    def stats(self):
+        count = sum(1 for _ in self._redis.scan_iter(match=self._key("*"), count=500))
+        return {"backend": self.name, "entries": count, "namespace": self.namespace}
+
+    def close(self):
+        self._redis.close()
+
+
+def create_cache_backend(kind, sqlite_path=None, redis_url=None, max_entries=DEFAULT_MAX_ENTRIES):
+    """按名称创建缓存后端: memory / sqlite / redis"""
+    if kind == "memory":
+        return MemoryCacheBackend(max_entries)
+    if kind == "sqlite":
+        return SQLiteCacheBackend(sqlite_path, max_entries)
+    if kind == "redis":
+        return RedisCacheBackend(redis_url)
+    raise ValueError(f"未知的缓存后端: {kind}")
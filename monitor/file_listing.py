@@ -0,0 +1,228 @@
+"""结果文件列表索引 - 按修改时间/大小/文件名维护有序索引，支持游标分页和过滤"""
+
+import base64
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+
+from monitor.metrics import observe_scan
+
+logger = logging.getLogger(__name__)
+
+SORT_KEYS = ("mtime", "size", "name")
+MAX_NAME = chr(0x10FFFF)
+
+FileInfo = namedtuple("FileInfo", ["name", "path", "size", "mtime", "ctime"])
+
+
+def _sort_value(info, sort):
+    if sort == "name":
+        return info.name
+    return getattr(info, sort)
+
+
+def encode_listing_cursor(sort, value, name):
+    """生成分页游标，包含排序字段以便校验"""
+    raw = json.dumps([sort, value, name], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_listing_cursor(cursor, sort):
+    """解析分页游标，返回有序索引中的键；格式或类型不对时抛出ValueError"""
+    try:
+        cursor_sort, value, name = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError(f"无效的分页游标: {cursor}")
+    if cursor_sort != sort:
+        raise ValueError(f"分页游标的排序字段 {cursor_sort} 与当前排序 {sort} 不一致")
+    # 值的类型必须与排序字段一致，否则与有序列表中的键比较时抛出TypeError
+    value_types = (str,) if sort == "name" else (int, float)
+    if not isinstance(name, str) or isinstance(value, bool) or not isinstance(value, value_types):
+        raise ValueError(f"无效的分页游标: {cursor}")
+    return (value, name)
+
+
+class FileListing:
+    """目录文件的有序索引
+
+    一次 os.scandir 建立索引(每个文件只stat一次)，之后通过 add/remove 随文件事件更新，
+    或在目录mtime变化时重建；每种排序字段维护一个 (值, 文件名) 的有序列表，
+    分页查询从游标位置二分定位，不再对整个目录排序。
+    """
+
+    def __init__(self, directory, extensions):
+        self.directory = directory
+        self.extensions = tuple(extensions)
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._sorted = {sort: [] for sort in SORT_KEYS}
+        self._dir_mtime_ns = None
+        self._built = False
+        # 索引版本，每次变化递增；instance区分不同进程的索引，二者共同组成列表响应的ETag
+        self.instance = uuid.uuid4().hex
+        self.version = 0
+
+    def _matches_extension(self, name):
+        return name.lower().endswith(self.extensions)
+
+    def _insert(self, info):
+        self._entries[info.name] = info
+        for sort in SORT_KEYS:
+            insort(self._sorted[sort], (_sort_value(info, sort), info.name))
+
+    def _delete(self, name):
+        info = self._entries.pop(name, None)
+        if info is None:
+            return
+        for sort in SORT_KEYS:
+            keys = self._sorted[sort]
+            key = (_sort_value(info, sort), name)
+            index = bisect_left(keys, key)
+            if index < len(keys) and keys[index] == key:
+                del keys[index]
+
+    def rebuild(self):
+        """扫描一次目录重建索引"""
+        started = time.perf_counter()
+        entries = {}
+        dir_mtime_ns = None
+        try:
+            dir_mtime_ns = os.stat(self.directory).st_mtime_ns
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not self._matches_extension(entry.name):
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries[entry.name] = FileInfo(entry.name, entry.path, stat.st_size, stat.st_mtime, stat.st_ctime)
+        except OSError:
+            pass
+
+        with self._lock:
+            self._entries = entries
+            self._sorted = {
+                sort: sorted((_sort_value(info, sort), info.name) for info in entries.values())
+                for sort in SORT_KEYS
+            }
+            self._dir_mtime_ns = dir_mtime_ns
+            self._built = True
+            self.version += 1
+        observe_scan("file_listing", self.directory, started, len(entries))
+
+    def refresh_if_changed(self):
+        """目录mtime变化(或尚未建立)时重建"""
+        try:
+            dir_mtime_ns = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            dir_mtime_ns = None
+        if self._built and dir_mtime_ns == self._dir_mtime_ns:
+            return
+        self.rebuild()
+
+    def _touch(self):
+        """事件已同步到索引，记录当前目录mtime避免下次整体重建"""
+        try:
+            self._dir_mtime_ns = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            self._dir_mtime_ns = None
+
+    def add(self, path):
+        """新增或修改文件"""
+        path = str(path)
+        name = os.path.basename(path)
+        if not self._built or not self._matches_extension(name):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.remove(path)
+            return
+        with self._lock:
+            self._delete(name)
+            self._insert(FileInfo(name, path, stat.st_size, stat.st_mtime, stat.st_ctime))
+            self._touch()
+            self.version += 1
+
+    def remove(self, path):
+        """删除文件"""
+        if not self._built:
+            return
+        with self._lock:
+            self._delete(os.path.basename(str(path)))
+            self._touch()
+            self.version += 1
+
+    def query(self, sort="mtime", descending=True, limit=None, cursor=None,
+              extensions=None, start_time=None, end_time=None, prefix=None):
+        """分页查询，返回 {"items": [FileInfo...], "total": 匹配总数, "next_cursor": ...}
+
+        start_time/end_time 为修改时间的时间戳范围；按修改时间或文件名排序时
+        时间范围和前缀过滤直接二分定位，其余过滤在有序列表上顺序筛选。
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"不支持的排序字段: {sort}")
+        if not self._built:
+            self.rebuild()
+        extensions = tuple(f".{ext.lower().lstrip('.')}" for ext in extensions) if extensions else None
+
+        def matches(info):
+            if extensions is not None and not info.name.lower().endswith(extensions):
+                return False
+            if start_time is not None and info.mtime < start_time:
+                return False
+            if end_time is not None and info.mtime > end_time:
+                return False
+            return prefix is None or info.name.startswith(prefix)
+
+        with self._lock:
+            keys = self._sorted[sort]
+            lo, hi = 0, len(keys)
+            if sort == "mtime":
+                if start_time is not None:
+                    lo = bisect_left(keys, (start_time,))
+                if end_time is not None:
+                    hi = bisect_right(keys, (end_time, MAX_NAME))
+            elif sort == "name" and prefix:
+                lo = bisect_left(keys, (prefix,))
+                hi = bisect_left(keys, (prefix + MAX_NAME,))
+
+            filtered = extensions is not None or start_time is not None or end_time is not None or prefix is not None
+            if not filtered:
+                total = len(keys)
+            else:
+                total = sum(1 for _, name in keys[lo:hi] if matches(self._entries[name]))
+
+            if cursor:
+                cursor_key = decode_listing_cursor(cursor, sort)
+                if descending:
+                    hi = min(hi, bisect_left(keys, cursor_key))
+                else:
+                    lo = max(lo, bisect_right(keys, cursor_key))
+
+            items = []
+            positions = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+            for position in positions:
+                info = self._entries[keys[position][1]]
+                if filtered and not matches(info):
+                    continue
+                items.append(info)
+                if limit is not None and len(items) == limit:
+                    break
+
+        next_cursor = None
+        if limit is not None and len(items) == limit:
+            last = items[-1]
+            next_cursor = encode_listing_cursor(sort, _sort_value(last, sort), last.name)
+        return {"items": items, "total": total, "next_cursor": next_cursor}
+
+    def __len__(self):
+        return len(self._entries)
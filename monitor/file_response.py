@@ -0,0 +1,162 @@
+"""支持Range/If-Range的文件下载响应 - 大文件断点续传，服务器支持时走零拷贝发送"""
+
+import os
+import stat as stat_module
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+
+import anyio
+from starlette.responses import Response
+
+from monitor.responses import make_etag
+
+READ_CHUNK_SIZE = 1024 * 1024
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+class RangeNotSatisfiable(Exception):
+    """请求的范围超出文件大小"""
+
+
+def parse_range(header, size):
+    """解析单个字节范围，返回 (起始, 结束) 闭区间；多段范围或无法解析时返回None(按完整文件响应)"""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start, sep, end = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if start == "":
+            # bytes=-N 表示最后N个字节
+            length = int(end)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+class RangeFileResponse(Response):
+    """文件下载响应
+
+    带 ETag/Last-Modified/Accept-Ranges；Range请求返回206和对应片段，
+    If-Range 与当前版本不一致时返回完整文件，If-None-Match 一致时返回304。
+    ASGI服务器支持 http.response.zerocopysend 扩展时由服务器用sendfile发送，
+    否则按块 pread 后发送。
+    """
+
+    def __init__(self, path, request, stat_result=None, filename=None,
+                 media_type="application/octet-stream", content_disposition_type="attachment"):
+        self.path = path
+        self.request = request
+        self.stat_result = stat_result or os.stat(path)
+        if not stat_module.S_ISREG(self.stat_result.st_mode):
+            raise FileNotFoundError(path)
+        self.filename = filename
+        self.media_type = media_type
+        self.content_disposition_type = content_disposition_type
+        self.status_code = 200
+        self.background = None
+        self.etag = make_etag(self.stat_result.st_ino, self.stat_result.st_mtime_ns, self.stat_result.st_size)
+        self.last_modified = formatdate(self.stat_result.st_mtime, usegmt=True)
+
+    def _base_headers(self):
+        headers = [
+            ("accept-ranges", "bytes"),
+            ("etag", self.etag),
+            ("last-modified", self.last_modified),
+        ]
+        if self.filename is not None:
+            quoted = quote(self.filename)
+            if quoted != self.filename:
+                disposition = f"{self.content_disposition_type}; filename*=utf-8''{quoted}"
+            else:
+                disposition = f'{self.content_disposition_type}; filename="{self.filename}"'
+            headers.append(("content-disposition", disposition))
+        return headers
+
+    def _if_range_matches(self):
+        """If-Range 与当前文件版本一致时才按范围响应"""
+        if_range = self.request.headers.get("if-range")
+        if if_range is None:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            return if_range == self.etag
+        try:
+            return int(self.stat_result.st_mtime) <= parsedate_to_datetime(if_range).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    def _not_modified(self):
+        if_none_match = self.request.headers.get("if-none-match")
+        if if_none_match is None:
+            return False
+        return if_none_match.strip() == "*" or self.etag in [tag.strip() for tag in if_none_match.split(",")]
+
+    async def __call__(self, scope, receive, send):
+        size = self.stat_result.st_size
+        headers = self._base_headers()
+        if self._not_modified():
+            await self._send_headers(send, 304, headers)
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        status, start, end = 200, 0, size - 1
+        range_header = self.request.headers.get("range")
+        if range_header and size and self._if_range_matches():
+            try:
+                byte_range = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                headers.append(("content-range", f"bytes */{size}"))
+                headers.append(("content-length", "0"))
+                await self._send_headers(send, 416, headers)
+                await send({"type": "http.response.body", "body": b""})
+                return
+            if byte_range is not None:
+                status, (start, end) = 206, byte_range
+                headers.append(("content-range", f"bytes {start}-{end}/{size}"))
+
+        length = end - start + 1 if size else 0
+        headers.append(("content-type", self.media_type))
+        headers.append(("content-length", str(length)))
+        await self._send_headers(send, status, headers)
+        if scope.get("method") == "HEAD" or length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        file = await anyio.to_thread.run_sync(open, self.path, "rb")
+        try:
+            if ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+                await send({"type": ZEROCOPY_EXTENSION, "file": file, "offset": start, "count": length})
+                return
+            fd = file.fileno()
+            position = start
+            remaining = length
+            while remaining > 0:
+                chunk = await anyio.to_thread.run_sync(os.pread, fd, min(READ_CHUNK_SIZE, remaining), position)
+                if not chunk:
+                    # 发送过程中文件被截断
+                    break
+                position += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            file.close()
+
+    async def _send_headers(self, send, status, headers):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+        })
@@ -0,0 +1,130 @@
+"""结果图片与任务时间戳的关联表 - 单次扫描目录，按文件事件增量维护"""
+
+import logging
+import os
+import re
+import threading
+import time
+
+from monitor.metrics import observe_scan
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif")
+TIMESTAMP_PATTERN = re.compile(r"\d{8}_\d{6}")
+
+
+class ImageTimestampMap:
+    """时间戳 -> 图片路径 的内存映射
+
+    一次 os.scandir 建立映射后，所有任务的图片查找都是字典访问；
+    之后通过 add/remove 随文件事件更新，或在目录mtime变化时重建。
+    """
+
+    def __init__(self, images_dir):
+        self.images_dir = images_dir
+        self._lock = threading.Lock()
+        self._by_timestamp = {}
+        self._paths = set()
+        self._dir_mtime_ns = None
+        self._built = False
+
+    @staticmethod
+    def _is_image(name):
+        return name.endswith(IMAGE_EXTENSIONS)
+
+    def _index(self, path):
+        self._paths.add(path)
+        for timestamp in set(TIMESTAMP_PATTERN.findall(os.path.basename(path))):
+            self._by_timestamp.setdefault(timestamp, set()).add(path)
+
+    def _unindex(self, path):
+        self._paths.discard(path)
+        for timestamp in set(TIMESTAMP_PATTERN.findall(os.path.basename(path))):
+            paths = self._by_timestamp.get(timestamp)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del self._by_timestamp[timestamp]
+
+    def rebuild(self):
+        """扫描一次图片目录重建映射，返回发生变化的时间戳集合"""
+        started = time.perf_counter()
+        paths = set()
+        dir_mtime_ns = None
+        try:
+            dir_mtime_ns = os.stat(self.images_dir).st_mtime_ns
+            with os.scandir(self.images_dir) as it:
+                for entry in it:
+                    if self._is_image(entry.name):
+                        paths.add(entry.path)
+        except OSError:
+            pass
+
+        with self._lock:
+            changed_paths = paths.symmetric_difference(self._paths)
+            self._by_timestamp = {}
+            self._paths = set()
+            for path in paths:
+                self._index(path)
+            self._dir_mtime_ns = dir_mtime_ns
+            self._built = True
+        observe_scan("image_map", self.images_dir, started, len(paths))
+
+        changed = set()
+        for path in changed_paths:
+            changed.update(TIMESTAMP_PATTERN.findall(os.path.basename(path)))
+        return changed
+
+    def refresh_if_changed(self):
+        """目录mtime变化(或尚未建立)时重建，返回发生变化的时间戳集合"""
+        try:
+            dir_mtime_ns = os.stat(self.images_dir).st_mtime_ns
+        except OSError:
+            dir_mtime_ns = None
+        if self._built and dir_mtime_ns == self._dir_mtime_ns:
+            return set()
+        return self.rebuild()
+
+    def _touch(self):
+        """事件已同步到映射，记录当前目录mtime避免下次整体重建"""
+        try:
+            self._dir_mtime_ns = os.stat(self.images_dir).st_mtime_ns
+        except OSError:
+            self._dir_mtime_ns = None
+
+    def add(self, path):
+        """新增图片，返回关联的时间戳"""
+        path = str(path)
+        if not self._is_image(path) or not self._built:
+            return set()
+        with self._lock:
+            self._index(path)
+            self._touch()
+        return set(TIMESTAMP_PATTERN.findall(os.path.basename(path)))
+
+    def remove(self, path):
+        """移除图片，返回关联的时间戳"""
+        path = str(path)
+        if not self._built:
+            return set()
+        with self._lock:
+            if path in self._paths:
+                self._unindex(path)
+            self._touch()
+        return set(TIMESTAMP_PATTERN.findall(os.path.basename(path)))
+
+    def get(self, timestamp_str):
+        """查找文件名包含该时间戳的图片"""
+        if not timestamp_str:
+            return []
+        if not self._built:
+            self.rebuild()
+        with self._lock:
+            if TIMESTAMP_PATTERN.fullmatch(timestamp_str):
+                return sorted(self._by_timestamp.get(timestamp_str, ()))
+            # 非标准时间戳退回到内存中的子串匹配，不再访问磁盘
+            return sorted(p for p in self._paths if timestamp_str in os.path.basename(p))
+
+    def __len__(self):
+        return len(self._paths)
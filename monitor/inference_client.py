@@ -0,0 +1,235 @@
+"""推理服务客户端 - 共享长连接，限制并发和排队，瞬时错误重试，服务不可用时熔断"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+import httpx
+
+from monitor.metrics import INFERENCE_FAILURES, INFERENCE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 推理服务过载或重启时返回的状态码，可以重试
+RETRY_STATUS_CODES = (502, 503, 504)
+# 请求未到达推理服务时的错误，重试不会造成重复检测；
+# RemoteProtocolError等发生在请求发出之后，推理服务可能已经开始检测，不重试
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class InferenceUnavailable(Exception):
+    """推理服务熔断、排队已满或排队超时，请求未发出"""
+
+
+class InferenceError(Exception):
+    """推理服务返回错误或连接失败，status_code为推理服务返回的状态码(连接失败时为None)"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+    @property
+    def client_error(self):
+        """4xx错误由请求本身引起，说明推理服务可用"""
+        return self.status_code is not None and 400 <= self.status_code < 500
+
+
+class InferenceClient:
+    """推理服务异步客户端
+
+    同时在途的请求数不超过max_in_flight，等待的请求数不超过max_queue，
+    等待超过queue_timeout秒放弃；连续failure_threshold次失败(5xx或连接错误，
+    4xx不计入)后熔断，reset_timeout秒后放行一个探测请求，成功则恢复。
+    """
+
+    def __init__(self, url, max_in_flight=1, max_queue=16, queue_timeout=600,
+                 request_timeout=300, connect_timeout=5, retries=2, backoff=0.5,
+                 failure_threshold=5, reset_timeout=30):
+        self.url = url
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._client = None
+        self._semaphore = None
+        self._in_flight = 0
+        self._queued = 0
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        self.requests = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rejected = 0
+        self.retried = 0
+        self.circuit_opened = 0
+        self._latency_ms = deque(maxlen=1000)
+        self._wait_ms = deque(maxlen=1000)
+
+    async def start(self):
+        """创建共享的HTTP客户端"""
+        if self._client is not None:
+            return
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.request_timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=self.max_in_flight,
+                max_keepalive_connections=self.max_in_flight,
+            ),
+        )
+
+    async def close(self):
+        """关闭HTTP客户端"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _check_circuit(self):
+        """熔断中直接拒绝；到达恢复时间后只放行一个探测请求"""
+        if self._state == CLOSED:
+            return False
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+        if self._state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.rejected += 1
+        INFERENCE_FAILURES.inc("circuit_open")
+        raise InferenceUnavailable("推理服务不可用(熔断中)，请稍后重试")
+
+    def _record_success(self):
+        self._consecutive_failures = 0
+        if self._state != CLOSED:
+            logger.info("推理服务恢复，关闭熔断")
+        self._state = CLOSED
+
+    def _record_failure(self):
+        self._consecutive_failures += 1
+        if self._state == HALF_OPEN or (
+            self._state == CLOSED and self._consecutive_failures >= self.failure_threshold
+        ):
+            if self._state == CLOSED:
+                self.circuit_opened += 1
+            logger.warning(f"推理服务连续失败 {self._consecutive_failures} 次，熔断 {self.reset_timeout} 秒")
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+
+    async def _acquire(self):
+        """等待在途名额，排队已满或超时抛出InferenceUnavailable"""
+        if self._queued + self._in_flight >= self.max_in_flight + self.max_queue:
+            self.rejected += 1
+            INFERENCE_FAILURES.inc("queue_full")
+            raise InferenceUnavailable("推理请求排队已满，请稍后重试")
+        self._queued += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            INFERENCE_FAILURES.inc("queue_timeout")
+            raise InferenceUnavailable(f"推理请求排队超过 {self.queue_timeout} 秒")
+        finally:
+            self._queued -= 1
+        self._wait_ms.append((time.perf_counter() - started) * 1000)
+
+    async def _send(self, payload):
+        """发送请求，瞬时错误按指数退避重试"""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                delay = self.backoff * 2 ** (attempt - 1)
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            try:
+                response = await self._client.put(self.url, json=payload)
+            except RETRY_EXCEPTIONS as e:
+                error = InferenceError(f"推理服务连接失败: {e!r}")
+                logger.warning(f"调用推理API失败(第{attempt + 1}次): {e!r}")
+                continue
+            except httpx.HTTPError as e:
+                raise InferenceError(f"推理服务连接失败: {e!r}")
+            if response.status_code in RETRY_STATUS_CODES:
+                error = InferenceError(f"推理服务错误: {response.status_code}", response.status_code)
+                logger.warning(f"推理API返回 {response.status_code}(第{attempt + 1}次)")
+                continue
+            if response.status_code != 200:
+                logger.error(f"推理API返回错误: {response.status_code} - {response.text}")
+                raise InferenceError(f"推理服务错误: {response.status_code}", response.status_code)
+            return response.json()
+        raise error
+
+    async def detect(self, payload):
+        """调用推理API，返回结果JSON"""
+        if self._client is None:
+            await self.start()
+        probe = self._check_circuit()
+        try:
+            await self._acquire()
+            self.requests += 1
+            self._in_flight += 1
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await self._send(payload)
+                outcome = "success"
+            except InferenceError as e:
+                self.failed += 1
+                INFERENCE_FAILURES.inc("error")
+                if e.client_error:
+                    self._record_success()
+                else:
+                    self._record_failure()
+                raise
+            finally:
+                self._in_flight -= 1
+                self._semaphore.release()
+                elapsed = time.perf_counter() - started
+                self._latency_ms.append(elapsed * 1000)
+                INFERENCE_SECONDS.observe(elapsed, outcome)
+            self.succeeded += 1
+            self._record_success()
+            return result
+        finally:
+            if probe:
+                self._probe_in_flight = False
+
+    @staticmethod
+    def _percentile(values, q):
+        return round(values[min(len(values) - 1, int(len(values) * q))], 2) if values else 0.0
+
+    def metrics(self):
+        """客户端指标"""
+        latency = sorted(self._latency_ms)
+        wait = list(self._wait_ms)
+        return {
+            "url": self.url,
+            "circuit_state": self._state,
+            "in_flight": self._in_flight,
+            "queued": self._queued,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "requests": self.requests,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "retried": self.retried,
+            "circuit_opened": self.circuit_opened,
+            "latency_p50_ms": self._percentile(latency, 0.5),
+            "latency_p95_ms": self._percentile(latency, 0.95),
+            "latency_p99_ms": self._percentile(latency, 0.99),
+            "avg_wait_ms": round(sum(wait) / len(wait), 2) if wait else 0.0,
+        }
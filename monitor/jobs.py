@@ -0,0 +1,304 @@
+"""检测任务队列 - 上传后立即返回任务ID，后台按并发上限调用推理服务，任务状态持久化到磁盘"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+
+from monitor.leader import ProcessLock
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED_STATES = (DONE, FAILED)
+PRUNE_INTERVAL = 3600  # 提交任务时最多每小时清理一次过期任务
+
+
+def _now():
+    return datetime.now().isoformat()
+
+
+class JobQueue:
+    """持久化的异步任务队列
+
+    handler(job) 为协程，返回值写入 job["result"]，抛出异常时任务标记为失败。
+    每个任务保存为 jobs_dir/{job_id}.json，由提交它的进程执行；多个工作进程
+    共享任务目录，任意进程都可以查询任务状态。每个进程持有一个所有者文件锁，
+    主进程调用recover()接管所有者已退出的未完成任务。结束超过retention_days天的
+    任务在提交新任务时(最多每PRUNE_INTERVAL秒一次)从内存和磁盘中删除。
+    """
+
+    def __init__(self, jobs_dir, handler, concurrency=1, retention_days=7):
+        self.jobs_dir = jobs_dir
+        self.handler = handler
+        self.concurrency = concurrency
+        self.retention_days = retention_days
+        self.instance = uuid.uuid4().hex
+        self._owner_lock = ProcessLock(jobs_dir / ".owners" / f"{self.instance}.lock")
+        self._jobs = {}
+        self._queue = None
+        self._workers = []
+        self._subscribers = {}
+        self._done_events = {}
+        self._next_prune = time.monotonic() + PRUNE_INTERVAL
+
+    async def start(self):
+        """启动后台工作协程"""
+        self._queue = asyncio.Queue()
+        await asyncio.to_thread(self._owner_lock.try_acquire)
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.concurrency)
+        ]
+
+    async def recover(self):
+        """接管所有者已退出的未完成任务，清理过期任务(仅由主进程调用)"""
+        pending = await asyncio.to_thread(self._load)
+        for job in pending:
+            self._queue.put_nowait(job["id"])
+        if pending:
+            logger.info(f"恢复未完成的检测任务 {len(pending)} 个")
+
+    async def stop(self):
+        """停止后台工作协程，正在执行的任务下次启动时重新排队"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._owner_lock.release()
+
+    def _owner_alive(self, owner):
+        """所有者进程是否仍在运行(其所有者锁是否仍被持有)"""
+        if owner == self.instance:
+            return True
+        if not owner:
+            return False
+        lock = ProcessLock(self.jobs_dir / ".owners" / f"{owner}.lock")
+        if not lock.path.exists():
+            return False
+        if not lock.try_acquire():
+            return True
+        lock.release()
+        os.remove(lock.path)
+        return False
+
+    def _load(self):
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        expire_before = self._expire_before()
+        pending = []
+        for entry in os.scandir(self.jobs_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    job = json.load(f)
+            except Exception as e:
+                logger.warning(f"读取任务文件 {entry.path} 失败: {e}")
+                continue
+            if job["status"] in FINISHED_STATES:
+                if entry.stat().st_mtime < expire_before:
+                    os.remove(entry.path)
+                continue
+            if job["id"] in self._jobs or self._owner_alive(job.get("owner")):
+                continue
+            job["status"] = QUEUED
+            job["owner"] = self.instance
+            job["restarts"] = job.get("restarts", 0) + 1
+            pending.append(job)
+            self._jobs[job["id"]] = job
+        pending.sort(key=lambda job: job["created_at"])
+        for job in pending:
+            self._persist(job)
+        return pending
+
+    def _expire_before(self):
+        return time.time() - self.retention_days * 86400
+
+    def _remove_expired_files(self, expire_before):
+        """删除结束时间早于expire_before的任务文件(包括其他进程的任务)"""
+        removed = 0
+        if not self.jobs_dir.exists():
+            return removed
+        for entry in os.scandir(self.jobs_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                if entry.stat().st_mtime >= expire_before:
+                    continue
+                job = self._read(entry.name[:-len(".json")])
+                if job is not None and job["status"] in FINISHED_STATES:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+    async def prune(self):
+        """删除结束超过保留期的任务，返回删除的任务文件数"""
+        expire_before = self._expire_before()
+        for job_id, job in list(self._jobs.items()):
+            if job["status"] not in FINISHED_STATES or not job["finished_at"]:
+                continue
+            if datetime.fromisoformat(job["finished_at"]).timestamp() < expire_before:
+                del self._jobs[job_id]
+        removed = await asyncio.to_thread(self._remove_expired_files, expire_before)
+        if removed:
+            logger.info(f"清理过期检测任务 {removed} 个")
+        return removed
+
+    def _read(self, job_id):
+        """从磁盘读取任务记录(由其他进程执行的任务)"""
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self.jobs_dir / f"{job_id}.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"读取任务文件 {job_id} 失败: {e}")
+            return None
+
+    def _persist(self, job):
+        path = self.jobs_dir / f"{job['id']}.json"
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    async def _update(self, job, **fields):
+        job.update(fields)
+        await asyncio.to_thread(self._persist, dict(job))
+        for queue in list(self._subscribers.get(job["id"], ())):
+            queue.put_nowait(dict(job))
+        if job["status"] in FINISHED_STATES:
+            event = self._done_events.pop(job["id"], None)
+            if event is not None:
+                event.set()
+
+    async def submit(self, kind, params):
+        """提交任务，立即返回任务记录"""
+        if time.monotonic() >= self._next_prune:
+            self._next_prune = time.monotonic() + PRUNE_INTERVAL
+            try:
+                await self.prune()
+            except Exception as e:
+                logger.warning(f"清理过期检测任务失败: {e}")
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "status": QUEUED,
+            "owner": self.instance,
+            "params": params,
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+            "queue_ms": None,
+            "run_ms": None,
+            "result": None,
+            "error": None,
+        }
+        self._jobs[job["id"]] = job
+        await asyncio.to_thread(self._persist, dict(job))
+        self._queue.put_nowait(job["id"])
+        return dict(job)
+
+    async def cancel(self, job_id):
+        """取消本进程中尚未开始执行的任务，返回是否已取消"""
+        job = self._jobs.get(job_id)
+        if job is None or job["status"] != QUEUED:
+            return False
+        await self._update(job, status=FAILED, error="任务已取消", finished_at=_now())
+        return True
+
+    def is_local(self, job_id):
+        """任务是否由本进程执行"""
+        return job_id in self._jobs
+
+    def get(self, job_id):
+        """获取任务记录，不存在时返回None；非本进程的任务从磁盘读取"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return dict(job)
+        return self._read(job_id)
+
+    def list(self, limit=50, status=None):
+        """按创建时间倒序列出所有进程的任务"""
+        jobs = {}
+        if self.jobs_dir.exists():
+            for entry in os.scandir(self.jobs_dir):
+                if entry.name.endswith(".json"):
+                    job = self._read(entry.name[:-len(".json")])
+                    if job is not None:
+                        jobs[job["id"]] = job
+        jobs.update((job_id, dict(job)) for job_id, job in self._jobs.items())
+        jobs = [job for job in jobs.values() if status is None or job["status"] == status]
+        jobs.sort(key=lambda job: job["created_at"], reverse=True)
+        return jobs[:limit]
+
+    def queue_depth(self):
+        """排队中的任务数"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def wait(self, job_id, timeout=None):
+        """等待任务结束并返回任务记录"""
+        job = self._jobs[job_id]
+        if job["status"] not in FINISHED_STATES:
+            event = self._done_events.setdefault(job_id, asyncio.Event())
+            await asyncio.wait_for(event.wait(), timeout)
+        return dict(self._jobs[job_id])
+
+    def subscribe(self, job_id):
+        """订阅任务状态变化，返回asyncio.Queue"""
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, job_id, queue):
+        """取消订阅"""
+        subscribers = self._subscribers.get(job_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[job_id]
+
+    async def _worker(self, worker_id):
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != QUEUED:
+                continue
+            started = time.time()
+            created = datetime.fromisoformat(job["created_at"]).timestamp()
+            await self._update(
+                job,
+                status=RUNNING,
+                started_at=_now(),
+                queue_ms=round((started - created) * 1000, 1),
+            )
+            try:
+                result = await self.handler(dict(job))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"检测任务 {job_id} 失败: {e}")
+                await self._update(
+                    job,
+                    status=FAILED,
+                    error=str(e),
+                    finished_at=_now(),
+                    run_ms=round((time.time() - started) * 1000, 1),
+                )
+            else:
+                await self._update(
+                    job,
+                    status=DONE,
+                    result=result,
+                    finished_at=_now(),
+                    run_ms=round((time.time() - started) * 1000, 1),
+                )
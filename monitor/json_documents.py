@@ -0,0 +1,302 @@
+"""结果JSON文档缓存 - 按mtime/大小校验的解析结果LRU、fields字段投影、大文件流式读取顶层字段"""
+
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from monitor.responses import orjson
+
+logger = logging.getLogger(__name__)
+
+# 解析后的Python对象约为JSON文本大小的数倍，按该系数估算缓存占用
+PARSED_SIZE_FACTOR = 6
+READ_CHUNK_SIZE = 1024 * 1024
+_WHITESPACE = " \t\n\r"
+# 数字和true/false/null之后必须是这些字符之一(或文件结束)，才能确认没有在块边界被截断
+_DELIMITERS = _WHITESPACE + ",:}]"
+_CONTAINER_OR_STRING = '{["'
+# 跳过不需要的成员时只定位结构字符: 字符串外的引号和括号，字符串内的引号和转义符
+_STRUCTURAL = re.compile(r'["{}\[\]]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+class FieldNotFound(KeyError):
+    """fields中的字段在文档中不存在"""
+
+
+def parse_fields(fields):
+    """解析 fields 参数: 逗号分隔的字段路径，嵌套字段用 . 分隔，列表元素用下标
+
+    "地物分类,水体自动提取.面积" -> [("地物分类",), ("水体自动提取", "面积")]
+    """
+    if not fields:
+        return None
+    paths = []
+    for field in fields.split(","):
+        field = field.strip()
+        if not field:
+            continue
+        path = tuple(part.strip() for part in field.split("."))
+        if any(not part for part in path):
+            raise ValueError(f"无效的字段路径: {field}")
+        paths.append(path)
+    return paths or None
+
+
+def _lookup(value, part):
+    if isinstance(value, dict):
+        if part in value:
+            return value[part]
+    elif isinstance(value, list) and part.lstrip("-").isdigit():
+        index = int(part)
+        if -len(value) <= index < len(value):
+            return value[index]
+    raise FieldNotFound(part)
+
+
+def project(data, paths):
+    """按字段路径提取文档中的部分内容，保持原有的嵌套结构
+
+    列表下标作为结果中的字符串键；不存在的字段抛出FieldNotFound。
+    """
+    if paths is None:
+        return data
+    result = {}
+    for path in paths:
+        value = data
+        for depth, part in enumerate(path):
+            try:
+                value = _lookup(value, part)
+            except FieldNotFound:
+                raise FieldNotFound(".".join(path[:depth + 1]))
+        target = result
+        for part in path[:-1]:
+            target = target.setdefault(part, {})
+        target[path[-1]] = value
+    return result
+
+
+def _loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw.decode("utf-8"))
+
+
+class _StreamReader:
+    """按块读取文本，解码顶层对象的各个成员，已处理的部分随时丢弃"""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        if self.eof:
+            return False
+        # 已处理的部分不再保留
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        chunk = self.f.read(max(self.chunk_size, len(self.buffer)))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer += chunk
+        return True
+
+    def peek(self):
+        """跳过空白，返回下一个字符(文件结束返回空字符串)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"JSON格式错误: 位置 {self.pos} 处应为 {char!r}")
+        self.pos += 1
+
+    def value(self):
+        """解码一个完整的值
+
+        字符串、对象和数组以结束符结尾，解码成功即完整；数字和true/false/null没有结束符，
+        还要确认后面紧跟分隔符或已到文件末尾，否则可能在块边界被截断
+        (如 "-15000000000." 会被解码为 -15000000000)，需要读入更多内容后重新解码。
+        """
+        first = self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            complete = first in _CONTAINER_OR_STRING or (end < len(self.buffer) and self.buffer[end] in _DELIMITERS)
+            if complete or not self._fill():
+                self.pos = end
+                return value
+
+    def skip(self):
+        """跳过一个值而不解码，只按字符串和括号嵌套定位结束位置，已扫描的部分随时丢弃"""
+        first = self.peek()
+        if first not in _CONTAINER_OR_STRING:
+            # 数字和字面量很短，直接解码
+            self.value()
+            return
+        depth = 0
+        in_string = False
+        while True:
+            buffer, i = self.buffer, self.pos
+            while True:
+                if in_string:
+                    match = _STRING_SPECIAL.search(buffer, i)
+                    if match is None:
+                        i = len(buffer)
+                        break
+                    if match.group() == "\\":
+                        if match.end() >= len(buffer):
+                            # 转义符在块末尾，读入下一块后从转义符处继续
+                            i = match.start()
+                            break
+                        i = match.end() + 1
+                        continue
+                    in_string = False
+                    i = match.end()
+                    if depth == 0:
+                        self.pos = i
+                        return
+                else:
+                    match = _STRUCTURAL.search(buffer, i)
+                    if match is None:
+                        i = len(buffer)
+                        break
+                    char = match.group()
+                    i = match.end()
+                    if char == '"':
+                        in_string = True
+                    elif char in "{[":
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            self.pos = i
+                            return
+            self.pos = i
+            if not self._fill():
+                raise ValueError("JSON格式错误: 文件意外结束")
+
+
+def extract_sections(path, keys, chunk_size=READ_CHUNK_SIZE):
+    """流式读取大文件的顶层对象，只解码keys中的成员，全部找到后停止读取
+
+    其余成员只扫描不解码，内存中同时只保留一个需要的顶层成员，返回 {键: 值}；
+    文档中不存在的键不出现在结果中。
+    """
+    wanted = set(keys)
+    found = {}
+    with open(path, "r", encoding="utf-8") as f:
+        reader = _StreamReader(f, chunk_size)
+        reader.expect("{")
+        if reader.peek() == "}":
+            return found
+        while True:
+            key = reader.value()
+            if not isinstance(key, str):
+                raise ValueError("JSON格式错误: 对象的键必须是字符串")
+            reader.expect(":")
+            if key in wanted:
+                found[key] = reader.value()
+                if len(found) == len(wanted):
+                    return found
+            else:
+                reader.skip()
+            separator = reader.peek()
+            if separator == "}":
+                return found
+            reader.expect(",")
+
+
+class DocumentCache:
+    """结果JSON解析结果的LRU缓存
+
+    文件mtime或大小变化后自动重新解析；按文件大小乘以PARSED_SIZE_FACTOR估算占用，
+    总量不超过max_bytes。超过stream_threshold字节的文件不整体缓存，
+    请求fields时流式读取所需的顶层字段，不解析和保留整个文档。
+    """
+
+    def __init__(self, max_bytes, stream_threshold):
+        self.max_bytes = max_bytes
+        self.stream_threshold = stream_threshold
+        self._entries = OrderedDict()  # 路径 -> (mtime_ns, 大小, 文档, 估算占用)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.streamed = 0
+
+    def _lookup(self, path, stat):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size:
+                return None
+            self._entries.move_to_end(path)
+            return entry[2]
+
+    def _store(self, path, stat, document):
+        cost = stat.st_size * PARSED_SIZE_FACTOR
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous is not None:
+                self._total_bytes -= previous[3]
+            self._entries[path] = (stat.st_mtime_ns, stat.st_size, document, cost)
+            self._total_bytes += cost
+            while self._total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted[3]
+
+    def get(self, path, paths=None):
+        """读取文档，paths为parse_fields的结果时只返回对应字段"""
+        path = str(path)
+        stat = os.stat(path)
+        document = self._lookup(path, stat)
+        if document is not None:
+            self.hits += 1
+            return project(document, paths)
+        self.misses += 1
+        if stat.st_size > self.stream_threshold:
+            if paths is not None:
+                self.streamed += 1
+                sections = extract_sections(path, {field[0] for field in paths})
+                return project(sections, paths)
+            with open(path, "rb") as f:
+                return _loads(f.read())
+        with open(path, "rb") as f:
+            document = _loads(f.read())
+        self._store(path, stat, document)
+        return project(document, paths)
+
+    def invalidate(self, path):
+        """文件删除或修改时移除缓存"""
+        with self._lock:
+            entry = self._entries.pop(str(path), None)
+            if entry is not None:
+                self._total_bytes -= entry[3]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "streamed": self.streamed,
+            }
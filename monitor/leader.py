@@ -0,0 +1,96 @@
+"""多工作进程协调 - 用文件锁选出一个主进程运行目录监听、缩略图预生成等后台任务"""
+
+import asyncio
+import logging
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows没有fcntl，只支持单进程运行
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessLock:
+    """非阻塞的进程间文件锁，进程退出时由操作系统自动释放"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def try_acquire(self):
+        """尝试获取锁，已被其他进程持有时返回False"""
+        if self._fd is not None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        """释放锁"""
+        if self._fd is not None:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class LeaderElection:
+    """主进程选举
+
+    持有锁的进程为主进程；其余进程每隔retry_interval秒重试，
+    主进程退出后由其中一个接管并调用on_elected。
+    """
+
+    def __init__(self, lock_path, on_elected, retry_interval=5.0):
+        self.lock = ProcessLock(lock_path)
+        self.on_elected = on_elected
+        self.retry_interval = retry_interval
+        self._task = None
+
+    @property
+    def is_leader(self):
+        return self.lock.held
+
+    async def start(self):
+        """尝试成为主进程，失败时在后台等待接管"""
+        if await self._try_elect():
+            return
+        logger.info(f"进程 {os.getpid()} 作为从进程运行，等待主进程退出后接管后台任务")
+        self._task = asyncio.get_running_loop().create_task(self._wait_for_leadership())
+
+    async def _try_elect(self):
+        if not self.lock.try_acquire():
+            return False
+        logger.info(f"进程 {os.getpid()} 成为主进程，负责后台任务")
+        await self.on_elected()
+        return True
+
+    async def _wait_for_leadership(self):
+        while not await self._try_elect():
+            await asyncio.sleep(self.retry_interval)
+
+    async def stop(self):
+        """停止等待并释放锁"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.lock.release()
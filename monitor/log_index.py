@@ -0,0 +1,448 @@
+"""日志全文索引 - 对日志目录下所有日志文件建立倒排索引(SQLite FTS5)，记录每行的字节偏移、时间和级别，只索引追加内容"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from monitor.log_tail import FINGERPRINT_SIZE, detect_encoding, ENCODINGS
+from monitor.metrics import observe_scan
+from monitor.result_index import encode_cursor, decode_cursor
+
+logger = logging.getLogger(__name__)
+
+LOG_PATTERNS = ("*.log", "*.log.*")
+# 轮转后压缩的日志不是文本，不建立索引
+SKIPPED_SUFFIXES = (".gz", ".bz2", ".xz", ".zip")
+INDEX_CHUNK_SIZE = 4 * 1024 * 1024
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+LEVEL_ALIASES = {"WARN": "WARNING", "FATAL": "CRITICAL"}
+
+# 日志文件表记录每个文件已索引到的偏移(完整行的末尾)和偏移前的若干字节，用于识别文件被截断或重写；
+# 行表的id不复用(AUTOINCREMENT)，同时作为FTS5的rowid，删除行时按rowid同时删除FTS5中的词条
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    inode INTEGER NOT NULL,
+    indexed_bytes INTEGER NOT NULL,
+    fingerprint BLOB NOT NULL,
+    encoding TEXT,
+    last_ts REAL NOT NULL,
+    last_level TEXT
+);
+CREATE TABLE IF NOT EXISTS log_lines (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_id INTEGER NOT NULL,
+    byte_offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    level TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_log_lines_ts ON log_lines (ts, id);
+CREATE INDEX IF NOT EXISTS idx_log_lines_level ON log_lines (level, ts, id);
+CREATE INDEX IF NOT EXISTS idx_log_lines_file ON log_lines (file_id);
+"""
+
+# SQLite 3.43起无内容的FTS5表支持按rowid删除；更早的版本只能保存分词后的文本才能删除
+if sqlite3.sqlite_version_info >= (3, 43, 0):
+    FTS_SCHEMA = "CREATE VIRTUAL TABLE log_fts USING fts5(body, content='', contentless_delete=1, tokenize='unicode61')"
+else:
+    FTS_SCHEMA = "CREATE VIRTUAL TABLE log_fts USING fts5(body, tokenize='unicode61')"
+
+_TIMESTAMP_RE = re.compile(rb"^\[?(\d{4})-(\d{2})-(\d{2})[ T](\d{2}):(\d{2}):(\d{2})(?:[,.](\d{1,6}))?\]?")
+_LEVEL_RE = re.compile(r"\b(DEBUG|INFO|WARNING|WARN|ERROR|CRITICAL|FATAL)\b")
+_CJK = "㐀-䶿一-鿿豈-﫿"
+# 中文按单字切分，查询时按短语匹配相邻的字；其余按连续的字母数字切分
+_TOKEN_RE = re.compile(f"[{_CJK}]|[^\\W{_CJK}_]+")
+
+
+def tokenize(text):
+    """切分为索引词"""
+    return _TOKEN_RE.findall(text)
+
+
+def build_match(q):
+    """空格分隔的关键词转换为FTS5查询: 每个关键词作为短语，所有关键词需同时出现"""
+    if not q:
+        return None
+    phrases = []
+    for term in q.split():
+        tokens = tokenize(term)
+        if tokens:
+            phrases.append('"' + " ".join(tokens) + '"')
+    if not phrases:
+        raise ValueError(f"关键词不包含可搜索的字符: {q}")
+    return " AND ".join(phrases)
+
+
+def parse_levels(level):
+    """解析逗号分隔的日志级别"""
+    if not level:
+        return None
+    levels = []
+    for name in level.split(","):
+        name = name.strip().upper()
+        if not name:
+            continue
+        name = LEVEL_ALIASES.get(name, name)
+        if name not in LEVELS:
+            raise ValueError(f"无效的日志级别: {name}")
+        levels.append(name)
+    return levels or None
+
+
+class _LineParser:
+    """解析行首的时间和级别；没有时间的行(如异常堆栈)沿用上一行的时间和级别"""
+
+    def __init__(self, last_ts, last_level):
+        self.last_ts = last_ts
+        self.last_level = last_level
+        self._second = None
+        self._second_ts = 0.0
+
+    def parse(self, raw, text):
+        match = _TIMESTAMP_RE.match(raw)
+        if match is None:
+            return self.last_ts, self.last_level, text
+        second = match.group(1, 2, 3, 4, 5, 6)
+        # 同一秒内的大量日志行只换算一次
+        if second != self._second:
+            try:
+                self._second_ts = datetime(*map(int, second)).timestamp()
+            except ValueError:
+                return self.last_ts, self.last_level, text
+            self._second = second
+        fraction = match.group(7)
+        ts = self._second_ts + (int(fraction) / 10 ** len(fraction) if fraction else 0)
+        # 时间部分都是ASCII，字节长度与字符长度相同
+        message = text[match.end():]
+        level = _LEVEL_RE.search(message, 0, 40)
+        self.last_ts = ts
+        self.last_level = LEVEL_ALIASES.get(level.group(1), level.group(1)) if level else None
+        return ts, self.last_level, message
+
+
+class LogIndex:
+    """日志目录的全文索引
+
+    每个日志文件记录已索引到的字节偏移，同步时只读取之后追加的完整行；
+    inode变化或文件变小、偏移前的内容不一致时(截断后重写)重新索引该文件，
+    轮转改名的文件按inode识别，只更新路径。行表只保存行的偏移、长度、时间和级别，
+    查询命中后按偏移直接读取原文件中的行。
+    """
+
+    def __init__(self, db_path, logs_dir, chunk_size=INDEX_CHUNK_SIZE):
+        self.db_path = db_path
+        self.logs_dir = logs_dir
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        # 数据库在第一次使用时才打开，导入模块或创建实例不会生成数据库文件
+        self._connection = None
+
+    @property
+    def _conn(self):
+        if self._connection is None:
+            with self._open_lock:
+                if self._connection is None:
+                    self._connection = self._open()
+        return self._connection
+
+    def _open(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        self._ensure_fts(conn)
+        return conn
+
+    def _fts_schema(self, conn):
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'log_fts'").fetchone()
+        return row["sql"] if row is not None else None
+
+    def _ensure_fts(self, conn):
+        """创建FTS5表；已有的表结构不同(旧版本的无内容表不能删除词条)时清空索引重建"""
+        if self._fts_schema(conn) == FTS_SCHEMA:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 其他进程可能已经完成了迁移
+            existing = self._fts_schema(conn)
+            if existing != FTS_SCHEMA:
+                if existing is not None:
+                    logger.info("日志全文索引结构已变化，重新建立索引")
+                    conn.execute("DROP TABLE log_fts")
+                    conn.execute("DELETE FROM log_lines")
+                    conn.execute("DELETE FROM log_files")
+                conn.execute(FTS_SCHEMA)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _log_files(self):
+        if not self.logs_dir.exists():
+            return {}
+        files = {}
+        for pattern in LOG_PATTERNS:
+            for path in self.logs_dir.glob(pattern):
+                if path.name.endswith(SKIPPED_SUFFIXES):
+                    continue
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                files[str(path)] = stat
+        return files
+
+    def sync(self, blocking=True):
+        """索引所有日志文件新追加的内容，返回新索引的行数；blocking为False且已有同步在进行时返回None"""
+        if not self._sync_lock.acquire(blocking):
+            return None
+        try:
+            started = time.perf_counter()
+            files = self._log_files()
+            self._forget_missing(files)
+            indexed = 0
+            for path, stat in files.items():
+                try:
+                    indexed += self._index_file(path, stat)
+                except OSError as e:
+                    logger.warning(f"索引日志文件 {path} 失败: {e}")
+            observe_scan("log_index", self.logs_dir, started, len(files))
+            if indexed:
+                logger.info(f"日志索引已更新: 新增 {indexed} 行")
+            return indexed
+        finally:
+            self._sync_lock.release()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _forget_missing(self, files):
+        """删除已不存在的文件的索引，轮转改名的文件(同一inode出现在新路径)只更新路径"""
+        by_inode = {stat.st_ino: path for path, stat in files.items()}
+        with self._transaction():
+            moved = []
+            for row in self._conn.execute("SELECT id, path, inode FROM log_files").fetchall():
+                stat = files.get(row["path"])
+                if stat is not None and stat.st_ino == row["inode"]:
+                    continue
+                target = by_inode.get(row["inode"])
+                if target is not None:
+                    # 先改为临时路径，避免与同一次轮转中其他文件的原路径冲突
+                    self._conn.execute("UPDATE log_files SET path = ? WHERE id = ?", (f":rotating:{row['id']}", row["id"]))
+                    moved.append((target, row["id"]))
+                else:
+                    self._drop_lines(row["id"])
+                    self._conn.execute("DELETE FROM log_files WHERE id = ?", (row["id"],))
+            self._conn.executemany("UPDATE log_files SET path = ? WHERE id = ?", moved)
+
+    def _drop_lines(self, file_id):
+        self._conn.execute("DELETE FROM log_fts WHERE rowid IN (SELECT id FROM log_lines WHERE file_id = ?)", (file_id,))
+        self._conn.execute("DELETE FROM log_lines WHERE file_id = ?", (file_id,))
+
+    def _file_state(self, path, stat, f):
+        """读取文件的索引状态，文件已被截断或重写时清空该文件的索引"""
+        row = self._conn.execute("SELECT * FROM log_files WHERE path = ?", (path,)).fetchone()
+        if row is not None:
+            offset = row["indexed_bytes"]
+            rewritten = row["inode"] != stat.st_ino or stat.st_size < offset
+            if not rewritten and row["fingerprint"]:
+                f.seek(offset - len(row["fingerprint"]))
+                rewritten = f.read(len(row["fingerprint"])) != row["fingerprint"]
+            if not rewritten:
+                return row
+            logger.info(f"日志文件 {path} 已被重写，重新建立索引")
+            self._drop_lines(row["id"])
+            self._conn.execute("DELETE FROM log_files WHERE id = ?", (row["id"],))
+        cursor = self._conn.execute(
+            "INSERT INTO log_files (path, inode, indexed_bytes, fingerprint, encoding, last_ts, last_level) "
+            "VALUES (?, ?, 0, ?, NULL, 0, NULL)",
+            (path, stat.st_ino, b""),
+        )
+        return self._conn.execute("SELECT * FROM log_files WHERE id = ?", (cursor.lastrowid,)).fetchone()
+
+    def _read_lines(self, f, offset, size):
+        """从offset读取不超过chunk_size的完整行(单行超过chunk_size时读到行尾)"""
+        f.seek(offset)
+        data = f.read(min(self.chunk_size, size - offset))
+        end = data.rfind(b"\n")
+        while end < 0 and offset + len(data) < size:
+            more = f.read(min(self.chunk_size, size - offset - len(data)))
+            if not more:
+                break
+            data += more
+            end = data.rfind(b"\n")
+        # 末尾不完整的行留到写完后再索引
+        return data[:end + 1] if end >= 0 else b""
+
+    def _index_file(self, path, stat):
+        """按块索引单个文件追加的完整行，每块一个事务，多进程同时同步时按文件状态接续"""
+        indexed = 0
+        with open(path, "rb") as f:
+            while True:
+                with self._transaction():
+                    state = self._file_state(path, stat, f)
+                    offset = state["indexed_bytes"]
+                    data = self._read_lines(f, offset, stat.st_size) if stat.st_size > offset else b""
+                    if data:
+                        indexed += self._index_chunk(state, offset, data)
+                if not data:
+                    return indexed
+
+    def _index_chunk(self, state, offset, data):
+        encoding = state["encoding"] or detect_encoding(data)
+        decode_as = encoding or ENCODINGS[0]
+        parser = _LineParser(state["last_ts"], state["last_level"])
+        next_id = self._conn.execute(
+            "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'log_lines'), 0)"
+        ).fetchone()[0] + 1
+
+        lines = []
+        bodies = []
+        position = offset
+        for raw in data.split(b"\n")[:-1]:
+            length = len(raw) + 1
+            raw = raw.rstrip(b"\r")
+            if raw.strip():
+                text = raw.decode(decode_as, errors="replace")
+                ts, level, message = parser.parse(raw, text)
+                lines.append((next_id, state["id"], position, len(raw), ts, level))
+                bodies.append((next_id, " ".join(tokenize(message))))
+                next_id += 1
+            position += length
+
+        self._conn.executemany("INSERT INTO log_lines VALUES (?, ?, ?, ?, ?, ?)", lines)
+        self._conn.executemany("INSERT INTO log_fts (rowid, body) VALUES (?, ?)", bodies)
+        self._conn.execute(
+            "UPDATE log_files SET indexed_bytes = ?, fingerprint = ?, encoding = ?, last_ts = ?, last_level = ? "
+            "WHERE id = ?",
+            (position, data[-FINGERPRINT_SIZE:], encoding, parser.last_ts, parser.last_level, state["id"]),
+        )
+        return len(lines)
+
+    def search(self, q=None, levels=None, start_time=None, end_time=None, limit=100, cursor=None, descending=True,
+               with_total=None):
+        """按关键词、级别和时间范围查询日志行，按时间排序分页，命中的行按偏移从原文件读取
+
+        匹配总数需要对全部命中行计数，默认只在第一页(没有游标时)计算，其余页total为None。
+        """
+        if with_total is None:
+            with_total = not cursor
+        conditions = []
+        params = []
+        match = build_match(q)
+        if match:
+            conditions.append("l.id IN (SELECT rowid FROM log_fts WHERE log_fts MATCH ?)")
+            params.append(match)
+        if levels:
+            conditions.append(f"l.level IN ({', '.join('?' * len(levels))})")
+            params.extend(levels)
+        if start_time is not None:
+            conditions.append("l.ts >= ?")
+            params.append(start_time.timestamp())
+        if end_time is not None:
+            conditions.append("l.ts <= ?")
+            params.append(end_time.timestamp())
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        page_conditions = list(conditions)
+        page_params = list(params)
+        if cursor:
+            cursor_ts, cursor_id = decode_cursor(cursor)
+            try:
+                cursor_id = int(cursor_id)
+            except ValueError:
+                raise ValueError(f"无效的分页游标: {cursor}")
+            op = "<" if descending else ">"
+            page_conditions.append(f"(l.ts {op} ? OR (l.ts = ? AND l.id {op} ?))")
+            page_params.extend([cursor_ts, cursor_ts, cursor_id])
+        page_where = f"WHERE {' AND '.join(page_conditions)}" if page_conditions else ""
+        direction = "DESC" if descending else "ASC"
+
+        with self._lock:
+            total = None
+            if with_total:
+                total = self._conn.execute(f"SELECT COUNT(*) FROM log_lines l {where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT l.*, f.path, f.encoding FROM log_lines l JOIN log_files f ON f.id = l.file_id "
+                f"{page_where} ORDER BY l.ts {direction}, l.id {direction} LIMIT ?",
+                page_params + [limit],
+            ).fetchall()
+
+        texts = self._read_rows(rows)
+        logs = [
+            {
+                "file": os.path.basename(row["path"]),
+                "offset": row["byte_offset"],
+                "time": datetime.fromtimestamp(row["ts"]).isoformat() if row["ts"] else None,
+                "level": row["level"],
+                "line": texts.get(row["id"], ""),
+            }
+            for row in rows
+        ]
+        next_cursor = None
+        if len(rows) == limit:
+            last = rows[-1]
+            next_cursor = encode_cursor(last["ts"], last["id"])
+        return {"logs": logs, "total": total, "next_cursor": next_cursor}
+
+    @staticmethod
+    def _read_rows(rows):
+        """按文件分组，按偏移顺序读取命中的行"""
+        by_file = {}
+        for row in rows:
+            by_file.setdefault(row["path"], []).append(row)
+        texts = {}
+        for path, file_rows in by_file.items():
+            encoding = file_rows[0]["encoding"] or ENCODINGS[0]
+            try:
+                with open(path, "rb") as f:
+                    for row in sorted(file_rows, key=lambda r: r["byte_offset"]):
+                        f.seek(row["byte_offset"])
+                        texts[row["id"]] = f.read(row["length"]).decode(encoding, errors="replace")
+            except OSError as e:
+                logger.warning(f"读取日志文件 {path} 失败: {e}")
+        return texts
+
+    def stats(self):
+        """已索引的文件数、行数和待索引的字节数"""
+        with self._lock:
+            rows = self._conn.execute("SELECT path, indexed_bytes FROM log_files").fetchall()
+            lines = self._conn.execute("SELECT COUNT(*) FROM log_lines").fetchone()[0]
+        pending = 0
+        for row in rows:
+            try:
+                pending += max(0, os.path.getsize(row["path"]) - row["indexed_bytes"])
+            except OSError:
+                continue
+        return {
+            "files": len(rows),
+            "lines": lines,
+            "indexed_bytes": sum(row["indexed_bytes"] for row in rows),
+            "pending_bytes": pending,
+        }
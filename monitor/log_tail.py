@@ -0,0 +1,159 @@
+"""日志尾部读取 - 从文件末尾按块倒读，并记录偏移量只读取追加内容"""
+
+import logging
+import os
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 64 * 1024
+# 追加内容超过该大小时不再顺序读取，直接从末尾倒读
+MAX_APPEND_READ = 4 * 1024 * 1024
+# 记录偏移量之前的若干字节，用于识别文件被截断后重写(copytruncate)
+FINGERPRINT_SIZE = 64
+DEFAULT_KEEP_LINES = 200
+ENCODINGS = ("utf-8", "gbk")
+
+
+class _FileState:
+    """单个日志文件的读取状态"""
+
+    def __init__(self, inode, encoding, keep_lines):
+        self.inode = inode
+        self.encoding = encoding or ENCODINGS[0]
+        # 纯ASCII内容无法区分编码，出现非ASCII字节后才确定
+        self.encoding_detected = encoding is not None
+        self.offset = 0
+        self.fingerprint = b""
+        self.lines = deque(maxlen=keep_lines)
+        self.partial = b""
+        # 已保留的行是否包含了文件开头(即文件总行数不超过保留数量)
+        self.complete = False
+
+
+def detect_encoding(data):
+    """检测日志编码，utf-8失败时退回gbk，纯ASCII时返回None"""
+    if data.isascii():
+        return None
+    for encoding in ENCODINGS:
+        try:
+            data.decode(encoding)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return ENCODINGS[-1]
+
+
+class LogTailer:
+    """按文件记录读取偏移的日志尾部读取器
+
+    首次读取从EOF按块倒读到足够的行数，之后只读取新追加的字节，
+    内存和耗时只与请求的行数有关，与文件大小无关。
+    """
+
+    def __init__(self, block_size=BLOCK_SIZE, keep_lines=DEFAULT_KEEP_LINES):
+        self.block_size = block_size
+        self.keep_lines = keep_lines
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def tail(self, path, limit):
+        """返回文件最后limit行(已去除首尾空白)"""
+        if limit <= 0:
+            return []
+        path = str(path)
+        with self._lock:
+            state = self._refresh(path, limit)
+            lines = list(state.lines)
+            if state.partial:
+                encoding = state.encoding
+                if not state.encoding_detected:
+                    encoding = detect_encoding(state.partial) or encoding
+                lines.append(self._decode(state.partial, encoding))
+        return [line.strip() for line in lines[-limit:]]
+
+    def last_line(self, path):
+        """返回文件最后一行，文件为空时返回None"""
+        lines = self.tail(path, 1)
+        return lines[0] if lines else None
+
+    def forget(self, path):
+        """丢弃文件的读取状态"""
+        with self._lock:
+            self._states.pop(str(path), None)
+
+    @staticmethod
+    def _decode(data, encoding):
+        return data.decode(encoding, errors="replace")
+
+    def _refresh(self, path, limit):
+        stat = os.stat(path)
+        state = self._states.get(path)
+        keep_lines = max(limit, self.keep_lines)
+        if (
+            state is None
+            or state.inode != stat.st_ino
+            or stat.st_size < state.offset
+            or stat.st_size - state.offset > MAX_APPEND_READ
+            or (stat.st_size > state.offset and not self._read_appended(path, state, stat.st_size))
+            or (limit > len(state.lines) + (1 if state.partial else 0) and not state.complete)
+        ):
+            state = self._read_backward(path, stat, keep_lines)
+            self._states[path] = state
+        return state
+
+    def _read_backward(self, path, stat, keep_lines):
+        """从文件末尾按块倒读，直到凑够keep_lines行或读到文件开头"""
+        size = stat.st_size
+        chunks = []
+        newlines = 0
+        position = size
+        with open(path, "rb") as f:
+            while position > 0 and newlines <= keep_lines:
+                read_size = min(self.block_size, position)
+                position -= read_size
+                f.seek(position)
+                chunk = f.read(read_size)
+                newlines += chunk.count(b"\n")
+                chunks.append(chunk)
+        data = b"".join(reversed(chunks))
+
+        raw_lines = data.split(b"\n")
+        partial = raw_lines.pop()
+        if position > 0 and raw_lines:
+            # 第一行可能是从行中间开始读的，丢弃
+            raw_lines.pop(0)
+
+        encoding = detect_encoding(b"\n".join(raw_lines[-keep_lines:]) + partial)
+        state = _FileState(stat.st_ino, encoding, keep_lines)
+        # 纯ASCII内容未检测出编码，按默认编码解码
+        state.lines.extend(self._decode(line, state.encoding) for line in raw_lines[-keep_lines:])
+        state.partial = partial
+        state.offset = size
+        state.fingerprint = data[-FINGERPRINT_SIZE:]
+        state.complete = position == 0 and len(raw_lines) <= keep_lines
+        return state
+
+    def _read_appended(self, path, state, size):
+        """只读取上次偏移之后追加的字节，文件已被重写时返回False"""
+        start = state.offset - len(state.fingerprint)
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(size - start)
+        if not data.startswith(state.fingerprint):
+            return False
+        data = data[len(state.fingerprint):]
+        state.fingerprint = (state.fingerprint + data)[-FINGERPRINT_SIZE:]
+        state.offset += len(data)
+        raw_lines = (state.partial + data).split(b"\n")
+        state.partial = raw_lines.pop()
+        if not state.encoding_detected and raw_lines:
+            encoding = detect_encoding(b"\n".join(raw_lines))
+            if encoding is not None:
+                state.encoding = encoding
+                state.encoding_detected = True
+        if raw_lines and len(state.lines) + len(raw_lines) > state.lines.maxlen:
+            state.complete = False
+        state.lines.extend(self._decode(line, state.encoding) for line in raw_lines)
+        return True
@@ -0,0 +1,247 @@
+"""Prometheus格式的运行指标 - 计数器、仪表和直方图，按文本格式导出
+
+只依赖标准库。每个指标用一把锁保护按标签组合存放的数值，
+记录一次观测只做一次二分查找和几次加法，可以在生产环境常开。
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+# Response 会为 text/* 类型补上 charset=utf-8
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# 秒级延迟的默认分桶: 1ms ~ 60s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 推理调用耗时较长
+INFERENCE_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """导出Prometheus文本格式"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Counter:
+    """只增不减的计数器"""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class Gauge:
+    """仪表，可直接设置数值，也可以在导出时调用collect()获取 {标签元组: 数值}"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), collect=None, registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        if self.collect is not None:
+            try:
+                values.update(self.collect())
+            except Exception:
+                # 导出指标不能因为某个数据源出错而失败
+                pass
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(values.items())
+        ]
+
+
+class Histogram:
+    """累积分桶直方图"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._data = {}  # 标签元组 -> [各分桶计数..., +Inf计数, 总和]
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._data.get(labels)
+            if data is None:
+                data = self._data[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            data[index] += 1
+            data[-1] += value
+
+    def time(self, *labels):
+        """计时上下文"""
+        return _Timer(self, labels)
+
+    def count(self, *labels):
+        with self._lock:
+            data = self._data.get(labels)
+            return sum(data[:-1]) if data else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, list(data)) for labels, data in self._data.items())
+        lines = []
+        for labels, data in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), data[:-1]):
+                cumulative += count
+                le = _format_value(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', le))} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(data[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+class MetricsMiddleware:
+    """ASGI中间件: 按路由模板统计HTTP请求数和延迟(到响应体发送完毕为止)
+
+    路由标签取路由模板(如 /api/tasks/{task_id})而不是实际路径，避免标签数量无限增长；
+    未匹配任何路由的请求(静态文件、404)记为 other。
+    """
+
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "other"
+            HTTP_REQUESTS.inc(scope["method"], route, str(status[0]))
+            HTTP_LATENCY.observe(time.perf_counter() - started, scope["method"], route)
+
+
+HTTP_REQUESTS = Counter("monitor_http_requests_total", "HTTP请求数", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("monitor_http_request_duration_seconds", "HTTP请求耗时", ("method", "route"))
+CACHE_REQUESTS = Counter(
+    "monitor_cache_requests_total",
+    "接口缓存查询次数，result为hit/miss/coalesced(等待进行中的计算)/stale(返回旧值并后台重建)",
+    ("family", "result"),
+)
+CACHE_REFRESHES = Counter(
+    "monitor_cache_refreshes_total", "后台刷新次数，result为rebuild(重建)/revalidate(数据来源未变，延长有效期)",
+    ("family", "result"),
+)
+DIRECTORY_SCAN_SECONDS = Histogram(
+    "monitor_directory_scan_duration_seconds", "目录扫描耗时", ("scanner", "directory")
+)
+DIRECTORY_FILES = Gauge("monitor_directory_files", "最近一次扫描的文件数", ("scanner", "directory"))
+THUMBNAIL_SECONDS = Histogram("monitor_thumbnail_render_duration_seconds", "缩略图生成耗时(含排队)", ("format",))
+INFERENCE_SECONDS = Histogram(
+    "monitor_inference_request_duration_seconds", "推理服务调用耗时(含重试)", ("outcome",), buckets=INFERENCE_BUCKETS
+)
+INFERENCE_FAILURES = Counter("monitor_inference_failures_total", "推理服务调用失败次数", ("reason",))
+DETECTION_JOBS = Counter("monitor_detection_jobs_total", "检测任务结束次数", ("status",))
+EVENT_LOOP_LAG = Histogram("monitor_event_loop_lag_seconds", "事件循环延迟(实际唤醒时间与预期的差值)")
+
+
+def observe_scan(scanner, directory, started, file_count):
+    """记录一次目录扫描"""
+    directory = str(directory).rstrip("/").rsplit("/", 1)[-1]
+    DIRECTORY_SCAN_SECONDS.observe(time.perf_counter() - started, scanner, directory)
+    DIRECTORY_FILES.set(file_count, scanner, directory)
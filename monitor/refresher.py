@@ -0,0 +1,197 @@
+"""缓存后台刷新 - 在条目过期前重建，读取方在重建期间拿到上一次的结果(stale-while-revalidate)"""
+
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _Tracked:
+    __slots__ = ("compute", "last_access", "interval", "next_check", "signature", "due",
+                 "rebuilt_at", "refreshed_at", "rebuilds", "revalidations", "failures")
+
+    def __init__(self, compute, interval):
+        self.compute = compute
+        self.last_access = time.monotonic()
+        self.interval = interval
+        self.next_check = time.monotonic() + interval
+        self.signature = None
+        self.due = False
+        self.rebuilt_at = time.monotonic()
+        self.refreshed_at = None
+        self.rebuilds = 0
+        self.revalidations = 0
+        self.failures = 0
+
+
+class CacheRefresher:
+    """后台刷新最近被请求过的缓存键
+
+    每个键按间隔检查数据来源目录的签名(目录和日志文件的mtime/大小):
+    签名未变时只延长缓存条目的有效期(revalidate)并把检查间隔加倍，
+    签名变化时重建条目并把间隔减半，间隔限制在 [ttl*min_ratio, ttl*max_ratio]，
+    保证仍被请求的条目在过期前得到刷新。签名覆盖不到原地改写的文件，
+    距上次重建超过 ttl*rebuild_ratio 时无论签名是否变化都重建。
+    超过idle_timeout秒没有请求的键停止刷新，再次被请求时恢复。
+
+    refresh(key, compute) 为重建协程，revalidate(key) 延长条目有效期，
+    signature(key) 返回数据来源的签名(在io_runner中执行)，ttl(key) 返回过期秒数，
+    periodic() 为False时(例如目录监听运行中，缓存由文件事件失效)只处理 trigger 触发的重建。
+    """
+
+    def __init__(self, refresh, revalidate, signature, ttl, io_runner, periodic=lambda: True,
+                 idle_timeout=120, min_ratio=0.25, max_ratio=0.8, rebuild_ratio=5, tick=1.0):
+        self.refresh = refresh
+        self.revalidate = revalidate
+        self.signature = signature
+        self.ttl = ttl
+        self.io_runner = io_runner
+        self.periodic = periodic
+        self.idle_timeout = idle_timeout
+        self.min_ratio = min_ratio
+        self.max_ratio = max_ratio
+        self.rebuild_ratio = rebuild_ratio
+        self.tick = tick
+        self._tracked = {}
+        self._running = {}  # 键 -> 正在进行的后台刷新任务
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wake = None
+        self._task = None
+
+    def _bounds(self, key):
+        ttl = self.ttl(key)
+        return ttl * self.min_ratio, ttl * self.max_ratio
+
+    def track(self, key, compute):
+        """记录一次请求，首次请求的键开始后台刷新"""
+        with self._lock:
+            tracked = self._tracked.get(key)
+            if tracked is None:
+                self._tracked[key] = _Tracked(compute, self._bounds(key)[1])
+            else:
+                tracked.compute = compute
+                tracked.last_access = time.monotonic()
+
+    def trigger(self, key):
+        """立即在后台重建指定的键(已有刷新在进行时忽略)"""
+        if self._loop is None or key in self._running:
+            return
+        with self._lock:
+            tracked = self._tracked.get(key)
+        if tracked is not None:
+            self._spawn(key, self._rebuild(key, tracked))
+
+    def trigger_prefixes(self, *prefixes):
+        """按键前缀标记需要重建，可在其他线程(文件监听线程)中调用"""
+        with self._lock:
+            for key, tracked in self._tracked.items():
+                if key.startswith(prefixes):
+                    tracked.due = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _spawn(self, key, coro):
+        task = self._loop.create_task(coro)
+        self._running[key] = task
+        task.add_done_callback(lambda _: self._running.pop(key, None))
+
+    async def _signature(self, key):
+        try:
+            return await self.io_runner(self.signature, key)
+        except Exception as e:
+            logger.warning(f"读取缓存 {key} 的数据来源签名失败: {e}")
+            return None
+
+    async def _rebuild(self, key, tracked, signature=None):
+        # 签名在重建之前读取，重建期间发生的变化留给下一次检查
+        if signature is None:
+            signature = await self._signature(key)
+        try:
+            await self.refresh(key, tracked.compute)
+        except Exception as e:
+            tracked.failures += 1
+            logger.warning(f"后台刷新缓存 {key} 失败: {e}")
+            return
+        tracked.signature = signature
+        tracked.rebuilt_at = time.monotonic()
+        tracked.rebuilds += 1
+        tracked.refreshed_at = time.time()
+
+    async def _check(self, key, tracked):
+        """按目录签名决定重建还是延长有效期，并调整检查间隔"""
+        low, high = self._bounds(key)
+        try:
+            signature = await self._signature(key)
+            expired = time.monotonic() - tracked.rebuilt_at > self.ttl(key) * self.rebuild_ratio
+            unchanged = signature is not None and signature == tracked.signature
+            if unchanged:
+                tracked.interval = min(tracked.interval * 2, high)
+                if not expired and await self.io_runner(self.revalidate, key):
+                    tracked.revalidations += 1
+                    tracked.refreshed_at = time.time()
+                    return
+            else:
+                tracked.interval = max(tracked.interval / 2, low)
+            await self._rebuild(key, tracked, signature)
+        finally:
+            tracked.next_check = time.monotonic() + tracked.interval
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.tick)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            now = time.monotonic()
+            periodic = self.periodic()
+            with self._lock:
+                for key in [k for k, t in self._tracked.items() if now - t.last_access > self.idle_timeout]:
+                    # 长时间没有请求，停止刷新
+                    del self._tracked[key]
+                items = list(self._tracked.items())
+            for key, tracked in items:
+                if key in self._running:
+                    continue
+                if tracked.due:
+                    tracked.due = False
+                    self._spawn(key, self._rebuild(key, tracked))
+                elif periodic and now >= tracked.next_check:
+                    self._spawn(key, self._check(key, tracked))
+
+    def start(self):
+        """在当前事件循环中启动刷新任务"""
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        """停止刷新任务"""
+        tasks = [t for t in [self._task, *self._running.values()] if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._loop = None
+        self._running.clear()
+
+    def stats(self):
+        """各键的刷新状态"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                key: {
+                    "interval": round(tracked.interval, 2),
+                    "idle_seconds": round(now - tracked.last_access, 1),
+                    "refreshing": key in self._running,
+                    "refreshed_at": tracked.refreshed_at,
+                    "rebuilds": tracked.rebuilds,
+                    "revalidations": tracked.revalidations,
+                    "failures": tracked.failures,
+                }
+                for key, tracked in self._tracked.items()
+            }
@@ -0,0 +1,106 @@
+"""JSON响应编码 - orjson快速序列化(保留中文)、内容ETag、gzip/brotli压缩"""
+
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:  # 未安装时退回标准库json
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli可选，未安装时只使用gzip
+    brotli = None
+
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+COMPRESSED_MEMO_SIZE = 64
+
+
+def dumps(data):
+    """序列化为UTF-8字节，中文不转义"""
+    if orjson is not None:
+        return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, default=str, separators=(",", ":")).encode("utf-8")
+
+
+def make_etag(*parts):
+    """由内容或版本信息生成强ETag"""
+    hasher = hashlib.blake2b(digest_size=12)
+    for part in parts:
+        hasher.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        hasher.update(b"\0")
+    return f'"{hasher.hexdigest()}"'
+
+
+def encoding_etag(etag, encoding):
+    """不同内容编码的表示使用不同的强ETag，在引号内追加编码后缀"""
+    if encoding is None:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def negotiate_encoding(accept_encoding):
+    """按Accept-Encoding选择压缩方式，优先brotli"""
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class EncodedJSON:
+    """序列化后的响应体和ETag，压缩结果按 (ETag, 压缩方式) 在进程内缓存"""
+
+    _memo = OrderedDict()
+    _memo_lock = threading.Lock()
+
+    def __init__(self, body, etag=None):
+        self.body = body
+        self.etag = etag or make_etag(body)
+
+    @classmethod
+    def encode(cls, data):
+        return cls(dumps(data))
+
+    def to_cache(self):
+        """可写入共享缓存后端的形式"""
+        return {"etag": self.etag, "body": self.body.decode("utf-8")}
+
+    @classmethod
+    def from_cache(cls, entry):
+        return cls(entry["body"].encode("utf-8"), entry["etag"])
+
+    def should_compress(self, encoding):
+        return encoding is not None and len(self.body) >= COMPRESS_MIN_BYTES
+
+    def compressed(self, encoding):
+        """压缩后的响应体"""
+        key = (self.etag, encoding)
+        with self._memo_lock:
+            data = self._memo.get(key)
+            if data is not None:
+                self._memo.move_to_end(key)
+                return data
+        if encoding == "br":
+            data = brotli.compress(self.body, quality=BROTLI_QUALITY)
+        else:
+            data = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+        with self._memo_lock:
+            self._memo[key] = data
+            while len(self._memo) > COMPRESSED_MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return data
@@ -0,0 +1,188 @@
+"""检测结果缓存 - 按图片内容哈希和规范化的检测参数寻址，重复检测直接返回结果"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+HASH_READ_SIZE = 1024 * 1024
+
+
+def hash_fileobj(fileobj):
+    """计算文件对象的SHA-256，读取后回到开头"""
+    hasher = hashlib.sha256()
+    fileobj.seek(0)
+    for data in iter(lambda: fileobj.read(HASH_READ_SIZE), b""):
+        hasher.update(data)
+    fileobj.seek(0)
+    return hasher.hexdigest()
+
+
+def normalize_params(categories, is_change_detection, is_only_change_detection, legend_required):
+    """规范化检测参数，类别顺序和重复项不影响结果"""
+    if isinstance(categories, str):
+        categories = [categories]
+    return {
+        "categories": sorted(set(str(c) for c in categories or [])),
+        "is_change_detection": bool(is_change_detection),
+        "is_only_change_detection": bool(is_only_change_detection),
+        "legend_required": bool(legend_required),
+    }
+
+
+def result_cache_key(image_sha256, params):
+    """由图片哈希和规范化参数计算缓存键"""
+    raw = image_sha256 + "|" + json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DetectionResultCache:
+    """检测结果磁盘缓存
+
+    每个条目是目录 cache_dir/{key}/，包含 result.json 和结果图片副本
+    (同一文件系统上使用硬链接)；总大小超过max_bytes时淘汰最久未使用的条目。
+    """
+
+    def __init__(self, cache_dir, images_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.images_dir = images_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # 缓存键 -> 字节数，按最近使用排序
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.saved_ms = 0.0
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        existing = []
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if not entry.is_dir():
+                    continue
+                meta_path = os.path.join(entry.path, "result.json")
+                if not os.path.exists(meta_path):
+                    # 写入中断留下的不完整条目
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                existing.append((os.stat(meta_path).st_mtime, entry.name, self._dir_size(entry.path)))
+        for _, key, entry_size in sorted(existing):
+            self._entries[key] = entry_size
+            self._total_bytes += entry_size
+        self._evict()
+
+    @staticmethod
+    def _dir_size(path):
+        with os.scandir(path) as it:
+            return sum(entry.stat().st_size for entry in it if entry.is_file())
+
+    def _entry_dir(self, key):
+        return self.cache_dir / key
+
+    def lookup(self, key):
+        """查找缓存的检测结果，命中时确保结果图片仍在结果目录中"""
+        entry_dir = self._entry_dir(key)
+        meta_path = entry_dir / "result.json"
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            elif meta_path.exists():
+                # 其他工作进程写入的条目
+                entry_size = self._dir_size(entry_dir)
+                self._entries[key] = entry_size
+                self._total_bytes += entry_size
+            else:
+                self.misses += 1
+                return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            for filename in cached["response"].get("result_images", []):
+                target = self.images_dir / filename
+                if not target.exists():
+                    # 结果图片已被清理，从缓存恢复
+                    self._link_or_copy(entry_dir / filename, target)
+            # 更新mtime以便重启后恢复LRU顺序
+            os.utime(meta_path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"检测结果缓存条目 {key} 不可用: {e}")
+            with self._lock:
+                self._total_bytes -= self._entries.pop(key, 0)
+                self.misses += 1
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+        with self._lock:
+            self.hits += 1
+            self.saved_ms += cached.get("run_ms") or 0.0
+        return cached["response"]
+
+    @staticmethod
+    def _link_or_copy(source, target):
+        tmp_path = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+
+    def store(self, key, response, image_sha256, params, run_ms=None):
+        """保存检测结果和结果图片"""
+        entry_dir = self._entry_dir(key)
+        tmp_dir = self.cache_dir / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        try:
+            for filename in response.get("result_images", []):
+                self._link_or_copy(self.images_dir / filename, tmp_dir / filename)
+            with open(tmp_dir / "result.json", "w", encoding="utf-8") as f:
+                json.dump({
+                    "key": key,
+                    "image_sha256": image_sha256,
+                    "params": params,
+                    "run_ms": run_ms,
+                    "created_at": time.time(),
+                    "response": response,
+                }, f, ensure_ascii=False)
+            entry_size = self._dir_size(tmp_dir)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        with self._lock:
+            self._total_bytes += entry_size - self._entries.pop(key, 0)
+            self._entries[key] = entry_size
+            self.stores += 1
+            self._evict()
+
+    def _evict(self):
+        """超出字节预算时淘汰最久未使用的条目(调用方持有锁)"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, entry_size = self._entries.popitem(last=False)
+            self._total_bytes -= entry_size
+            self.evictions += 1
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "saved_inference_seconds": round(self.saved_ms / 1000, 1),
+            }
@@ -0,0 +1,385 @@
+"""推理结果索引 - 使用SQLite持久化结果文件摘要，按mtime/size增量更新"""
+
+import base64
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from monitor.metrics import observe_scan
+
+logger = logging.getLogger(__name__)
+
+# 历史记录摘要字段: 返回字段名 -> 结果JSON中的字段名
+SUMMARY_FIELDS = {
+    "异常区域": "异常区域检测",
+    "水利设施": "重点水利设施检测",
+    "地物分类": "地物分类",
+    "水体提取": "水体自动提取",
+}
+RESULT_PREFIX = "detect_result_"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    task_ts REAL NOT NULL,
+    ctime REAL NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    timestamp_str TEXT,
+    summary TEXT NOT NULL,
+    image_files TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_order ON results (ctime DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_results_task_ts ON results (task_ts);
+CREATE TABLE IF NOT EXISTS rollups (
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    tasks INTEGER NOT NULL,
+    images INTEGER NOT NULL,
+    PRIMARY KEY (period, bucket)
+);
+"""
+
+# 汇总表由触发器随结果行的增删改维护: period为 all(总计) / hour / day，bucket为本地时间
+ROLLUP_BUCKETS = {
+    "all": "''",
+    "hour": "strftime('%Y-%m-%dT%H:00:00', {row}.task_ts, 'unixepoch', 'localtime')",
+    "day": "strftime('%Y-%m-%d', {row}.task_ts, 'unixepoch', 'localtime')",
+}
+
+
+def _rollup_upsert(row, sign):
+    values = ", ".join(
+        f"('{period}', {bucket.format(row=row)}, {sign}1, {sign}json_array_length({row}.image_files))"
+        for period, bucket in ROLLUP_BUCKETS.items()
+    )
+    return (
+        f"INSERT INTO rollups (period, bucket, tasks, images) VALUES {values} "
+        "ON CONFLICT (period, bucket) DO UPDATE SET "
+        "tasks = tasks + excluded.tasks, images = images + excluded.images;"
+    )
+
+
+def _rollup_prune(row):
+    """删除任务数归零的小时/天汇总行"""
+    buckets = " OR ".join(
+        f"(period = '{period}' AND bucket = {bucket.format(row=row)})"
+        for period, bucket in ROLLUP_BUCKETS.items() if period != "all"
+    )
+    return f"DELETE FROM rollups WHERE tasks <= 0 AND ({buckets});"
+
+
+ROLLUP_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS results_rollup_insert AFTER INSERT ON results BEGIN
+    {_rollup_upsert("NEW", "")}
+END;
+CREATE TRIGGER IF NOT EXISTS results_rollup_delete AFTER DELETE ON results BEGIN
+    {_rollup_upsert("OLD", "-")}
+    {_rollup_prune("OLD")}
+END;
+CREATE TRIGGER IF NOT EXISTS results_rollup_update AFTER UPDATE OF task_ts, image_files ON results BEGIN
+    {_rollup_upsert("OLD", "-")}
+    {_rollup_upsert("NEW", "")}
+    {_rollup_prune("OLD")}
+END;
+"""
+
+# INSERT OR REPLACE 不会触发删除触发器，更新已有行使用UPSERT
+UPSERT_SQL = """
+INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    path = excluded.path, timestamp = excluded.timestamp, task_ts = excluded.task_ts,
+    ctime = excluded.ctime, mtime_ns = excluded.mtime_ns, size = excluded.size,
+    timestamp_str = excluded.timestamp_str, summary = excluded.summary, image_files = excluded.image_files
+"""
+
+
+def parse_task_time(stem, ctime):
+    """从文件名提取任务时间，失败时使用文件创建时间"""
+    timestamp_str = None
+    if RESULT_PREFIX in stem:
+        timestamp_str = stem.replace(RESULT_PREFIX, "")
+        try:
+            return datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S"), timestamp_str
+        except ValueError:
+            pass
+    return datetime.fromtimestamp(ctime), timestamp_str
+
+
+def encode_cursor(ctime, task_id):
+    """生成分页游标"""
+    raw = json.dumps([ctime, task_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """解析分页游标"""
+    try:
+        ctime, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(ctime), str(task_id)
+    except Exception:
+        raise ValueError(f"无效的分页游标: {cursor}")
+
+
+class ResultIndex:
+    """检测结果JSON文件的磁盘索引
+
+    每次同步只扫描目录元数据，仅重新解析mtime或大小发生变化的文件，
+    历史记录查询直接从索引返回。
+    """
+
+    def __init__(self, db_path, json_dir, image_map):
+        self.db_path = db_path
+        self.json_dir = json_dir
+        self.image_map = image_map
+        self._lock = threading.Lock()
+        # 解析失败的文件，避免在未修改时反复解析: 文件名 -> (mtime_ns, size)
+        self._failed = {}
+        self._open_lock = threading.Lock()
+        # 数据库在第一次使用时才打开，导入模块或创建实例不会生成数据库文件
+        self._connection = None
+
+    @property
+    def _conn(self):
+        if self._connection is None:
+            with self._open_lock:
+                if self._connection is None:
+                    self._connection = self._open()
+        return self._connection
+
+    def _open(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        conn.executescript(ROLLUP_TRIGGERS)
+        conn.commit()
+        self._check_rollups(conn)
+        return conn
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _find_images(self, timestamp_str):
+        """查找同时间戳的图片文件"""
+        return self.image_map.get(timestamp_str)
+
+    def _check_rollups(self, conn):
+        """打开数据库时检查: 汇总表与结果表不一致时(旧版本索引升级)重建汇总"""
+        total = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        row = conn.execute("SELECT tasks FROM rollups WHERE period = 'all'").fetchone()
+        if (row["tasks"] if row else 0) == total:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM rollups")
+        for period, bucket in ROLLUP_BUCKETS.items():
+            bucket = bucket.format(row="results")
+            conn.execute(
+                f"INSERT INTO rollups SELECT '{period}', {bucket}, COUNT(*), "
+                f"COALESCE(SUM(json_array_length(image_files)), 0) FROM results GROUP BY {bucket}"
+            )
+        conn.commit()
+        logger.info(f"结果统计汇总已重建: {total} 个任务")
+
+    def _load_row(self, path, stat):
+        """解析单个结果文件，返回索引行"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        task_id = os.path.basename(path)[:-len(".json")]
+        task_time, timestamp_str = parse_task_time(task_id, stat.st_ctime)
+        summary = {name: data.get(field, {}) for name, field in SUMMARY_FIELDS.items()}
+        return (
+            task_id,
+            path,
+            task_time.isoformat(),
+            task_time.timestamp(),
+            stat.st_ctime,
+            stat.st_mtime_ns,
+            stat.st_size,
+            timestamp_str,
+            json.dumps(summary, ensure_ascii=False),
+            json.dumps(self._find_images(timestamp_str), ensure_ascii=False),
+        )
+
+    def sync(self):
+        """增量同步索引，返回新增/更新/删除的数量"""
+        added = updated = removed = 0
+        self.relink(self.image_map.refresh_if_changed())
+        started = time.perf_counter()
+        if not self.json_dir.exists():
+            with self._lock:
+                removed = self._conn.execute("DELETE FROM results").rowcount
+                self._conn.commit()
+            return {"added": 0, "updated": 0, "removed": removed}
+
+        with self._lock:
+            known = {
+                row["id"]: (row["mtime_ns"], row["size"])
+                for row in self._conn.execute("SELECT id, mtime_ns, size FROM results")
+            }
+
+            rows = []
+            seen = set()
+            with os.scandir(self.json_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith(".json") or not entry.is_file():
+                        continue
+                    task_id = entry.name[:-len(".json")]
+                    seen.add(task_id)
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    signature = (stat.st_mtime_ns, stat.st_size)
+                    if known.get(task_id) == signature or self._failed.get(entry.name) == signature:
+                        continue
+                    try:
+                        rows.append(self._load_row(entry.path, stat))
+                    except Exception as e:
+                        logger.warning(f"解析任务文件 {entry.path} 失败: {e}")
+                        self._failed[entry.name] = signature
+                        continue
+                    self._failed.pop(entry.name, None)
+                    if task_id in known:
+                        updated += 1
+                    else:
+                        added += 1
+
+            stale = [(task_id,) for task_id in known if task_id not in seen]
+            removed = len(stale)
+            if rows:
+                self._conn.executemany(UPSERT_SQL, rows)
+            if stale:
+                self._conn.executemany("DELETE FROM results WHERE id = ?", stale)
+            self._conn.commit()
+        observe_scan("result_index", self.json_dir, started, len(seen))
+
+        if added or updated or removed:
+            logger.info(f"结果索引已更新: 新增 {added}, 更新 {updated}, 删除 {removed}")
+        return {"added": added, "updated": updated, "removed": removed}
+
+    def update_paths(self, paths):
+        """按文件事件更新指定的结果文件，不扫描目录；返回更新和删除的数量"""
+        rows = []
+        stale = []
+        for path in paths:
+            path = str(path)
+            name = os.path.basename(path)
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stale.append((name[:-len(".json")],))
+                continue
+            except OSError:
+                continue
+            try:
+                rows.append(self._load_row(path, stat))
+            except Exception as e:
+                # 文件可能仍在写入，下一次事件或同步时重试
+                logger.warning(f"解析任务文件 {path} 失败: {e}")
+                self._failed[name] = (stat.st_mtime_ns, stat.st_size)
+                continue
+            self._failed.pop(name, None)
+        with self._lock:
+            if rows:
+                self._conn.executemany(UPSERT_SQL, rows)
+            if stale:
+                self._conn.executemany("DELETE FROM results WHERE id = ?", stale)
+            self._conn.commit()
+        return {"updated": len(rows), "removed": len(stale)}
+
+    def relink(self, timestamps):
+        """图片变化后，更新对应时间戳任务关联的图片列表"""
+        if not timestamps:
+            return
+        updates = [
+            (json.dumps(self._find_images(timestamp), ensure_ascii=False), timestamp)
+            for timestamp in timestamps
+        ]
+        with self._lock:
+            self._conn.executemany("UPDATE results SET image_files = ? WHERE timestamp_str = ?", updates)
+            self._conn.commit()
+
+    def query(self, limit=None, offset=0, cursor=None, start_time=None, end_time=None):
+        """按创建时间倒序分页查询历史任务"""
+        conditions = []
+        params = []
+        if start_time is not None:
+            conditions.append("task_ts >= ?")
+            params.append(start_time.timestamp())
+        if end_time is not None:
+            conditions.append("task_ts <= ?")
+            params.append(end_time.timestamp())
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        page_conditions = list(conditions)
+        page_params = list(params)
+        if cursor:
+            cursor_ctime, cursor_id = decode_cursor(cursor)
+            page_conditions.append("(ctime < ? OR (ctime = ? AND id < ?))")
+            page_params.extend([cursor_ctime, cursor_ctime, cursor_id])
+            offset = 0
+        page_where = f"WHERE {' AND '.join(page_conditions)}" if page_conditions else ""
+
+        sql = f"SELECT * FROM results {page_where} ORDER BY ctime DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            page_params.extend([limit, offset])
+        elif offset:
+            sql += " LIMIT -1 OFFSET ?"
+            page_params.append(offset)
+
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM results {where}", params).fetchone()[0]
+            rows = self._conn.execute(sql, page_params).fetchall()
+
+        tasks = [
+            {
+                "id": row["id"],
+                "timestamp": row["timestamp"],
+                "status": "completed",
+                "result_path": row["path"],
+                "image_files": json.loads(row["image_files"]),
+                "summary": json.loads(row["summary"]),
+            }
+            for row in rows
+        ]
+        next_cursor = None
+        if limit is not None and len(rows) == limit:
+            last = rows[-1]
+            next_cursor = encode_cursor(last["ctime"], last["id"])
+        return {"tasks": tasks, "total": total, "next_cursor": next_cursor}
+
+    def counters(self):
+        """任务总数、关联图片总数和最新任务的创建时间，直接读取汇总行"""
+        with self._lock:
+            row = self._conn.execute("SELECT tasks, images FROM rollups WHERE period = 'all'").fetchone()
+            latest = self._conn.execute("SELECT MAX(ctime) FROM results").fetchone()[0]
+        return {
+            "tasks": row["tasks"] if row else 0,
+            "images": row["images"] if row else 0,
+            "latest_ctime": latest,
+        }
+
+    def rollups(self, period, since):
+        """按小时或按天的任务数和关联图片数，since为起始桶(含)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT bucket, tasks, images FROM rollups WHERE period = ? AND bucket >= ? ORDER BY bucket",
+                (period, since),
+            ).fetchall()
+        return {row["bucket"]: {"tasks": row["tasks"], "images": row["images"]} for row in rows}
@@ -0,0 +1,47 @@
+"""请求合并 - 同一键的并发计算只执行一次，其余调用等待并共享结果"""
+
+import asyncio
+
+
+class SingleFlight:
+    """进程内按键合并并发计算
+
+    缓存失效瞬间的并发请求只触发一次重建，其余请求等待同一个计算的结果；
+    计算在不属于任何调用者的任务中执行，任何调用者(包括第一个)被取消都不会取消共享的计算；
+    计算失败时所有等待者收到同一个异常，下一次调用重新计算。
+    """
+
+    def __init__(self):
+        self._inflight = {}  # 键 -> 正在进行的计算任务
+        self.calls = 0
+        self.coalesced = 0
+
+    def __contains__(self, key):
+        return key in self._inflight
+
+    def __len__(self):
+        return len(self._inflight)
+
+    async def do(self, key, compute):
+        """执行 compute() 并返回结果，同一键已有计算在进行时等待其结果"""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.calls += 1
+            task = asyncio.get_running_loop().create_task(self._run(key, compute))
+            # 所有等待者都已取消时避免"异常未被获取"的警告
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        # 调用者被取消时只停止自己的等待
+        return await asyncio.shield(task)
+
+    async def _run(self, key, compute):
+        try:
+            return await compute()
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+    def stats(self):
+        return {"inflight": len(self._inflight), "calls": self.calls, "coalesced": self.coalesced}
@@ -0,0 +1,299 @@
+"""缩略图磁盘缓存 - 按源文件路径/mtime/大小寻址，按字节预算LRU淘汰"""
+
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image, features
+
+from monitor.metrics import THUMBNAIL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# 结果影像可达数亿像素，均来自本地推理服务，关闭PIL的解压炸弹保护
+Image.MAX_IMAGE_PIXELS = None
+
+THUMBNAIL_SIZE = (400, 300)
+THUMBNAIL_QUALITY = 80
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+WEBP_SUPPORTED = features.check("webp")
+HIGH_BIT_MODES = ("I", "I;16", "I;16B", "I;16L", "F")
+WARM_SETTLE_SECONDS = 2.0  # 文件大小在该时间内不再变化才预生成
+WARM_MAX_PENDING = 1000
+
+
+def to_displayable(img, keep_alpha):
+    """转换为可编码为JPEG/WebP的模式，16位/浮点影像按极值拉伸到8位"""
+    if img.mode in HIGH_BIT_MODES:
+        img = img.convert("F") if img.mode == "F" else img.convert("I")
+        low, high = img.getextrema()
+        scale = 255.0 / (high - low) if high > low else 1.0
+        img = img.point(lambda v: (v - low) * scale).convert("L")
+    if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        if keep_alpha:
+            return img
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    return img
+
+
+def render_thumbnail(source_path, fmt, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+    """解码源图片并生成缩略图字节"""
+    pil_format, _ = FORMATS[fmt]
+    with Image.open(source_path) as img:
+        # JPEG源图可直接按缩小后的分辨率解码
+        img.draft("RGB", size)
+        if img.mode in HIGH_BIT_MODES:
+            # 高位深影像不支持LANCZOS缩放，先拉伸到8位
+            img = to_displayable(img, keep_alpha=False)
+        img.thumbnail(size, Image.Resampling.LANCZOS)
+        img = to_displayable(img, keep_alpha=fmt == "webp")
+        buffer = io.BytesIO()
+        img.save(buffer, format=pil_format, quality=quality)
+        return buffer.getvalue()
+
+
+class ThumbnailCache:
+    """内容寻址的缩略图缓存
+
+    缓存键由源文件路径、mtime、大小、缩略图尺寸和格式决定，源文件变化后
+    自动生成新键；缓存总大小超过max_bytes时淘汰最久未使用的缩略图。
+    """
+
+    def __init__(self, cache_dir, max_bytes, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY, runner=None):
+        self.cache_dir = cache_dir
+        # runner(fn, *args) 用于执行图片解码和编码，可替换为进程池
+        self.runner = runner or (lambda fn, *args: fn(*args))
+        self.max_bytes = max_bytes
+        self.size = size
+        self.quality = quality
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # 缓存键 -> 字节数，按最近使用排序
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        existing = []
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    existing.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, file_size in sorted(existing):
+            self._entries[name] = file_size
+            self._total_bytes += file_size
+        self._evict()
+
+    @staticmethod
+    def choose_format(accept_header):
+        """根据Accept头选择输出格式"""
+        if WEBP_SUPPORTED and "image/webp" in (accept_header or ""):
+            return "webp"
+        return "jpeg"
+
+    def cache_key(self, source_path, stat, fmt):
+        """计算缩略图缓存键(同时作为ETag)"""
+        raw = f"{source_path}|{stat.st_mtime_ns}|{stat.st_size}|{self.size[0]}x{self.size[1]}|{self.quality}"
+        return f"{hashlib.sha1(raw.encode('utf-8')).hexdigest()}.{fmt}"
+
+    def _path(self, key):
+        return self.cache_dir / key
+
+    def lookup(self, key):
+        """查找已缓存的缩略图，命中时返回文件路径"""
+        path = self._path(key)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            elif os.path.exists(path):
+                # 其他工作进程生成的缩略图
+                file_size = os.path.getsize(path)
+                self._entries[key] = file_size
+                self._total_bytes += file_size
+            else:
+                return None
+        try:
+            # 更新mtime以便重启后恢复LRU顺序
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._total_bytes -= self._entries.pop(key, 0)
+            return None
+        return path
+
+    def store(self, key, data):
+        """写入缩略图并按预算淘汰旧条目"""
+        path = self._path(key)
+        tmp_path = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+        return path
+
+    def get(self, source_path, fmt):
+        """获取缩略图，返回 (缓存文件路径, 缓存键)"""
+        stat = os.stat(source_path)
+        key = self.cache_key(source_path, stat, fmt)
+        path = self.lookup(key)
+        if path is not None:
+            self.hits += 1
+            return path, key
+        self.misses += 1
+        started = time.perf_counter()
+        data = self.runner(render_thumbnail, source_path, fmt, self.size, self.quality)
+        THUMBNAIL_SECONDS.observe(time.perf_counter() - started, fmt)
+        return self.store(key, data), key
+
+    async def fetch(self, source_path, stat, fmt, io_runner, cpu_runner):
+        """异步获取缩略图，返回 (缓存文件路径, 缓存键)
+
+        查找和写入在io_runner(线程池)中执行，未命中时解码和编码直接交给cpu_runner(进程池)，
+        渲染期间不占用IO线程。
+        """
+        key = self.cache_key(source_path, stat, fmt)
+        path = await io_runner(self.lookup, key)
+        if path is not None:
+            self.hits += 1
+            return path, key
+        self.misses += 1
+        started = time.perf_counter()
+        data = await cpu_runner(render_thumbnail, source_path, fmt, self.size, self.quality)
+        THUMBNAIL_SECONDS.observe(time.perf_counter() - started, fmt)
+        return await io_runner(self.store, key, data), key
+
+    def _evict(self):
+        """超出字节预算时淘汰最久未使用的条目(调用方持有锁)"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, file_size = self._entries.popitem(last=False)
+            self._total_bytes -= file_size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class ThumbnailWarmer:
+    """后台预生成新结果图片的缩略图
+
+    文件事件到达后，等文件的大小和mtime在settle_seconds内不再变化(写入完成)才生成，
+    避免解码写到一半的大幅影像；同一文件的多次事件合并为一次，
+    待处理的文件超过max_pending个时丢弃新的文件(请求缩略图时仍会按需生成)。
+    """
+
+    def __init__(self, cache, formats, settle_seconds=WARM_SETTLE_SECONDS, max_pending=WARM_MAX_PENDING):
+        self.cache = cache
+        self.formats = formats
+        self.settle_seconds = settle_seconds
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._pending = {}  # 路径 -> (上次检查的大小, mtime_ns, 下次检查的时间)
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def enqueue(self, source_path):
+        """加入预生成队列，返回是否加入；同一文件再次写入时推迟检查"""
+        source_path = str(source_path)
+        with self._cond:
+            if source_path not in self._pending and len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending[source_path] = (None, None, time.monotonic() + self.settle_seconds)
+            self._cond.notify()
+        return True
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def start(self):
+        """启动预生成线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="thumbnail-warmer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止预生成线程"""
+        if self._thread is not None:
+            with self._cond:
+                self._stopped = True
+                self._cond.notify()
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _due(self):
+        """等待到期的文件，停止时返回None"""
+        with self._cond:
+            while not self._stopped:
+                now = time.monotonic()
+                due = [path for path, (_, _, check_at) in self._pending.items() if check_at <= now]
+                if due:
+                    return due
+                next_check = min((check_at for _, _, check_at in self._pending.values()), default=None)
+                self._cond.wait(None if next_check is None else next_check - now)
+            return None
+
+    def _settled(self, source_path):
+        """文件大小和mtime与上次检查相同时从队列移除并返回True，否则推迟到下次检查"""
+        try:
+            stat = os.stat(source_path)
+        except OSError:
+            with self._cond:
+                self._pending.pop(source_path, None)
+            return False
+        now = time.monotonic()
+        with self._cond:
+            entry = self._pending.get(source_path)
+            if entry is None or entry[2] > now:
+                return False  # 检查期间又有新的写入
+            if entry[:2] == (stat.st_size, stat.st_mtime_ns):
+                del self._pending[source_path]
+                return True
+            self._pending[source_path] = (stat.st_size, stat.st_mtime_ns, now + self.settle_seconds)
+            return False
+
+    def _run(self):
+        while True:
+            due = self._due()
+            if due is None:
+                break
+            for source_path in due:
+                if not self._settled(source_path):
+                    continue
+                for fmt in self.formats:
+                    try:
+                        self.cache.get(source_path, fmt)
+                    except FileNotFoundError:
+                        break
+                    except Exception as e:
+                        logger.warning(f"预生成缩略图失败 {source_path}: {e}")
+                        break
@@ -0,0 +1,233 @@
+"""大幅结果影像的瓦片金字塔 - 按需构建、磁盘缓存，尽量使用降分辨率解码"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+
+from PIL import Image
+
+from monitor.thumbnails import to_displayable
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = 256
+TILE_QUALITY = 85
+TILE_MEDIA_TYPE = "image/jpeg"
+
+
+class ImageTooLarge(Exception):
+    """解码构建瓦片所需的像素数超过预算"""
+
+
+def pyramid_levels(width, height, tile_size=TILE_SIZE):
+    """计算金字塔各层尺寸，z=0为整幅影像缩放到一个瓦片内，z=max_zoom为原始分辨率"""
+    max_zoom = max(0, math.ceil(math.log2(max(width, height) / tile_size)))
+    levels = []
+    for z in range(max_zoom + 1):
+        scale = 2 ** (max_zoom - z)
+        level_width = max(1, math.ceil(width / scale))
+        level_height = max(1, math.ceil(height / scale))
+        levels.append({
+            "z": z,
+            "width": level_width,
+            "height": level_height,
+            "cols": math.ceil(level_width / tile_size),
+            "rows": math.ceil(level_height / tile_size),
+        })
+    return max_zoom, levels
+
+
+def open_reduced(source_path, factor, max_pixels=None):
+    """以不低于 1/factor 的分辨率解码影像
+
+    JPEG使用draft按1/2~1/8直接解码；多页TIFF(内置概览层)选择最接近的概览页；
+    其余格式只能完整解码后再缩小。实际要解码的像素数超过max_pixels时
+    在解码前抛出ImageTooLarge，避免数亿像素的影像占满工作进程内存。
+    """
+    with Image.open(source_path) as img:
+        width, height = img.size
+        target = (max(1, width // factor), max(1, height // factor))
+
+        if img.format == "JPEG":
+            img.draft(img.mode if img.mode in ("RGB", "L") else "RGB", target)
+        elif getattr(img, "n_frames", 1) > 1:
+            best_frame, best_width = 0, width
+            for frame in range(img.n_frames):
+                img.seek(frame)
+                if target[0] <= img.size[0] < best_width:
+                    best_frame, best_width = frame, img.size[0]
+            img.seek(best_frame)
+
+        decode_width, decode_height = img.size
+        if max_pixels is not None and decode_width * decode_height > max_pixels:
+            raise ImageTooLarge(
+                f"影像需要解码 {decode_width}x{decode_height} 像素，超过瓦片构建上限 {max_pixels} 像素"
+            )
+        img.load()
+        result = to_displayable(img, keep_alpha=False)
+        reduce_by = max(1, min(result.size[0] // target[0], result.size[1] // target[1]))
+        if reduce_by > 1:
+            result = result.reduce(reduce_by)
+        return result.copy() if result is img else result
+
+
+def level_done(cache_dir, z):
+    """第z层瓦片是否已全部写入"""
+    return (cache_dir / str(z) / ".done").exists()
+
+
+def write_level(cache_dir, z, img, level, tile_size):
+    """把一层影像切分成瓦片写入磁盘"""
+    level_dir = cache_dir / str(z)
+    level_dir.mkdir(parents=True, exist_ok=True)
+    for x in range(level["cols"]):
+        for y in range(level["rows"]):
+            box = (
+                x * tile_size,
+                y * tile_size,
+                min((x + 1) * tile_size, level["width"]),
+                min((y + 1) * tile_size, level["height"]),
+            )
+            tmp_path = level_dir / f"{x}_{y}.jpg.{os.getpid()}.tmp"
+            img.crop(box).save(tmp_path, format="JPEG", quality=TILE_QUALITY)
+            os.replace(tmp_path, level_dir / f"{x}_{y}.jpg")
+    (level_dir / ".done").touch()
+
+
+def supports_reduced_decode(img):
+    """JPEG(draft)和带概览页的多页TIFF可以直接以较低分辨率解码"""
+    return img.format == "JPEG" or getattr(img, "n_frames", 1) > 1
+
+
+def build_levels(source_path, cache_dir, meta, z, max_pixels=None):
+    """构建第z层及所有尚未构建的更低层
+
+    不支持降分辨率解码的格式(单页TIFF、PNG等)每层都要完整解码原图，
+    因此一次解码构建所有层(从原始分辨率逐层减半)，之后请求其他层不再解码。
+    """
+    with Image.open(source_path) as img:
+        reduced = supports_reduced_decode(img)
+    top = z if reduced else meta["max_zoom"]
+    factor = 2 ** (meta["max_zoom"] - top)
+    logger.info(f"构建瓦片金字塔 {source_path} z={top}..0 (1/{factor})")
+    img = open_reduced(source_path, factor, max_pixels)
+    for level_z in range(top, -1, -1):
+        done = level_done(cache_dir, level_z)
+        if done and level_z < z:
+            # 更低的层在之前的构建中已经生成
+            break
+        level = meta["levels"][level_z]
+        size = (level["width"], level["height"])
+        if img.size != size:
+            halved = ((img.size[0] + 1) // 2, (img.size[1] + 1) // 2)
+            # 相邻层正好是2倍关系时用box降采样，比LANCZOS快得多
+            img = img.reduce(2) if halved == size else img.resize(size, Image.Resampling.LANCZOS)
+        if not done:
+            write_level(cache_dir, level_z, img, level, meta["tile_size"])
+
+
+class TilePyramid:
+    """单幅影像的瓦片金字塔，瓦片按层一次性写入磁盘"""
+
+    def __init__(self, source_path, stat, cache_root, tile_size=TILE_SIZE, runner=None, max_pixels=None):
+        self.source_path = str(source_path)
+        self.tile_size = tile_size
+        self.max_pixels = max_pixels
+        # runner(fn, *args) 用于执行构建，可替换为进程池
+        self.runner = runner or (lambda fn, *args: fn(*args))
+        path_hash = hashlib.sha1(self.source_path.encode("utf-8")).hexdigest()
+        self.key = f"{path_hash}_{stat.st_mtime_ns}_{stat.st_size}"
+        self.cache_dir = cache_root / self.key
+        self._lock = threading.Lock()
+        self._build_lock = asyncio.Lock()
+        self._remove_stale_versions(cache_root, path_hash)
+
+        meta_path = self.cache_dir / "meta.json"
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        else:
+            with Image.open(self.source_path) as img:
+                width, height = img.size
+            max_zoom, levels = pyramid_levels(width, height, tile_size)
+            meta = {
+                "width": width,
+                "height": height,
+                "tile_size": tile_size,
+                "max_zoom": max_zoom,
+                "levels": levels,
+                "media_type": TILE_MEDIA_TYPE,
+            }
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            meta_path.write_text(json.dumps(meta), encoding="utf-8")
+        self.meta = meta
+
+    def _remove_stale_versions(self, cache_root, path_hash):
+        """源文件变化后删除旧版本的瓦片目录"""
+        if not cache_root.exists():
+            return
+        for entry in os.scandir(cache_root):
+            if entry.name.startswith(f"{path_hash}_") and entry.name != self.key:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _level_done(self, z):
+        return level_done(self.cache_dir, z)
+
+    def _in_range(self, z, x, y):
+        levels = self.meta["levels"]
+        if not 0 <= z < len(levels):
+            return False
+        level = levels[z]
+        return 0 <= x < level["cols"] and 0 <= y < level["rows"]
+
+    def tile_path(self, z, x, y):
+        """返回瓦片文件路径，必要时构建所在层；坐标越界返回None，解码超出像素预算时抛出ImageTooLarge"""
+        if not self._in_range(z, x, y):
+            return None
+        if not self._level_done(z):
+            with self._lock:
+                if not self._level_done(z):
+                    self.runner(build_levels, self.source_path, self.cache_dir, self.meta, z, self.max_pixels)
+        return self.cache_dir / str(z) / f"{x}_{y}.jpg"
+
+    async def fetch(self, z, x, y, io_runner, cpu_runner):
+        """异步版本的tile_path: 检查层级标记在io_runner中执行，构建直接交给cpu_runner，
+        构建期间不占用IO线程；同一金字塔同时只构建一次"""
+        if not self._in_range(z, x, y):
+            return None
+        if not await io_runner(self._level_done, z):
+            async with self._build_lock:
+                if not await io_runner(self._level_done, z):
+                    await cpu_runner(build_levels, self.source_path, self.cache_dir, self.meta, z, self.max_pixels)
+        return self.cache_dir / str(z) / f"{x}_{y}.jpg"
+
+
+class TileStore:
+    """按源文件管理瓦片金字塔"""
+
+    def __init__(self, cache_root, max_open=32, runner=None, max_pixels=None):
+        self.cache_root = cache_root
+        self.max_open = max_open
+        self.runner = runner
+        self.max_pixels = max_pixels
+        self._pyramids = {}
+        self._lock = threading.Lock()
+
+    def get(self, source_path):
+        """获取(或创建)影像的瓦片金字塔"""
+        stat = os.stat(source_path)
+        path = str(source_path)
+        with self._lock:
+            pyramid = self._pyramids.get(path)
+            if pyramid is not None and pyramid.key.endswith(f"_{stat.st_mtime_ns}_{stat.st_size}"):
+                return pyramid
+        pyramid = TilePyramid(source_path, stat, self.cache_root, runner=self.runner, max_pixels=self.max_pixels)
+        with self._lock:
+            if len(self._pyramids) >= self.max_open:
+                self._pyramids.pop(next(iter(self._pyramids)))
+            self._pyramids[path] = pyramid
+        return pyramid
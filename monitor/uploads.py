@@ -0,0 +1,279 @@
+"""分块断点续传上传 - 数据直接写入上传目录，边接收边计算SHA-256，按已确认偏移续传"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows没有fcntl，只支持单进程运行
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+HASH_READ_SIZE = 1024 * 1024
+
+
+class UploadNotFound(Exception):
+    """上传会话不存在或已过期"""
+
+
+class UploadConflict(Exception):
+    """偏移与服务端已确认的偏移不一致，或会话正在被其他请求写入"""
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+
+def unique_upload_path(upload_dir, original_filename):
+    """生成 upload_{时间戳}{扩展名} 形式的不重名路径"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    file_extension = Path(original_filename or "unknown").suffix
+    image_path = upload_dir / f"upload_{timestamp}{file_extension}"
+    counter = 1
+    while image_path.exists() or image_path.with_name(image_path.name + ".part").exists():
+        # 同一秒内多次上传时避免覆盖
+        image_path = upload_dir / f"upload_{timestamp}_{counter}{file_extension}"
+        counter += 1
+    return image_path
+
+
+class UploadSession:
+    """单个上传会话，数据写入 {最终文件名}.part，完成后原地改名"""
+
+    def __init__(self, upload_id, original_filename, path, total_size=None, offset=0,
+                 created_at=None, updated_at=None):
+        self.upload_id = upload_id
+        self.original_filename = original_filename
+        self.path = Path(path)
+        self.total_size = total_size
+        self.offset = offset
+        self.created_at = created_at or time.time()
+        self.updated_at = updated_at or self.created_at
+        self._hasher = None
+        self._file = None
+
+    @property
+    def part_path(self):
+        return self.path.with_name(self.path.name + ".part")
+
+    def to_dict(self):
+        return {
+            "upload_id": self.upload_id,
+            "original_filename": self.original_filename,
+            "path": str(self.path),
+            "total_size": self.total_size,
+            "offset": self.offset,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    def status(self):
+        """返回给客户端的会话状态"""
+        return {
+            "upload_id": self.upload_id,
+            "filename": self.path.name,
+            "original_filename": self.original_filename,
+            "offset": self.offset,
+            "total_size": self.total_size,
+            "complete": self.total_size is not None and self.offset == self.total_size,
+        }
+
+
+class UploadStore:
+    """管理上传会话，会话元数据保存在 sessions_dir/{upload_id}.json
+
+    元数据文件是唯一的状态来源，多个工作进程可以交替接收同一会话的分块；
+    写入期间对 .part 文件加排他锁，同一会话同时只能有一个请求写入。
+    进程内只缓存哈希计算的中间状态，偏移与元数据一致时复用。
+    """
+
+    def __init__(self, upload_dir, sessions_dir, expire_hours=24):
+        self.upload_dir = upload_dir
+        self.sessions_dir = sessions_dir
+        self.expire_seconds = expire_hours * 3600
+        self._hashers = {}  # upload_id -> (偏移, sha256对象)
+        self._lock = threading.Lock()
+
+    def expire(self):
+        """清理过期或数据文件已丢失的会话"""
+        if not self.sessions_dir.exists():
+            return
+        expire_before = time.time() - self.expire_seconds
+        for entry in os.scandir(self.sessions_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            session = self._read(entry.name[:-len(".json")])
+            if session is None:
+                continue
+            if session.updated_at < expire_before or not session.part_path.exists():
+                logger.info(f"上传会话过期: {session.upload_id}")
+                self._remove(session)
+
+    def _meta_path(self, upload_id):
+        return self.sessions_dir / f"{upload_id}.json"
+
+    def _read(self, upload_id):
+        if not upload_id.isalnum():
+            return None
+        try:
+            with open(self._meta_path(upload_id), "r", encoding="utf-8") as f:
+                return UploadSession(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"读取上传会话 {upload_id} 失败: {e}")
+            return None
+
+    def _persist(self, session):
+        path = self._meta_path(session.upload_id)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(session.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _remove(self, session):
+        with self._lock:
+            self._hashers.pop(session.upload_id, None)
+        for path in (session.part_path, self._meta_path(session.upload_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def create(self, original_filename, total_size=None):
+        """创建上传会话"""
+        if total_size is not None and total_size < 0:
+            raise ValueError("文件大小不能为负数")
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        self.sessions_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            path = unique_upload_path(self.upload_dir, original_filename)
+            session = UploadSession(uuid.uuid4().hex, original_filename, path, total_size)
+            session.part_path.touch()
+            self._hashers[session.upload_id] = (0, hashlib.sha256())
+        self._persist(session)
+        return session.status()
+
+    def _get(self, upload_id):
+        session = self._read(upload_id)
+        if session is None:
+            raise UploadNotFound(upload_id)
+        return session
+
+    def get(self, upload_id):
+        """获取会话状态"""
+        return self._get(upload_id).status()
+
+    def _open_locked(self, session):
+        """打开 .part 文件并加排他锁，已被其他请求锁定时抛出UploadConflict"""
+        try:
+            f = open(session.part_path, "r+b")
+        except FileNotFoundError:
+            raise UploadNotFound(session.upload_id)
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                raise UploadConflict("该上传会话正在写入", session.offset)
+        return f
+
+    def _restore_hasher(self, session):
+        """复用进程内的哈希状态，偏移不一致(其他进程写入过)时从文件重新计算"""
+        with self._lock:
+            cached = self._hashers.pop(session.upload_id, None)
+        if cached is not None and cached[0] == session.offset:
+            session._hasher = cached[1]
+            return
+        hasher = hashlib.sha256()
+        with open(session.part_path, "rb") as f:
+            remaining = session.offset
+            while remaining > 0:
+                data = f.read(min(HASH_READ_SIZE, remaining))
+                if not data:
+                    break
+                hasher.update(data)
+                remaining -= len(data)
+        session._hasher = hasher
+
+    def begin_append(self, upload_id, offset):
+        """开始从offset追加数据，offset必须等于已确认的偏移"""
+        session = self._get(upload_id)
+        f = self._open_locked(session)
+        try:
+            # 加锁后重新读取，避免与刚结束的写入竞争
+            session = self._get(upload_id)
+            if offset != session.offset:
+                raise UploadConflict(f"偏移不一致，服务端已确认 {session.offset} 字节", session.offset)
+            self._restore_hasher(session)
+            # 丢弃上次确认之后写入的残留数据
+            f.truncate(session.offset)
+            f.seek(session.offset)
+        except Exception:
+            f.close()
+            raise
+        session._file = f
+        return session
+
+    def write(self, session, data):
+        """写入一段数据并更新哈希"""
+        if session.total_size is not None and session.offset + len(data) > session.total_size:
+            raise ValueError(f"数据超出声明的文件大小 {session.total_size}")
+        session._file.write(data)
+        session._hasher.update(data)
+        session.offset += len(data)
+
+    def end_append(self, session):
+        """落盘并记录已确认的偏移，然后释放锁"""
+        try:
+            session._file.flush()
+            os.fsync(session._file.fileno())
+            session.updated_at = time.time()
+            self._persist(session)
+            with self._lock:
+                self._hashers[session.upload_id] = (session.offset, session._hasher)
+        finally:
+            session._file.close()
+            session._file = None
+        return session.status()
+
+    def finalize(self, upload_id, expected_sha256=None):
+        """校验大小和哈希后改名为最终文件，返回 (文件路径, sha256, 大小)"""
+        session = self._get(upload_id)
+        f = self._open_locked(session)
+        try:
+            session = self._get(upload_id)
+            if session.total_size is not None and session.offset != session.total_size:
+                raise UploadConflict(
+                    f"上传未完成，已接收 {session.offset}/{session.total_size} 字节", session.offset
+                )
+            self._restore_hasher(session)
+            digest = session._hasher.hexdigest()
+            if expected_sha256 and expected_sha256.lower() != digest:
+                with self._lock:
+                    self._hashers[upload_id] = (session.offset, session._hasher)
+                raise ValueError(f"SHA-256校验失败: {digest}")
+            f.truncate(session.offset)
+            os.replace(session.part_path, session.path)
+            os.remove(self._meta_path(upload_id))
+        finally:
+            f.close()
+        logger.info(f"上传完成: {session.path.name} ({session.offset} 字节, sha256={digest})")
+        return session.path, digest, session.offset
+
+    def abort(self, upload_id):
+        """取消上传并删除已接收的数据"""
+        session = self._get(upload_id)
+        f = self._open_locked(session)
+        try:
+            self._remove(session)
+        finally:
+            f.close()
@@ -0,0 +1,135 @@
+"""目录变化监听 - 优先使用inotify(watchfiles)，不可用时退回轮询"""
+
+import logging
+import os
+import threading
+from pathlib import Path
+
+try:
+    import watchfiles
+except ImportError:  # pragma: no cover - 取决于安装环境
+    watchfiles = None
+
+logger = logging.getLogger(__name__)
+
+ADDED = "added"
+MODIFIED = "modified"
+DELETED = "deleted"
+
+
+def _snapshot(directory):
+    """获取目录下文件的 (mtime_ns, size) 快照"""
+    snapshot = {}
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return snapshot
+
+
+class DirectoryWatcher:
+    """监听若干目录(不递归)的文件新增、修改、删除
+
+    callback 在后台线程中被调用，参数为 [(change, path), ...]，
+    change 取值为 ADDED / MODIFIED / DELETED。
+    """
+
+    def __init__(self, directories, callback, poll_interval=2.0, debounce_ms=300):
+        self.directories = [Path(d) for d in directories]
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.debounce_ms = debounce_ms
+        self.mode = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def active(self):
+        """监听线程是否在运行"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动监听线程"""
+        if self.active:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="dir-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止监听线程"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _emit(self, changes):
+        if not changes:
+            return
+        try:
+            self.callback(changes)
+        except Exception as e:
+            logger.error(f"处理目录变化回调失败: {e}")
+
+    def _run(self):
+        if watchfiles is not None and os.environ.get("MONITOR_WATCH_POLLING") != "1":
+            try:
+                self._run_watchfiles()
+                return
+            except Exception as e:
+                if self._stop_event.is_set():
+                    return
+                logger.warning(f"inotify监听不可用，改为轮询: {e}")
+        self._run_polling()
+
+    def _run_watchfiles(self):
+        """基于watchfiles(inotify)监听；目录出现或消失时重新建立监听"""
+        change_names = {
+            watchfiles.Change.added: ADDED,
+            watchfiles.Change.modified: MODIFIED,
+            watchfiles.Change.deleted: DELETED,
+        }
+        self.mode = "inotify"
+        while not self._stop_event.is_set():
+            existing = [d for d in self.directories if d.is_dir()]
+            if not existing:
+                self._stop_event.wait(self.poll_interval)
+                continue
+            for changes in watchfiles.watch(
+                *existing,
+                watch_filter=None,
+                debounce=self.debounce_ms,
+                stop_event=self._stop_event,
+                rust_timeout=int(self.poll_interval * 1000),
+                yield_on_timeout=True,
+                raise_interrupt=False,
+                recursive=False,
+            ):
+                self._emit([(change_names[change], path) for change, path in changes])
+                if [d for d in self.directories if d.is_dir()] != existing:
+                    break
+
+    def _run_polling(self):
+        """轮询目录快照并比较差异"""
+        self.mode = "polling"
+        snapshots = {d: _snapshot(d) for d in self.directories}
+        while not self._stop_event.wait(self.poll_interval):
+            changes = []
+            for directory in self.directories:
+                old = snapshots[directory]
+                new = _snapshot(directory)
+                for path, signature in new.items():
+                    if path not in old:
+                        changes.append((ADDED, path))
+                    elif old[path] != signature:
+                        changes.append((MODIFIED, path))
+                changes.extend((DELETED, path) for path in old if path not in new)
+                snapshots[directory] = new
+            self._emit(changes)
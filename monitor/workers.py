@@ -0,0 +1,191 @@
+"""后台工作池 - 文件IO走线程池，CPU密集任务走进程池，均限制并发和排队深度"""
+
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from monitor.metrics import EVENT_LOOP_LAG
+
+logger = logging.getLogger(__name__)
+
+
+class PoolOverloaded(Exception):
+    """工作池排队已满"""
+
+    def __init__(self, pool_name):
+        super().__init__(f"工作池 {pool_name} 已满载，请稍后重试")
+        self.pool_name = pool_name
+
+
+def _timed_call(fn, args, kwargs):
+    """在工作线程/进程中执行，并返回开始和结束时间"""
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return started, time.time(), result
+
+
+class BoundedPool:
+    """限制并发数和排队深度的执行池
+
+    kind: thread / process / inline (inline直接在调用方执行，用于对比测试)
+    正在执行和排队的任务总数达到 max_workers + max_queue 时拒绝新任务。
+    """
+
+    def __init__(self, name, kind, max_workers, max_queue):
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._wait_ms = deque(maxlen=1000)
+        self._run_ms = deque(maxlen=1000)
+
+        if kind == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        elif kind == "process":
+            self._executor = ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        elif kind == "inline":
+            self._executor = None
+        else:
+            raise ValueError(f"未知的工作池类型: {kind}")
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise PoolOverloaded(self.name)
+            self._pending += 1
+            self.submitted += 1
+
+    def _release(self, submitted_at, timing, ok):
+        with self._lock:
+            self._pending -= 1
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+            if timing is not None:
+                started, finished = timing
+                self._wait_ms.append(max(0.0, started - submitted_at) * 1000)
+                self._run_ms.append((finished - started) * 1000)
+
+    async def run(self, fn, *args, **kwargs):
+        """在池中执行fn并等待结果，满载时抛出PoolOverloaded"""
+        self._acquire()
+        submitted_at = time.time()
+        timing = None
+        ok = False
+        try:
+            if self._executor is None:
+                started, finished, result = _timed_call(fn, args, kwargs)
+            else:
+                loop = asyncio.get_running_loop()
+                started, finished, result = await loop.run_in_executor(
+                    self._executor, _timed_call, fn, args, kwargs
+                )
+            timing = (started, finished)
+            ok = True
+            return result
+        finally:
+            self._release(submitted_at, timing, ok)
+
+    def call(self, fn, *args, **kwargs):
+        """同步版本的run，供工作线程中调用"""
+        self._acquire()
+        submitted_at = time.time()
+        timing = None
+        ok = False
+        try:
+            if self._executor is None:
+                started, finished, result = _timed_call(fn, args, kwargs)
+            else:
+                started, finished, result = self._executor.submit(_timed_call, fn, args, kwargs).result()
+            timing = (started, finished)
+            ok = True
+            return result
+        finally:
+            self._release(submitted_at, timing, ok)
+
+    def metrics(self):
+        """工作池指标"""
+        with self._lock:
+            pending = self._pending
+            wait_ms = list(self._wait_ms)
+            run_ms = list(self._run_ms)
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": min(pending, self.max_workers),
+                "queued": max(0, pending - self.max_workers),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(sum(wait_ms) / len(wait_ms), 2) if wait_ms else 0.0,
+                "avg_run_ms": round(sum(run_ms) / len(run_ms), 2) if run_ms else 0.0,
+                "max_run_ms": round(max(run_ms), 2) if run_ms else 0.0,
+            }
+
+    def shutdown(self):
+        """关闭执行池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class EventLoopLagMonitor:
+    """定期测量事件循环延迟(实际唤醒时间与预期的差值)"""
+
+    def __init__(self, interval=0.1, window=600):
+        self.interval = interval
+        self._samples = deque(maxlen=window)
+        self._task = None
+        self.max_lag_ms = 0.0
+
+    def start(self):
+        """在当前事件循环中启动测量任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """停止测量任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - expected) * 1000)
+            self._samples.append(lag_ms)
+            EVENT_LOOP_LAG.observe(lag_ms / 1000)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+
+    def metrics(self):
+        """事件循环延迟指标(毫秒)"""
+        samples = sorted(self._samples)
+        if not samples:
+            return {"current_ms": 0.0, "avg_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        return {
+            "current_ms": round(self._samples[-1], 2),
+            "avg_ms": round(sum(samples) / len(samples), 2),
+            "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 2),
+            "max_ms": round(self.max_lag_ms, 2),
+        }
@@ -0,0 +1,63 @@
+"""流式ZIP打包 - 边读文件边输出压缩包字节，不在内存或磁盘中生成完整压缩包"""
+
+import zipfile
+
+COPY_CHUNK_SIZE = 1024 * 1024
+# 已压缩的影像格式直接存储，避免无效的CPU开销
+STORED_SUFFIXES = (".png", ".jpg", ".jpeg", ".webp", ".tif", ".tiff", ".zip", ".gz")
+
+
+class _ChunkBuffer:
+    """只写缓冲区，供zipfile写入，由生成器取走已写入的字节"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(entries):
+    """按条目生成ZIP字节流
+
+    entries为 (压缩包内路径, 本地文件路径或bytes) 的可迭代对象，
+    本地文件不存在时跳过。同步生成器，由StreamingResponse在线程池中迭代。
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, "w", allowZip64=True) as zf:
+        for arcname, source in entries:
+            compress_type = zipfile.ZIP_STORED if arcname.lower().endswith(STORED_SUFFIXES) else zipfile.ZIP_DEFLATED
+            if isinstance(source, (bytes, bytearray)):
+                zf.writestr(arcname, source, compress_type=compress_type)
+            else:
+                try:
+                    src = open(source, "rb")
+                except FileNotFoundError:
+                    continue
+                with src:
+                    zinfo = zipfile.ZipInfo.from_file(source, arcname)
+                    zinfo.compress_type = compress_type
+                    with zf.open(zinfo, "w", force_zip64=True) as dest:
+                        while True:
+                            data = src.read(COPY_CHUNK_SIZE)
+                            if not data:
+                                break
+                            dest.write(data)
+                            chunk = buffer.take()
+                            if chunk:
+                                yield chunk
+            chunk = buffer.take()
+            if chunk:
+                yield chunk
+    chunk = buffer.take()
+    if chunk:
+        yield chunk
@@ -1,11 +1,13 @@
-from fastapi import FastAPI, Request, HTTPException, Query, UploadFile, File, Form
+from fastapi import FastAPI, Request, HTTPException, Query, UploadFile, File, Form, Depends
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from starlette.requests import ClientDisconnect
 import os
 import json
+import asyncio
 import glob
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 from pathlib import Path
 import uvicorn
@@ -15,13 +17,47 @@ import base64
 import time
 from functools import lru_cache
 import shutil
-import requests
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+import tarfile
+import zipfile
+from typing import List, Optional
+
+from monitor.batches import (
+    BatchCancelled, BatchStore, BatchTooLarge, ExtractBudget, IMAGE_EXTENSIONS, batch_archive_entries, batch_status,
+    extract_archive, is_archive, save_stream
+)
+from monitor.cache_backends import create_cache_backend
+from monitor.file_listing import FileListing
+from monitor.file_response import RangeFileResponse
+from monitor.image_map import ImageTimestampMap
+from monitor.inference_client import InferenceClient
+from monitor.jobs import JobQueue, DONE, FINISHED_STATES
+from monitor.json_documents import DocumentCache, FieldNotFound, parse_fields
+from monitor.leader import LeaderElection
+from monitor.log_tail import LogTailer
+from monitor.log_index import LogIndex, parse_levels
+from monitor.metrics import (
+    CACHE_REFRESHES, CACHE_REQUESTS, CONTENT_TYPE as METRICS_CONTENT_TYPE, DETECTION_JOBS, REGISTRY, Gauge, MetricsMiddleware
+)
+from monitor.result_cache import DetectionResultCache, hash_fileobj, normalize_params, result_cache_key
+from monitor.responses import EncodedJSON, dumps, encoding_etag, make_etag, negotiate_encoding
+from monitor.result_index import RESULT_PREFIX, ResultIndex
+from monitor.refresher import CacheRefresher
+from monitor.singleflight import SingleFlight
+from monitor.thumbnails import ThumbnailCache, ThumbnailWarmer, WEBP_SUPPORTED
+from monitor.tiles import ImageTooLarge, TileStore, TILE_MEDIA_TYPE
+from monitor.uploads import UploadStore, UploadNotFound, UploadConflict, unique_upload_path
+from monitor.watcher import DirectoryWatcher
+from monitor.workers import BoundedPool, EventLoopLagMonitor, PoolOverloaded
+from monitor.zipstream import iter_zip
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="遥感推理服务监控系统", version="1.0.0")
+app.add_middleware(MetricsMiddleware)
 
 # 静态文件目录
 static_dir = Path("static")
@@ -39,28 +75,432 @@ DATA_DIR = PROJECT_ROOT / "data"
 LOGS_DIR = PROJECT_ROOT / "logs"  # 修改为当前目录下的logs
 DETECTED_IMAGES_DIR = DATA_DIR / "detected_result_images"
 DETECTED_JSON_DIR = DATA_DIR / "detected_result_json_files"
+RESULT_INDEX_PATH = DATA_DIR / "result_index.db"
+LOG_INDEX_PATH = DATA_DIR / "log_index.db"
+LOG_INDEX_INTERVAL = int(os.environ.get("MONITOR_LOG_INDEX_INTERVAL", 10))  # 日志索引跟进追加内容的间隔秒数
+THUMBNAIL_CACHE_DIR = DATA_DIR / "thumbnail_cache"
+THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get("MONITOR_THUMBNAIL_CACHE_MB", 512)) * 1024 * 1024
+JSON_CACHE_MAX_BYTES = int(os.environ.get("MONITOR_JSON_CACHE_MB", 256)) * 1024 * 1024  # 结果JSON解析缓存
+JSON_STREAM_THRESHOLD = int(os.environ.get("MONITOR_JSON_STREAM_MB", 16)) * 1024 * 1024  # 超过该大小的结果JSON流式读取
+TILE_CACHE_DIR = DATA_DIR / "tile_cache"
+TILE_MAX_PIXELS = int(os.environ.get("MONITOR_TILE_MAX_MEGAPIXELS", 256)) * 1000 * 1000  # 构建瓦片单次解码的像素上限
+JOBS_DIR = DATA_DIR / "jobs"
+UPLOAD_DIR = DATA_DIR / "uploaded_images"
+UPLOAD_SESSIONS_DIR = DATA_DIR / "upload_sessions"
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 建议客户端每次PUT的字节数
+UPLOAD_WRITE_BUFFER = 1024 * 1024  # 累积到1MB再交给线程池写盘
+UPLOAD_SESSION_EXPIRE_HOURS = int(os.environ.get("MONITOR_UPLOAD_EXPIRE_HOURS", 24))
+DETECTION_CACHE_DIR = DATA_DIR / "detection_cache"
+BATCHES_DIR = DATA_DIR / "batches"
+BATCH_MAX_ITEMS = int(os.environ.get("MONITOR_BATCH_MAX_ITEMS", 1000))
+# 解压预算，防止压缩炸弹写满上传目录
+BATCH_MAX_MEMBER_BYTES = int(os.environ.get("MONITOR_BATCH_MAX_MEMBER_MB", 4096)) * 1024 * 1024  # 单个文件
+BATCH_MAX_TOTAL_BYTES = int(os.environ.get("MONITOR_BATCH_MAX_TOTAL_MB", 51200)) * 1024 * 1024  # 一个批次合计
+BATCH_MAX_MEMBERS = int(os.environ.get("MONITOR_BATCH_MAX_MEMBERS", 10000))  # 压缩包条目数(含非影像)
+DETECTION_CACHE_MAX_BYTES = int(os.environ.get("MONITOR_DETECTION_CACHE_MB", 2048)) * 1024 * 1024
+
+# 推理服务配置
+INFERENCE_URL = os.environ.get("MONITOR_INFERENCE_URL", "http://127.0.0.1:8085/detect/with_data_base_plate")
+INFERENCE_TIMEOUT = 300  # 5分钟超时
+INFERENCE_MAX_IN_FLIGHT = int(os.environ.get("MONITOR_INFERENCE_MAX_IN_FLIGHT", 1))
+INFERENCE_MAX_QUEUE = int(os.environ.get("MONITOR_INFERENCE_MAX_QUEUE", 16))
+INFERENCE_QUEUE_TIMEOUT = float(os.environ.get("MONITOR_INFERENCE_QUEUE_TIMEOUT", 600))
+INFERENCE_RETRIES = int(os.environ.get("MONITOR_INFERENCE_RETRIES", 2))
+INFERENCE_FAILURE_THRESHOLD = int(os.environ.get("MONITOR_INFERENCE_FAILURE_THRESHOLD", 5))
+INFERENCE_RESET_TIMEOUT = float(os.environ.get("MONITOR_INFERENCE_RESET_TIMEOUT", 30))
+# 检测任务并发数，实际发往推理服务的请求数由 INFERENCE_MAX_IN_FLIGHT 限制
+DETECT_CONCURRENCY = int(os.environ.get("MONITOR_DETECT_CONCURRENCY", 4))
+
+# 工作池配置 - 文件IO走线程池，图片解码等CPU密集任务走进程池
+WORKERS_INLINE = os.environ.get("MONITOR_WORKERS_INLINE") == "1"  # 直接在事件循环中执行，仅用于对比测试
+IO_POOL_WORKERS = int(os.environ.get("MONITOR_IO_WORKERS", 8))
+IO_POOL_QUEUE = int(os.environ.get("MONITOR_IO_QUEUE", 64))
+CPU_POOL_WORKERS = int(os.environ.get("MONITOR_CPU_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+CPU_POOL_QUEUE = int(os.environ.get("MONITOR_CPU_QUEUE", 16))
+
+io_pool = BoundedPool("io", "inline" if WORKERS_INLINE else "thread", IO_POOL_WORKERS, IO_POOL_QUEUE)
+cpu_pool = BoundedPool("cpu", "inline" if WORKERS_INLINE else "process", CPU_POOL_WORKERS, CPU_POOL_QUEUE)
+loop_lag_monitor = EventLoopLagMonitor()
+
+async def json_response(data, request: Request = None, etag=None):
+    """在线程池中序列化JSON响应(orjson)，避免大响应在事件循环中编码
+
+    传入request时带ETag，客户端缓存有效时返回304，较大的响应按Accept-Encoding压缩。
+    """
+    encoded = await io_pool.run(EncodedJSON.encode, data)
+    if etag is not None:
+        encoded.etag = etag
+    return await encoded_response(request, encoded)
+
+async def encoded_response(request, encoded, age=None):
+    """返回已序列化的JSON响应，age为缓存条目的年龄(秒)，通过Age响应头告知客户端"""
+    if request is None:
+        return Response(encoded.body, media_type="application/json")
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if not encoded.should_compress(encoding):
+        encoding = None
+    # 压缩和未压缩的表示内容不同，ETag按编码区分
+    etag = encoding_etag(encoded.etag, encoding)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if age is not None:
+        headers["Age"] = str(int(age))
+    if is_not_modified(request, etag, None):
+        return Response(status_code=304, headers=headers)
+    body = encoded.body
+    if encoding is not None:
+        body = await io_pool.run(encoded.compressed, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
+
+def not_modified_response(request, etag):
+    """按版本ETag提前判断是否未变化，未变化时返回304响应，否则返回None
+
+    客户端持有的可能是压缩表示的ETag(带编码后缀)，304带回与之匹配的ETag。
+    """
+    for encoding in (None, "gzip", "br"):
+        variant = encoding_etag(etag, encoding)
+        if is_not_modified(request, variant, None):
+            return Response(
+                status_code=304, headers={"ETag": variant, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+            )
+    return None
+
+@app.exception_handler(PoolOverloaded)
+async def pool_overloaded_handler(request: Request, exc: PoolOverloaded):
+    """工作池满载时返回503"""
+    logger.warning(f"请求被拒绝 {request.url.path}: {exc}")
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
 
 # 缓存配置
-CACHE_DURATION = 60  # 缓存60秒，减少API调用频率
-cache_data = {}
-cache_timestamps = {}
+CACHE_DURATION = 60  # 缓存60秒，减少API调用频率 (目录监听未运行时生效)
+CACHE_MAX_ENTRIES = int(os.environ.get("MONITOR_CACHE_MAX_ENTRIES", 1000))  # 超出时淘汰最久未使用的条目
+# 缓存指标和过期时间按键族区分，键中的查询参数不进入标签
+CACHE_FAMILIES = ("current_task", "task_history", "logs", "system_stats")
+# 各键族的过期秒数 (目录监听未运行时生效)，未列出的键使用CACHE_DURATION
+CACHE_TTLS = {
+    "current_task": 5,
+    "logs": 10,
+    "task_history": CACHE_DURATION,
+    "system_stats": CACHE_DURATION,
+}
+# 过期超过该秒数的条目(包括已被文件变化失效的)不再作为旧值返回，请求等待重建
+CACHE_STALE_MAX_AGE = 600
+# 超过该秒数没有请求的缓存键停止后台刷新
+CACHE_REFRESH_IDLE_TIMEOUT = int(os.environ.get("MONITOR_CACHE_REFRESH_IDLE", 120))
+SERVER_WORKERS = int(os.environ.get("MONITOR_WORKERS", 1))
+# 多个工作进程时默认使用SQLite共享缓存，保证各进程看到相同的缓存和失效
+CACHE_BACKEND = os.environ.get("MONITOR_CACHE_BACKEND", "memory" if SERVER_WORKERS == 1 else "sqlite")
+CACHE_DB_PATH = DATA_DIR / "api_cache.db"
+REDIS_URL = os.environ.get("MONITOR_REDIS_URL", "redis://127.0.0.1:6379/0")
+CACHE_LOCK_TTL = 30  # 计算锁最长持有秒数，持有进程崩溃时到期自动释放
+LEADER_LOCK_PATH = DATA_DIR / "monitor.leader.lock"
+MAINTENANCE_INTERVAL = 10  # 主进程维护任务间隔秒数
+WATCHER_FLAG_KEY = "__watcher_active__"  # 主进程目录监听运行中的标记，供其他进程判断缓存是否按时间过期
+
+if SERVER_WORKERS > 1 and CACHE_BACKEND == "memory":
+    logger.warning("多个工作进程使用进程内缓存，各进程的缓存和失效互不可见")
+cache_backend = create_cache_backend(
+    CACHE_BACKEND, sqlite_path=CACHE_DB_PATH, redis_url=REDIS_URL, max_entries=CACHE_MAX_ENTRIES
+)
+cache_flight = SingleFlight()  # 进程内同一缓存键只进行一次计算
+watcher_flag = {"checked": 0.0, "active": False}
+
+def watcher_active():
+    """本进程或主进程的目录监听是否在运行"""
+    if dir_watcher.active:
+        return True
+    if not cache_backend.shared:
+        return False
+    now = time.time()
+    if now - watcher_flag["checked"] > 5:
+        watcher_flag["active"] = bool(cache_backend.get(WATCHER_FLAG_KEY, max_age=MAINTENANCE_INTERVAL * 3))
+        watcher_flag["checked"] = now
+    return watcher_flag["active"]
+
+def cache_family(key):
+    """缓存键所属的键族"""
+    for family in CACHE_FAMILIES:
+        if key.startswith(family):
+            return family
+    return "other"
+
+def cache_ttl(key):
+    """缓存键的过期秒数"""
+    return CACHE_TTLS.get(cache_family(key), CACHE_DURATION)
 
 def get_cached_data(key):
     """获取缓存数据"""
-    if key in cache_data and key in cache_timestamps:
-        if time.time() - cache_timestamps[key] < CACHE_DURATION:
-            return cache_data[key]
-    return None
+    # 目录监听运行时缓存由文件变化事件失效，不再按时间过期
+    return cache_backend.get(key, max_age=None if watcher_active() else cache_ttl(key))
 
 def set_cached_data(key, data):
     """设置缓存数据"""
-    cache_data[key] = data
-    cache_timestamps[key] = time.time()
+    cache_backend.set(key, data)
 
 def clear_cache():
-    """清除所有缓存"""
-    cache_data.clear()
-    cache_timestamps.clear()
+    """清除所有缓存(共享后端时对所有工作进程生效)"""
+    cache_backend.clear()
+
+def invalidate_cache(*prefixes):
+    """按键前缀失效缓存: 保留旧值供重建期间读取，并在后台重建最近被请求过的键"""
+    cache_backend.expire_prefixes(*prefixes)
+    cache_refresher.trigger_prefixes(*prefixes)
+
+async def cache_op(fn, *args):
+    """执行缓存后端操作，共享后端涉及磁盘/网络IO，放到线程池中执行"""
+    if cache_backend.shared:
+        return await io_pool.run(fn, *args)
+    return fn(*args)
+
+async def compute_with_lock(key, compute):
+    """跨进程计算锁: 同一键只有一个进程计算，其余进程等待其写入缓存"""
+    if not cache_backend.shared:
+        value = await compute()
+        set_cached_data(key, value)
+        return value
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + CACHE_LOCK_TTL
+    while True:
+        token = await io_pool.run(cache_backend.try_lock, key, CACHE_LOCK_TTL)
+        if token is not None or loop.time() > deadline:
+            break
+        await asyncio.sleep(0.05)
+        value = await io_pool.run(get_cached_data, key)
+        if value is not None:
+            return value
+    try:
+        value = await compute()
+        await io_pool.run(set_cached_data, key, value)
+        return value
+    finally:
+        if token is not None:
+            await io_pool.run(cache_backend.unlock, key, token)
+
+async def cached_lookup(key, compute):
+    """读取缓存，未命中时调用compute()计算并写入，返回 (值, 缓存年龄秒数)
+
+    同一键同时只计算一次: 进程内的并发请求共用同一个计算，
+    共享后端时其他进程通过计算锁等待，避免缓存失效瞬间的请求风暴。
+    条目已过期或已被文件变化失效时直接返回旧值并在后台重建(stale-while-revalidate)；
+    旧值超出有效期(目录监听运行时从写入时算起)CACHE_STALE_MAX_AGE秒以上时不再返回，等待重建。
+    """
+    family = cache_family(key)
+    cache_refresher.track(key, compute)
+    entry = await cache_op(cache_backend.get_entry, key)
+    if entry is not None:
+        value, created, stale = entry
+        age = max(0.0, time.time() - created)
+        max_age = None if watcher_active() else cache_ttl(key)
+        if not stale and (max_age is None or age < max_age):
+            CACHE_REQUESTS.inc(family, "hit")
+            return value, age
+        # 已失效的条目同样受旧值年龄上限约束，超过时同步重建
+        overdue = age if max_age is None else age - max_age
+        if overdue < CACHE_STALE_MAX_AGE:
+            CACHE_REQUESTS.inc(family, "stale")
+            cache_refresher.trigger(key)
+            return value, age
+    CACHE_REQUESTS.inc(family, "coalesced" if key in cache_flight else "miss")
+    return await cache_flight.do(key, lambda: compute_with_lock(key, compute)), 0.0
+
+async def cached_call(key, compute):
+    """读取缓存，未命中时调用compute()计算并写入"""
+    value, _ = await cached_lookup(key, compute)
+    return value
+
+async def cached_json_response(request, key, compute):
+    """缓存序列化后的响应体和ETag，轮询命中缓存时不再重新序列化，ETag一致时返回304"""
+    async def compute_encoded():
+        encoded = await io_pool.run(EncodedJSON.encode, await compute())
+        # 共享后端只能保存JSON，进程内缓存直接保存编码结果
+        return encoded.to_cache() if cache_backend.shared else encoded
+    entry, age = await cached_lookup(key, compute_encoded)
+    encoded = entry if isinstance(entry, EncodedJSON) else EncodedJSON.from_cache(entry)
+    return await encoded_response(request, encoded, age)
+
+# 目录 -> 文件变化时需要失效的缓存键前缀
+WATCHED_CACHE_KEYS = {
+    LOGS_DIR: ("current_task", "system_stats", "logs_"),
+    DETECTED_JSON_DIR: ("task_history", "system_stats"),
+    DETECTED_IMAGES_DIR: ("task_history", "system_stats"),
+}
+
+def update_listing(listing, change, path):
+    """按文件事件更新文件列表索引"""
+    if change == "deleted":
+        listing.remove(path)
+    else:
+        listing.add(path)
+
+def on_directory_changes(changes):
+    """目录文件变化时只失效受影响的缓存"""
+    prefixes = set()
+    relink_timestamps = set()
+    result_paths = set()
+    for change, path in changes:
+        directory = Path(path).parent
+        prefixes.update(WATCHED_CACHE_KEYS.get(directory, ()))
+        if directory == DETECTED_JSON_DIR:
+            result_paths.add(path)
+            update_listing(json_listing, change, path)
+            document_cache.invalidate(path)
+        elif directory == DETECTED_IMAGES_DIR:
+            update_listing(image_listing, change, path)
+            if change == "deleted":
+                relink_timestamps |= image_map.remove(path)
+            else:
+                relink_timestamps |= image_map.add(path)
+                # 写入过程中的多次事件合并，文件大小稳定后才预生成
+                thumbnail_warmer.enqueue(path)
+    if relink_timestamps:
+        result_index.relink(relink_timestamps)
+    if result_paths:
+        # 结果索引和统计汇总随文件事件增量更新
+        result_index.update_paths(result_paths)
+    if prefixes:
+        invalidate_cache(*prefixes)
+
+dir_watcher = DirectoryWatcher(list(WATCHED_CACHE_KEYS), on_directory_changes)
+
+def cache_source_signature(key):
+    """缓存键数据来源的签名: 相关目录的mtime，日志目录另加最新日志文件的mtime和大小(追加写不改变目录mtime)"""
+    family = cache_family(key)
+    signature = []
+    for directory, prefixes in WATCHED_CACHE_KEYS.items():
+        if family not in {cache_family(prefix) for prefix in prefixes}:
+            continue
+        try:
+            signature.append(directory.stat().st_mtime_ns)
+        except OSError:
+            signature.append(None)
+        if directory == LOGS_DIR:
+            latest_log = find_latest_log()
+            if latest_log is not None:
+                stat = latest_log.stat()
+                signature.append((latest_log.name, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature) if signature else None
+
+async def refresh_cache_entry(key, compute):
+    """后台重建缓存条目，与同一键的前台计算合并"""
+    await cache_flight.do(key, lambda: compute_with_lock(key, compute))
+    CACHE_REFRESHES.inc(cache_family(key), "rebuild")
+
+def revalidate_cache_entry(key):
+    """数据来源未变化，延长缓存条目的有效期"""
+    if not cache_backend.touch(key):
+        return False
+    CACHE_REFRESHES.inc(cache_family(key), "revalidate")
+    return True
+
+cache_refresher = CacheRefresher(
+    refresh_cache_entry,
+    revalidate_cache_entry,
+    cache_source_signature,
+    cache_ttl,
+    io_pool.run,
+    # 目录监听运行时缓存由文件事件失效，不需要定期检查
+    periodic=lambda: not watcher_active(),
+    idle_timeout=CACHE_REFRESH_IDLE_TIMEOUT,
+)
+
+# 图片-任务关联表 - 单次扫描图片目录，随文件事件增量更新
+image_map = ImageTimestampMap(DETECTED_IMAGES_DIR)
+
+# 文件列表索引 - 图片和JSON结果文件按修改时间/大小/文件名有序，随文件事件增量更新
+RESULT_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif")
+image_listing = FileListing(DETECTED_IMAGES_DIR, RESULT_IMAGE_EXTENSIONS)
+json_listing = FileListing(DETECTED_JSON_DIR, (".json",))
+
+# 结果索引 - 历史记录查询直接走索引，只增量解析变化的文件；数据库在第一次使用时打开
+result_index = ResultIndex(RESULT_INDEX_PATH, DETECTED_JSON_DIR, image_map)
+document_cache = DocumentCache(JSON_CACHE_MAX_BYTES, JSON_STREAM_THRESHOLD)
+
+# 缩略图缓存 - 按源文件路径/mtime/大小寻址，新结果图片落盘后后台预生成
+# 请求处理中通过fetch分别使用io_pool和cpu_pool；runner只用于后台预生成线程
+thumbnail_cache = ThumbnailCache(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_BYTES, runner=cpu_pool.call)
+thumbnail_warmer = ThumbnailWarmer(thumbnail_cache, ["webp" if WEBP_SUPPORTED else "jpeg"])
+
+# 瓦片金字塔 - 大幅影像按需分层构建并缓存到磁盘
+tile_store = TileStore(TILE_CACHE_DIR, max_pixels=TILE_MAX_PIXELS)
+
+# 日志尾部读取器 - 记录每个日志文件的读取偏移，只读取追加内容
+log_tailer = LogTailer()
+
+# 日志全文索引 - 所有日志文件的关键词/级别/时间索引，只索引追加内容；数据库在第一次使用时打开
+log_index = LogIndex(LOG_INDEX_PATH, LOGS_DIR)
+
+def find_latest_log():
+    """获取最新的日志文件，没有时返回None"""
+    log_files = list(LOGS_DIR.glob("*.log")) if LOGS_DIR.exists() else []
+    if not log_files:
+        return None
+    return max(log_files, key=os.path.getctime)
+
+def run_maintenance():
+    """主进程定期维护: 广播目录监听状态、限制共享缓存大小、清理过期上传会话"""
+    if dir_watcher.active:
+        cache_backend.set(WATCHER_FLAG_KEY, True)
+    cache_backend.trim()
+    upload_store.expire()
+
+async def maintenance_loop():
+    while True:
+        try:
+            await io_pool.run(run_maintenance)
+        except Exception as e:
+            logger.warning(f"维护任务失败: {e}")
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
+
+async def log_index_loop():
+    """定期索引日志文件新追加的内容，首次运行时建立全部日志的索引"""
+    while True:
+        try:
+            await io_pool.run(log_index.sync)
+        except Exception as e:
+            logger.warning(f"日志索引更新失败: {e}")
+        await asyncio.sleep(LOG_INDEX_INTERVAL)
+
+background_tasks = []
+
+async def start_background_tasks():
+    """成为主进程后启动: 接管未完成的检测任务、目录监听、缩略图预生成和维护任务"""
+    await job_queue.recover()
+    thumbnail_warmer.start()
+    if os.environ.get("MONITOR_WATCH", "1") != "0":
+        dir_watcher.start()
+        # 监听启动后同步一次索引，之后由文件事件增量更新
+        await io_pool.run(result_index.sync)
+    background_tasks.append(asyncio.create_task(maintenance_loop()))
+    background_tasks.append(asyncio.create_task(log_index_loop()))
+
+leader = LeaderElection(LEADER_LOCK_PATH, start_background_tasks)
+
+@app.on_event("startup")
+async def startup_event():
+    """启动检测任务队列和事件循环延迟测量，选举主进程运行后台任务"""
+    loop_lag_monitor.start()
+    cache_refresher.start()
+    await inference_client.start()
+    await job_queue.start()
+    await leader.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """停止后台任务并关闭工作池"""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await job_queue.stop()
+    await inference_client.close()
+    dir_watcher.stop()
+    thumbnail_warmer.stop()
+    await leader.stop()
+    await cache_refresher.stop()
+    await loop_lag_monitor.stop()
+    io_pool.shutdown()
+    cpu_pool.shutdown()
+    cache_backend.close()
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
@@ -87,442 +527,1158 @@ async def test_layout(request: Request):
     """布局测试页面"""
     return FileResponse("test_layout.html")
 
+def load_current_task():
+    """读取最新日志判断当前任务状态"""
+    latest_log = find_latest_log()
+    if latest_log:
+        last_line = log_tailer.last_line(latest_log)
+        if last_line and "定时任务开始" in last_line:
+            return {
+                "status": "running",
+                "message": "推理任务正在运行中",
+                "last_update": datetime.now().isoformat(),
+                "log_file": str(latest_log)
+            }
+    return {
+        "status": "idle",
+        "message": "当前无运行中的任务",
+        "last_update": datetime.now().isoformat()
+    }
+
 @app.get("/api/tasks/current")
 async def get_current_task():
     """获取当前任务状态"""
     try:
-        # 检查缓存
-        cached_task = get_cached_data('current_task')
-        if cached_task:
-            return cached_task
-        
-        # 检查是否有正在运行的任务
-        log_files = list(LOGS_DIR.glob("*.log")) if LOGS_DIR.exists() else []
-        
-        if log_files:
-            # 获取最新的日志文件
-            latest_log = max(log_files, key=os.path.getctime)
-            with open(latest_log, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                if lines:
-                    last_line = lines[-1].strip()
-                    if "定时任务开始" in last_line:
-                        result = {
-                            "status": "running",
-                            "message": "推理任务正在运行中",
-                            "last_update": datetime.now().isoformat(),
-                            "log_file": str(latest_log)
-                        }
-                        set_cached_data('current_task', result)
-                        return result
-        
-        result = {
-            "status": "idle",
-            "message": "当前无运行中的任务",
-            "last_update": datetime.now().isoformat()
-        }
-        set_cached_data('current_task', result)
-        return result
+        return await cached_call('current_task', lambda: io_pool.run(load_current_task))
+    except PoolOverloaded:
+        raise
     except Exception as e:
         logger.error(f"获取当前任务状态失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def load_task_history(**query):
+    """查询历史任务；目录监听未运行时先增量同步索引"""
+    if not watcher_active():
+        result_index.sync()
+    else:
+        # 目录监听已按文件事件更新索引，不再扫描结果目录
+        result_index.relink(image_map.refresh_if_changed())
+    try:
+        return result_index.query(**query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/api/tasks/history")
-async def get_task_history():
+async def get_task_history(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="每页数量，不传则返回全部"),
+    offset: int = Query(0, ge=0, description="偏移量"),
+    cursor: Optional[str] = Query(None, description="分页游标，优先于offset"),
+    start_time: Optional[datetime] = Query(None, description="任务时间下限"),
+    end_time: Optional[datetime] = Query(None, description="任务时间上限")
+):
     """获取历史任务记录"""
     try:
-        # 检查缓存
-        cached_history = get_cached_data('task_history')
-        if cached_history:
-            return cached_history
-        
-        tasks = []
-        
-        # 从JSON结果文件中获取历史记录
-        if DETECTED_JSON_DIR.exists():
-            json_files = list(DETECTED_JSON_DIR.glob("*.json"))
-            for json_file in sorted(json_files, key=os.path.getctime, reverse=True):
-                try:
-                    with open(json_file, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    
-                    # 从文件名提取时间戳
-                    filename = json_file.stem
-                    if "detect_result_" in filename:
-                        timestamp_str = filename.replace("detect_result_", "")
-                        try:
-                            task_time = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-                        except:
-                            task_time = datetime.fromtimestamp(os.path.getctime(json_file))
-                    else:
-                        task_time = datetime.fromtimestamp(os.path.getctime(json_file))
-                    
-                    # 查找对应的图片文件
-                    image_files = []
-                    if DETECTED_IMAGES_DIR.exists():
-                        # 查找同时间戳的图片文件
-                        for img_ext in ["*.png", "*.jpg", "*.jpeg", "*.tif"]:
-                            pattern = f"*{timestamp_str}*{img_ext[1:]}"
-                            image_files.extend([str(f) for f in DETECTED_IMAGES_DIR.glob(pattern)])
-                    
-                    task_info = {
-                        "id": filename,
-                        "timestamp": task_time.isoformat(),
-                        "status": "completed",
-                        "result_path": str(json_file),
-                        "image_files": image_files,
-                        "summary": {
-                            "异常区域": data.get("异常区域检测", {}),
-                            "水利设施": data.get("重点水利设施检测", {}),
-                            "地物分类": data.get("地物分类", {}),
-                            "水体提取": data.get("水体自动提取", {})
-                        }
-                    }
-                    tasks.append(task_info)
-                except Exception as e:
-                    logger.warning(f"解析任务文件 {json_file} 失败: {e}")
-                    continue
-        
-        result = {"tasks": tasks}
-        set_cached_data('task_history', result)
-        return result
+        cache_key = f"task_history_{limit}_{offset}_{cursor}_{start_time}_{end_time}"
+        return await cached_json_response(request, cache_key, lambda: io_pool.run(
+            load_task_history,
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+            start_time=start_time,
+            end_time=end_time
+        ))
+    except (HTTPException, PoolOverloaded):
+        raise
     except Exception as e:
         logger.error(f"获取历史任务记录失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def parse_fields_param(fields):
+    """解析fields查询参数，格式错误时返回400"""
+    try:
+        return parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def load_result_document(json_file, paths):
+    """从解析缓存读取结果JSON，paths为要返回的字段"""
+    try:
+        return document_cache.get(json_file, paths)
+    except FieldNotFound as e:
+        raise HTTPException(status_code=404, detail=f"字段不存在: {e.args[0]}")
+
+def load_task_detail(task_id, paths=None):
+    """读取任务结果文件"""
+    json_file = DETECTED_JSON_DIR / f"{task_id}.json"
+    if not json_file.exists():
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    data = load_result_document(json_file, paths)
+    
+    return {
+        "id": task_id,
+        "data": data,
+        "result_path": str(json_file)
+    }
+
+def task_bundle_entries(task_id):
+    """任务打包内容: 结果JSON和关联的结果图片"""
+    json_file = DETECTED_JSON_DIR / f"{task_id}.json"
+    if not json_file.is_file():
+        raise HTTPException(status_code=404, detail="任务不存在")
+    timestamp_str = task_id.replace(RESULT_PREFIX, "") if RESULT_PREFIX in task_id else None
+    result_index.relink(image_map.refresh_if_changed())
+    entries = [(json_file.name, json_file)]
+    for image_path in image_map.get(timestamp_str):
+        entries.append((f"images/{os.path.basename(image_path)}", image_path))
+    return entries
+
+@app.get("/api/tasks/{task_id}/bundle")
+async def download_task_bundle(task_id: str):
+    """以ZIP流下载任务的结果JSON和所有关联图片，边读边压缩，不生成临时文件"""
+    try:
+        entries = await io_pool.run(task_bundle_entries, task_id)
+        return StreamingResponse(
+            iter_zip(entries),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{task_id}.zip"'}
+        )
+    except (HTTPException, PoolOverloaded):
+        raise
+    except Exception as e:
+        logger.error(f"打包任务结果失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/tasks/{task_id}")
-async def get_task_detail(task_id: str):
-    """获取特定任务的详细信息"""
+async def get_task_detail(
+    request: Request,
+    task_id: str,
+    fields: Optional[str] = Query(None, description="只返回指定字段，逗号分隔，嵌套字段用.分隔，如 地物分类,水体自动提取.面积")
+):
+    """获取特定任务的详细信息，文件未变化时返回304"""
     try:
-        json_file = DETECTED_JSON_DIR / f"{task_id}.json"
-        if not json_file.exists():
-            raise HTTPException(status_code=404, detail="任务不存在")
-        
-        with open(json_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        return {
-            "id": task_id,
-            "data": data,
-            "result_path": str(json_file)
-        }
+        paths = parse_fields_param(fields)
+        etag = await io_pool.run(json_file_etag, f"{task_id}.json", fields, "任务不存在")
+        not_modified = not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+        return await json_response(await io_pool.run(load_task_detail, task_id, paths), request, etag=etag)
+    except (HTTPException, PoolOverloaded):
+        raise
     except Exception as e:
         logger.error(f"获取任务详情失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def load_system_logs(limit):
+    """读取最新日志文件的最后limit行"""
+    logs = []
+    if LOGS_DIR.exists():
+        latest_log = find_latest_log()
+        if latest_log:
+            logger.info(f"读取日志文件: {latest_log}")
+            logs = log_tailer.tail(latest_log, limit)
+    else:
+        logger.warning(f"日志目录不存在: {LOGS_DIR}")
+    return {"logs": logs}
+
 @app.get("/api/logs")
-async def get_system_logs(limit: int = 100, force: int = Query(0, description="强制刷新缓存")):
+async def get_system_logs(request: Request, limit: int = 100, force: int = Query(0, description="强制刷新缓存")):
     """获取系统运行日志"""
     try:
         cache_key = f'logs_{limit}'
         if force:
-            set_cached_data(cache_key, None)  # 清除缓存
-        cached_logs = get_cached_data(cache_key)
-        if cached_logs:
-            return cached_logs
-        logs = []
-        if LOGS_DIR.exists():
-            log_files = list(LOGS_DIR.glob("*.log"))
-            if log_files:
-                latest_log = max(log_files, key=os.path.getctime)
-                logger.info(f"读取日志文件: {latest_log}")
-                try:
-                    with open(latest_log, 'r', encoding='utf-8') as f:
-                        lines = f.readlines()
-                        for line in lines[-limit:]:
-                            logs.append(line.strip())
-                except UnicodeDecodeError:
-                    with open(latest_log, 'r', encoding='gbk') as f:
-                        lines = f.readlines()
-                        for line in lines[-limit:]:
-                            logs.append(line.strip())
-        else:
-            logger.warning(f"日志目录不存在: {LOGS_DIR}")
-        result = {"logs": logs}
-        set_cached_data(cache_key, result)
-        return result
+            await cache_op(cache_backend.delete, cache_key)  # 清除缓存
+        return await cached_json_response(request, cache_key, lambda: io_pool.run(load_system_logs, limit))
+    except PoolOverloaded:
+        raise
     except Exception as e:
         logger.error(f"获取系统日志失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def search_system_logs(level=None, **query):
+    """查询已建立的日志索引；索引由主进程的log_index_loop在后台建立和跟进，请求中不读取日志文件"""
+    try:
+        return log_index.search(levels=parse_levels(level), **query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/logs/search")
+async def search_logs(
+    request: Request,
+    q: Optional[str] = Query(None, description="关键词，空格分隔的多个关键词需同时出现"),
+    level: Optional[str] = Query(None, description="日志级别，逗号分隔，如 ERROR,WARNING"),
+    start_time: Optional[datetime] = Query(None, description="日志时间下限"),
+    end_time: Optional[datetime] = Query(None, description="日志时间上限"),
+    limit: int = Query(100, ge=1, le=1000, description="每页数量"),
+    cursor: Optional[str] = Query(None, description="分页游标"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="按时间排序的方向"),
+    with_total: Optional[bool] = Query(None, description="是否返回匹配总数，默认只在第一页返回")
+):
+    """在所有日志文件中按关键词、级别和时间范围搜索"""
+    try:
+        return await json_response(await io_pool.run(
+            search_system_logs,
+            q=q,
+            level=level,
+            start_time=start_time,
+            end_time=end_time,
+            limit=limit,
+            cursor=cursor,
+            descending=order == "desc",
+            with_total=with_total
+        ), request)
+    except (HTTPException, PoolOverloaded):
+        raise
+    except Exception as e:
+        logger.error(f"搜索日志失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def stats_series(period, count, step, fmt):
+    """最近count个小时/天的汇总序列，没有任务的桶补0"""
+    now = datetime.now()
+    if period == "hour":
+        start = now.replace(minute=0, second=0, microsecond=0) - (count - 1) * step
+    else:
+        start = now.replace(hour=0, minute=0, second=0, microsecond=0) - (count - 1) * step
+    buckets = [(start + i * step).strftime(fmt) for i in range(count)]
+    counts = result_index.rollups(period, buckets[0])
+    return [{"time": bucket, **counts.get(bucket, {"tasks": 0, "images": 0})} for bucket in buckets]
+
+def load_system_stats(hours, days):
+    """从结果索引的汇总表读取任务数、图片数和按小时/天的趋势，不扫描目录"""
+    if not watcher_active():
+        # 目录监听未运行时由目录扫描同步索引(只在缓存过期后执行)
+        result_index.sync()
+    else:
+        # 主进程的目录监听已按文件事件更新索引，这里只检查图片目录是否变化
+        result_index.relink(image_map.refresh_if_changed())
+    counters = result_index.counters()
+    latest = counters["latest_ctime"]
+    return {
+        "total_tasks": counters["tasks"],
+        "completed_tasks": counters["tasks"],
+        "total_images": len(image_map),
+        "last_task_time": datetime.fromtimestamp(latest).isoformat() if latest is not None else None,
+        "system_status": "unknown",
+        "hourly": stats_series("hour", hours, timedelta(hours=1), "%Y-%m-%dT%H:00:00"),
+        "daily": stats_series("day", days, timedelta(days=1), "%Y-%m-%d"),
+    }
+
 @app.get("/api/stats")
-async def get_system_stats():
+async def get_system_stats(
+    request: Request,
+    hours: int = Query(24, ge=1, le=24 * 31, description="按小时汇总的小时数"),
+    days: int = Query(30, ge=1, le=366, description="按天汇总的天数")
+):
     """获取系统统计信息"""
     try:
-        # 检查缓存
-        cached_stats = get_cached_data('system_stats')
-        if cached_stats:
-            return cached_stats
-        
-        stats = {
-            "total_tasks": 0,
-            "completed_tasks": 0,
-            "total_images": 0,
-            "last_task_time": None,
-            "system_status": "unknown"
-        }
+        async def compute_stats():
+            stats = await io_pool.run(load_system_stats, hours, days)
+            # 检查系统状态
+            current_task = await get_current_task()
+            stats["system_status"] = current_task["status"]
+            return stats
         
-        # 统计任务数量
-        if DETECTED_JSON_DIR.exists():
-            json_files = list(DETECTED_JSON_DIR.glob("*.json"))
-            stats["total_tasks"] = len(json_files)
-            stats["completed_tasks"] = len(json_files)
-            
-            if json_files:
-                latest_file = max(json_files, key=os.path.getctime)
-                stats["last_task_time"] = datetime.fromtimestamp(os.path.getctime(latest_file)).isoformat()
-        
-        # 统计图片数量
-        if DETECTED_IMAGES_DIR.exists():
-            image_files = []
-            for ext in ["*.png", "*.jpg", "*.jpeg", "*.tif"]:
-                image_files.extend(list(DETECTED_IMAGES_DIR.glob(ext)))
-            stats["total_images"] = len(image_files)
-        
-        # 检查系统状态
-        current_task = await get_current_task()
-        stats["system_status"] = current_task["status"]
-        
-        # 缓存结果
-        set_cached_data('system_stats', stats)
-        
-        return stats
+        return await cached_json_response(request, f'system_stats_{hours}_{days}', compute_stats)
+    except PoolOverloaded:
+        raise
     except Exception as e:
         logger.error(f"获取系统统计信息失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def image_item(info):
+    """结果图片列表条目"""
+    return {
+        "filename": info.name,
+        "path": info.path,
+        "size_mb": round(info.size / (1024 * 1024), 2),
+        "created_time": datetime.fromtimestamp(info.ctime).isoformat(),
+        "modified_time": datetime.fromtimestamp(info.mtime).isoformat()
+    }
+
+def json_file_item(info):
+    """JSON结果文件列表条目"""
+    return {
+        "filename": info.name,
+        "path": info.path,
+        "size_kb": round(info.size / 1024, 2),
+        "created_time": datetime.fromtimestamp(info.ctime).isoformat(),
+        "modified_time": datetime.fromtimestamp(info.mtime).isoformat()
+    }
+
+class ListingQuery:
+    """文件列表的分页、排序和过滤参数"""
+
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, le=1000, description="每页数量，不传则返回全部"),
+        cursor: Optional[str] = Query(None, description="分页游标"),
+        sort: str = Query("mtime", pattern="^(mtime|size|name)$", description="排序字段"),
+        order: str = Query("desc", pattern="^(asc|desc)$", description="排序方向"),
+        extension: Optional[str] = Query(None, description="扩展名过滤，逗号分隔，如 png,jpg"),
+        prefix: Optional[str] = Query(None, description="文件名前缀"),
+        start_time: Optional[datetime] = Query(None, description="修改时间下限"),
+        end_time: Optional[datetime] = Query(None, description="修改时间上限"),
+        format: str = Query("json", pattern="^(json|ndjson)$", description="ndjson时逐行流式返回全部匹配条目")
+    ):
+        self.format = format
+        self.params = {
+            "sort": sort,
+            "descending": order == "desc",
+            "limit": None if format == "ndjson" else limit,
+            "cursor": cursor,
+            "extensions": [ext for ext in extension.split(",") if ext.strip()] if extension else None,
+            "prefix": prefix or None,
+            "start_time": start_time.timestamp() if start_time else None,
+            "end_time": end_time.timestamp() if end_time else None,
+        }
+
+def query_listing(listing, **params):
+    """查询文件列表索引"""
+    try:
+        return listing.query(**params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def load_listing_page(listing, key, to_item, **params):
+    """查询一页文件列表并转换为响应条目"""
+    page = query_listing(listing, **params)
+    return {key: [to_item(info) for info in page["items"]], "total": page["total"], "next_cursor": page["next_cursor"]}
+
+def listing_version(listing):
+    """检查目录变化后返回索引版本"""
+    listing.refresh_if_changed()
+    return listing.version
+
+def iter_ndjson(items, to_item, batch_size=500):
+    """逐行生成NDJSON，按批编码减少小块写出"""
+    for start in range(0, len(items), batch_size):
+        yield b"".join(dumps(to_item(info)) + b"\n" for info in items[start:start + batch_size])
+
+async def listing_response(request, listing, query, key, to_item):
+    """按查询参数返回分页JSON或NDJSON流，ETag由索引版本和查询参数生成，未变化时返回304"""
+    version = await io_pool.run(listing_version, listing)
+    etag = make_etag(listing.instance, version, query.format, sorted(query.params.items()))
+    not_modified = not_modified_response(request, etag)
+    if not_modified is not None:
+        return not_modified
+    if query.format == "ndjson":
+        page = await io_pool.run(query_listing, listing, **query.params)
+        return StreamingResponse(
+            iter_ndjson(page["items"], to_item),
+            media_type="application/x-ndjson",
+            headers={"X-Total-Count": str(page["total"]), "ETag": etag, "Cache-Control": "no-cache"}
+        )
+    page = await io_pool.run(load_listing_page, listing, key, to_item, **query.params)
+    return await json_response(page, request, etag=etag)
+
 @app.get("/api/images")
-async def get_detected_images():
+async def get_detected_images(request: Request, query: ListingQuery = Depends()):
     """获取检测结果图片列表"""
     try:
-        images = []
-        if DETECTED_IMAGES_DIR.exists():
-            for ext in ["*.png", "*.jpg", "*.jpeg", "*.tif"]:
-                for img_file in DETECTED_IMAGES_DIR.glob(ext):
-                    try:
-                        # 获取文件信息
-                        stat = img_file.stat()
-                        file_size = stat.st_size
-                        file_size_mb = file_size / (1024 * 1024)
-                        
-                        images.append({
-                            "filename": img_file.name,
-                            "path": str(img_file),
-                            "size_mb": round(file_size_mb, 2),
-                            "created_time": datetime.fromtimestamp(stat.st_ctime).isoformat(),
-                            "modified_time": datetime.fromtimestamp(stat.st_mtime).isoformat()
-                        })
-                    except Exception as e:
-                        logger.warning(f"获取图片信息失败 {img_file}: {e}")
-                        continue
-        
-        # 按修改时间排序，最新的在前
-        images.sort(key=lambda x: x["modified_time"], reverse=True)
-        return {"images": images}
+        return await listing_response(request, image_listing, query, "images", image_item)
+    except (HTTPException, PoolOverloaded):
+        raise
     except Exception as e:
         logger.error(f"获取检测结果图片失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def is_not_modified(request: Request, etag, mtime):
+    """根据If-None-Match/If-Modified-Since判断客户端缓存是否仍然有效
+
+    If-None-Match按弱比较: 忽略W/前缀，支持逗号分隔的多个ETag和*。
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def stat_detected_image(filename):
+    """获取结果图片的stat，不存在时返回404"""
+    image_path = DETECTED_IMAGES_DIR / filename
+    try:
+        return image_path, image_path.stat()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="图片不存在")
+
 @app.get("/api/images/{filename}/thumbnail")
-async def get_image_thumbnail(filename: str):
+async def get_image_thumbnail(
+    filename: str,
+    request: Request,
+    encoding: str = Query("binary", description="binary: 直接返回图片; base64: 兼容旧版JSON格式")
+):
     """获取图片缩略图"""
     try:
-        image_path = DETECTED_IMAGES_DIR / filename
-        if not image_path.exists():
-            raise HTTPException(status_code=404, detail="图片不存在")
+        image_path, stat = await io_pool.run(stat_detected_image, filename)
         
-        # 创建缩略图
-        with Image.open(image_path) as img:
-            # 计算缩略图尺寸，保持宽高比
-            max_size = (400, 300)
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
-            # 转换为base64
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            img_str = base64.b64encode(buffer.getvalue()).decode()
-            
-            return {"thumbnail": f"data:image/png;base64,{img_str}"}
+        fmt = ThumbnailCache.choose_format(request.headers.get("accept"))
+        key = thumbnail_cache.cache_key(str(image_path), stat, fmt)
+        etag = f'"{key}"'
+        headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+            "Cache-Control": "no-cache",
+            "Vary": "Accept"
+        }
+        if encoding == "binary" and is_not_modified(request, etag, stat.st_mtime):
+            return Response(status_code=304, headers=headers)
+        
+        # 缓存查找在线程池中进行，未命中时解码和编码交给进程池，等待渲染时不占用IO线程
+        thumbnail_path, _ = await thumbnail_cache.fetch(str(image_path), stat, fmt, io_pool.run, cpu_pool.run)
+        media_type = f"image/{fmt}"
+        if encoding == "base64":
+            data = await io_pool.run(thumbnail_path.read_bytes)
+            img_str = base64.b64encode(data).decode()
+            return {"thumbnail": f"data:{media_type};base64,{img_str}"}
+        return FileResponse(thumbnail_path, media_type=media_type, headers=headers)
+    except (HTTPException, PoolOverloaded):
+        raise
     except Exception as e:
         logger.error(f"生成缩略图失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def load_tile_pyramid(filename):
+    """获取结果图片的瓦片金字塔"""
+    image_path, _ = stat_detected_image(filename)
+    return tile_store.get(image_path)
+
+@app.get("/api/images/{filename}/tiles")
+async def get_image_tiles_info(filename: str):
+    """获取影像瓦片金字塔信息"""
+    try:
+        pyramid = await io_pool.run(load_tile_pyramid, filename)
+        return {"filename": filename, **pyramid.meta}
+    except (HTTPException, PoolOverloaded):
+        raise
+    except Exception as e:
+        logger.error(f"获取瓦片信息失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/images/{filename}/tiles/{z}/{x}/{y}")
+async def get_image_tile(filename: str, z: int, x: int, y: int, request: Request):
+    """获取影像瓦片"""
+    try:
+        pyramid = await io_pool.run(load_tile_pyramid, filename)
+        etag = f'"{pyramid.key}_{z}_{x}_{y}"'
+        headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+        if is_not_modified(request, etag, None):
+            return Response(status_code=304, headers=headers)
+        
+        # 层级未构建时由进程池构建，等待构建时不占用IO线程
+        tile_path = await pyramid.fetch(z, x, y, io_pool.run, cpu_pool.run)
+        if tile_path is None:
+            raise HTTPException(status_code=404, detail="瓦片不存在")
+        return FileResponse(tile_path, media_type=TILE_MEDIA_TYPE, headers=headers)
+    except (HTTPException, PoolOverloaded):
+        raise
+    except ImageTooLarge as e:
+        logger.warning(f"拒绝构建瓦片 {filename}: {e}")
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logger.error(f"获取瓦片失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/images/{filename}/download")
-async def download_image(filename: str):
-    """下载原始图片"""
+async def download_image(request: Request, filename: str):
+    """下载原始图片，支持Range断点续传"""
     try:
-        image_path = DETECTED_IMAGES_DIR / filename
-        if not image_path.exists():
-            raise HTTPException(status_code=404, detail="图片不存在")
+        image_path, stat = await io_pool.run(stat_detected_image, filename)
         
-        return FileResponse(
-            path=image_path,
+        return RangeFileResponse(
+            image_path,
+            request,
+            stat_result=stat,
             filename=filename,
             media_type='application/octet-stream'
         )
+    except (HTTPException, PoolOverloaded):
+        raise
     except Exception as e:
         logger.error(f"下载图片失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/json-files")
-async def get_json_files():
+async def get_json_files(request: Request, query: ListingQuery = Depends()):
     """获取JSON结果文件列表"""
     try:
-        json_files = []
-        if DETECTED_JSON_DIR.exists():
-            for json_file in DETECTED_JSON_DIR.glob("*.json"):
-                try:
-                    stat = json_file.stat()
-                    file_size = stat.st_size
-                    file_size_kb = file_size / 1024
-                    
-                    json_files.append({
-                        "filename": json_file.name,
-                        "path": str(json_file),
-                        "size_kb": round(file_size_kb, 2),
-                        "created_time": datetime.fromtimestamp(stat.st_ctime).isoformat(),
-                        "modified_time": datetime.fromtimestamp(stat.st_mtime).isoformat()
-                    })
-                except Exception as e:
-                    logger.warning(f"获取JSON文件信息失败 {json_file}: {e}")
-                    continue
-        
-        # 按修改时间排序，最新的在前
-        json_files.sort(key=lambda x: x["modified_time"], reverse=True)
-        return {"json_files": json_files}
+        return await listing_response(request, json_listing, query, "json_files", json_file_item)
+    except (HTTPException, PoolOverloaded):
+        raise
     except Exception as e:
         logger.error(f"获取JSON文件列表失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def json_file_etag(filename, fields=None, not_found="文件不存在"):
+    """由文件mtime、大小和请求的字段生成ETag，文件不存在时返回404"""
+    try:
+        stat = (DETECTED_JSON_DIR / filename).stat()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=not_found)
+    return make_etag(filename, stat.st_mtime_ns, stat.st_size, fields or "")
+
+def load_json_content(filename, paths=None):
+    """读取JSON结果文件内容"""
+    json_path = DETECTED_JSON_DIR / filename
+    if not json_path.exists():
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    return {"content": load_result_document(json_path, paths)}
+
 @app.get("/api/json-files/{filename}/content")
-async def get_json_content(filename: str):
-    """获取JSON文件内容"""
+async def get_json_content(
+    request: Request,
+    filename: str,
+    fields: Optional[str] = Query(None, description="只返回指定字段，逗号分隔，嵌套字段用.分隔")
+):
+    """获取JSON文件内容，文件未变化时返回304"""
     try:
-        json_path = DETECTED_JSON_DIR / filename
-        if not json_path.exists():
-            raise HTTPException(status_code=404, detail="文件不存在")
-        
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        return {"content": data}
+        paths = parse_fields_param(fields)
+        etag = await io_pool.run(json_file_etag, filename, fields)
+        not_modified = not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+        return await json_response(await io_pool.run(load_json_content, filename, paths), request, etag=etag)
+    except (HTTPException, PoolOverloaded):
+        raise
     except Exception as e:
         logger.error(f"读取JSON文件失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/workers")
+async def get_worker_metrics():
+    """获取工作池和事件循环延迟指标"""
+    return {
+        "pools": {pool.name: pool.metrics() for pool in (io_pool, cpu_pool)},
+        "event_loop_lag": loop_lag_monitor.metrics(),
+        "inference": inference_client.metrics(),
+        "cache_refresh": cache_refresher.stats(),
+        "json_documents": document_cache.stats(),
+        "log_index": log_index.stats()
+    }
+
+# 导出时从各组件读取的当前状态
+Gauge(
+    "monitor_pool_tasks", "工作池中执行和排队的任务数", ("pool", "state"),
+    collect=lambda: {
+        (pool.name, state): metrics[state]
+        for pool in (io_pool, cpu_pool)
+        for metrics in (pool.metrics(),)
+        for state in ("active", "queued")
+    },
+)
+Gauge(
+    "monitor_inference_requests", "推理服务在途和排队的请求数", ("state",),
+    collect=lambda: {(state,): inference_client.metrics()[state] for state in ("in_flight", "queued")},
+)
+Gauge(
+    "monitor_inference_circuit_state", "推理服务熔断状态，当前状态为1", ("state",),
+    collect=lambda: {
+        (state,): int(inference_client.metrics()["circuit_state"] == state)
+        for state in ("closed", "open", "half_open")
+    },
+)
+
+@app.get("/metrics")
+async def get_prometheus_metrics():
+    """Prometheus格式的运行指标(当前工作进程)"""
+    return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/api/detection-cache")
+async def get_detection_cache_stats():
+    """获取检测结果缓存统计"""
+    return detection_cache.stats()
+
 @app.get("/api/clear-cache")
 async def clear_cache_endpoint():
     """清除所有缓存"""
     try:
-        clear_cache()
-        return {"message": "缓存已清除", "timestamp": datetime.now().isoformat()}
+        await cache_op(clear_cache)
+        return {"message": "缓存已清除", "backend": cache_backend.name, "timestamp": datetime.now().isoformat()}
     except Exception as e:
         logger.error(f"清除缓存失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+inference_client = InferenceClient(
+    INFERENCE_URL,
+    max_in_flight=INFERENCE_MAX_IN_FLIGHT,
+    max_queue=INFERENCE_MAX_QUEUE,
+    queue_timeout=INFERENCE_QUEUE_TIMEOUT,
+    request_timeout=INFERENCE_TIMEOUT,
+    retries=INFERENCE_RETRIES,
+    failure_threshold=INFERENCE_FAILURE_THRESHOLD,
+    reset_timeout=INFERENCE_RESET_TIMEOUT
+)
+
+def find_result_image(result):
+    """从推理API返回的json里提取结果图片名，找不到时返回本地最新的图片
+
+    返回 (图片名, 是否来自推理结果)，兜底得到的图片不写入检测结果缓存
+    """
+    result_image_filename = ""
+    if isinstance(result, dict):
+        result_image_path = result.get("最终检测结果路径", "")
+        if not result_image_path and 'data' in result and isinstance(result['data'], dict):
+            result_image_path = result['data'].get("最终检测结果路径", "")
+        if not result_image_path:
+            for key in result.keys():
+                if "检测结果路径" in key and isinstance(result[key], str):
+                    result_image_path = result[key]
+                    break
+        if result_image_path:
+            result_image_filename = os.path.basename(result_image_path)
+    if result_image_filename and (DETECTED_IMAGES_DIR / result_image_filename).exists():
+        return result_image_filename, True
+    # 兜底：无论如何都要返回本地最新的图片
+    image_files = sorted(DETECTED_IMAGES_DIR.glob('*.png'), key=os.path.getctime, reverse=True)
+    if image_files:
+        result_image_filename = image_files[0].name
+    return result_image_filename, False
+
+async def run_detection_job(job):
+    """检测任务处理函数 - 调用推理API并整理结果"""
+    params = job["params"]
+    detect_data = params["detect_data"]
+    logger.info(f"开始检测图片: {params['uploaded_file']}")
+    logger.info(f"检测参数: {detect_data}")
+    
+    cache_key = params.get("cache_key")
+    status = "failed"
+    try:
+        started = time.time()
+        result = await inference_client.detect(detect_data)
+        run_ms = round((time.time() - started) * 1000, 1)
+        logger.info(f"检测成功: {result}")
+        result_image_filename, from_result = await io_pool.run(find_result_image, result)
+        response = {
+            "status": "success",
+            "message": "检测完成",
+            "timestamp": datetime.now().isoformat(),
+            "result_json": result,
+            "result_images": [result_image_filename] if result_image_filename else [],
+            "uploaded_file": params["uploaded_file"]
+        }
+        if cache_key and from_result:
+            try:
+                await io_pool.run(
+                    detection_cache.store, cache_key, response, params["image_sha256"], params["cache_params"], run_ms
+                )
+            except Exception as e:
+                logger.warning(f"保存检测结果缓存失败: {e}")
+        status = "success"
+        return response
+    finally:
+        DETECTION_JOBS.inc(status)
+        if cache_key and pending_detections.get(cache_key) == job["id"]:
+            del pending_detections[cache_key]
+
+job_queue = JobQueue(JOBS_DIR, run_detection_job, concurrency=DETECT_CONCURRENCY)
+
+upload_store = UploadStore(UPLOAD_DIR, UPLOAD_SESSIONS_DIR, expire_hours=UPLOAD_SESSION_EXPIRE_HOURS)
+
+def save_upload(upload_file):
+    """保存上传的图片，返回保存路径"""
+    # 创建上传目录
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    image_path = unique_upload_path(UPLOAD_DIR, upload_file.filename)
+    
+    # 保存上传的图片
+    with open(image_path, "wb") as buffer:
+        shutil.copyfileobj(upload_file.file, buffer)
+    return image_path
+
+def parse_categories(categories):
+    """解析类别JSON"""
+    try:
+        return json.loads(categories)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="categories 必须是JSON数组")
+
+def detection_params(categories, is_change_detection, is_only_change_detection, legend_required):
+    """推理API的检测参数，按请求原样转发；规范化的参数只用于计算缓存键"""
+    return {
+        "categories": parse_categories(categories),
+        "is_change_detection": is_change_detection,
+        "is_only_change_detection": is_only_change_detection,
+        "legend_required": legend_required,
+    }
+
+detection_cache = DetectionResultCache(DETECTION_CACHE_DIR, DETECTED_IMAGES_DIR, DETECTION_CACHE_MAX_BYTES)
+pending_detections = {}  # 缓存键 -> 正在执行的检测任务ID，相同图片和参数的请求共用一个任务
+
+def queued_response(job, uploaded_file, **extra):
+    """检测任务已排队的响应"""
+    return {
+        "status": "queued",
+        "message": "检测任务已提交",
+        "job_id": job["id"],
+        "uploaded_file": uploaded_file,
+        "status_url": f"/api/jobs/{job['id']}",
+        "events_url": f"/api/jobs/{job['id']}/events",
+        **extra
+    }
+
+async def wait_for_job(job_id):
+    """等待检测任务完成并返回检测结果"""
+    job = await job_queue.wait(job_id)
+    if job["status"] != DONE:
+        raise HTTPException(status_code=500, detail=job["error"])
+    return job["result"]
+
+async def find_existing_detection(cache_key, wait):
+    """相同图片和参数已有检测结果或正在检测时直接返回，否则返回None"""
+    cached = await io_pool.run(detection_cache.lookup, cache_key)
+    if cached is not None:
+        logger.info(f"命中检测结果缓存: {cache_key}")
+        return {**cached, "cached": True, "timestamp": datetime.now().isoformat()}
+    job_id = pending_detections.get(cache_key)
+    job = job_queue.get(job_id) if job_id else None
+    if job is None or job["status"] in FINISHED_STATES:
+        return None
+    logger.info(f"相同检测正在执行，复用任务: {job_id}")
+    if wait:
+        return await wait_for_job(job_id)
+    return queued_response(job, job["params"]["uploaded_file"], deduplicated=True)
+
+async def submit_detection(image_path, detect_params, wait, image_sha256=None, cache_key=None, **extra):
+    """为已保存的图片提交检测任务，wait为True时等待检测完成"""
+    # 准备调用推理API的数据
+    detect_data = {
+        "image_to_be_detected_address": str(image_path),
+        **detect_params
+    }
+    job = await job_queue.submit("detect", {
+        "uploaded_file": image_path.name,
+        "detect_data": detect_data,
+        "image_sha256": image_sha256,
+        "cache_key": cache_key,
+        "cache_params": normalize_params(**detect_params),
+        **extra
+    })
+    if cache_key:
+        pending_detections[cache_key] = job["id"]
+    logger.info(f"检测任务已排队: {job['id']} ({image_path.name})")
+    
+    if wait:
+        return await wait_for_job(job["id"])
+    return queued_response(job, image_path.name, **extra)
+
 @app.post("/api/upload-and-detect")
 async def upload_and_detect(
     image: UploadFile = File(...),
     categories: str = Form(...),
     is_change_detection: bool = Form(True),
     is_only_change_detection: bool = Form(False),
-    legend_required: bool = Form(False)
+    legend_required: bool = Form(False),
+    wait: bool = Form(False, description="等待检测完成后再返回(兼容旧版调用)"),
+    use_cache: bool = Form(True, description="相同图片和参数命中缓存时直接返回已有结果")
 ):
-    """上传图片并进行检测"""
+    """上传图片并提交检测任务，立即返回任务ID"""
     try:
-        # 创建上传目录
-        upload_dir = DATA_DIR / "uploaded_images"
-        upload_dir.mkdir(exist_ok=True)
-        
-        # 生成唯一文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        original_filename = image.filename or "unknown"
-        file_extension = Path(original_filename).suffix
-        unique_filename = f"upload_{timestamp}{file_extension}"
-        image_path = upload_dir / unique_filename
-        
-        # 保存上传的图片
-        with open(image_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-        
-        # 解析类别
-        categories_list = json.loads(categories)
+        detect_params = detection_params(categories, is_change_detection, is_only_change_detection, legend_required)
+        cache_params = normalize_params(**detect_params)
+        # 先对上传的临时文件计算哈希，命中缓存时不再保存副本
+        image_sha256 = await io_pool.run(hash_fileobj, image.file)
+        cache_key = result_cache_key(image_sha256, cache_params)
+        if use_cache:
+            existing = await find_existing_detection(cache_key, wait)
+            if existing is not None:
+                return existing
+        image_path = await io_pool.run(save_upload, image)
+        return await submit_detection(image_path, detect_params, wait, image_sha256, cache_key)
+    except (HTTPException, PoolOverloaded):
+        raise
+    except Exception as e:
+        logger.error(f"上传检测失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def upload_conflict(e):
+    """偏移冲突返回409，并带上服务端已确认的偏移供客户端续传"""
+    return JSONResponse(
+        status_code=409,
+        content={"detail": str(e), "offset": e.offset},
+        headers={"Upload-Offset": str(e.offset)}
+    )
+
+@app.post("/api/uploads")
+async def create_upload(
+    filename: str = Form(...),
+    size: Optional[int] = Form(None, description="文件总字节数，提供时完成前校验大小")
+):
+    """创建分块上传会话"""
+    try:
+        status = await io_pool.run(upload_store.create, filename, size)
+        return {**status, "chunk_size": UPLOAD_CHUNK_SIZE}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PoolOverloaded:
+        raise
+    except Exception as e:
+        logger.error(f"创建上传会话失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    """获取上传会话状态，offset为服务端已确认的字节数，客户端从此处续传"""
+    try:
+        status = upload_store.get(upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="上传会话不存在或已过期")
+    return JSONResponse(content=status, headers={"Upload-Offset": str(status["offset"])})
+
+@app.put("/api/uploads/{upload_id}")
+async def append_upload(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    """从offset追加一段数据，请求体为原始字节流，边接收边写入和计算哈希"""
+    try:
+        status = upload_store.get(upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="上传会话不存在或已过期")
+    content_length = request.headers.get("content-length")
+    if status["total_size"] is not None and content_length is not None \
+            and offset + int(content_length) > status["total_size"]:
+        raise HTTPException(status_code=400, detail=f"数据超出声明的文件大小 {status['total_size']}")
+
+    try:
+        session = await io_pool.run(upload_store.begin_append, upload_id, offset)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="上传会话不存在或已过期")
+    except UploadConflict as e:
+        return upload_conflict(e)
+    
+    buffer = bytearray()
+    disconnected = False
+    try:
+        try:
+            async for chunk in request.stream():
+                buffer += chunk
+                if len(buffer) >= UPLOAD_WRITE_BUFFER:
+                    await io_pool.run(upload_store.write, session, bytes(buffer))
+                    buffer.clear()
+        except ClientDisconnect:
+            # 已收到的数据照常写入，客户端重连后从确认的偏移续传
+            disconnected = True
+            logger.warning(f"上传连接中断: {upload_id}，已接收 {session.offset + len(buffer)} 字节")
+        if buffer:
+            await io_pool.run(upload_store.write, session, bytes(buffer))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        # 必须释放会话，不经过有排队上限的工作池
+        status = await asyncio.to_thread(upload_store.end_append, session)
+    
+    if disconnected:
+        return Response(status_code=204)
+    return JSONResponse(content=status, headers={"Upload-Offset": str(status["offset"])})
+
+@app.post("/api/uploads/{upload_id}/finalize")
+async def finalize_upload(
+    upload_id: str,
+    categories: str = Form(...),
+    is_change_detection: bool = Form(True),
+    is_only_change_detection: bool = Form(False),
+    legend_required: bool = Form(False),
+    sha256: Optional[str] = Form(None, description="客户端计算的SHA-256，提供时校验"),
+    wait: bool = Form(False),
+    use_cache: bool = Form(True)
+):
+    """完成上传并提交检测任务"""
+    try:
+        detect_params = detection_params(categories, is_change_detection, is_only_change_detection, legend_required)
+        cache_params = normalize_params(**detect_params)
+        try:
+            image_path, digest, size = await io_pool.run(upload_store.finalize, upload_id, sha256)
+        except UploadNotFound:
+            raise HTTPException(status_code=404, detail="上传会话不存在或已过期")
+        except UploadConflict as e:
+            return upload_conflict(e)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        cache_key = result_cache_key(digest, cache_params)
+        if use_cache:
+            existing = await find_existing_detection(cache_key, wait)
+            if existing is not None:
+                # 已有相同图片的检测结果，不保留重复的上传文件
+                await io_pool.run(os.remove, image_path)
+                return {**existing, "sha256": digest, "size": size}
+        return await submit_detection(image_path, detect_params, wait, digest, cache_key, sha256=digest, size=size)
+    except (HTTPException, PoolOverloaded):
+        raise
+    except Exception as e:
+        logger.error(f"完成上传失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/api/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    """取消上传"""
+    try:
+        await io_pool.run(upload_store.abort, upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="上传会话不存在或已过期")
+    except UploadConflict as e:
+        return upload_conflict(e)
+    return {"status": "success", "message": "上传已取消"}
+
+batch_store = BatchStore(BATCHES_DIR)
+
+def save_batch_files(files, on_scene):
+    """保存批量上传的影像，压缩包边解压边提交，返回 (影像数, 错误列表)
+
+    超出影像数或解压预算时停止，已解压的影像照常检测，错误列表中说明原因。
+    """
+    total = 0
+    errors = []
+    budget = ExtractBudget(BATCH_MAX_MEMBER_BYTES, BATCH_MAX_TOTAL_BYTES, BATCH_MAX_MEMBERS)
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    for upload in files:
+        filename = upload.filename or "unknown"
+        try:
+            if is_archive(filename):
+                total += extract_archive(
+                    upload.file, filename, UPLOAD_DIR, BATCH_MAX_ITEMS - total, on_scene, budget
+                )
+            elif filename.lower().endswith(IMAGE_EXTENSIONS):
+                if total >= BATCH_MAX_ITEMS:
+                    raise BatchTooLarge(f"批次影像数超过上限 {BATCH_MAX_ITEMS}")
+                image_path, sha256 = save_stream(upload.file, UPLOAD_DIR, filename, budget)
+                total += 1
+                on_scene(filename, image_path, sha256)
+            else:
+                errors.append({"filename": filename, "error": "不支持的文件类型"})
+        except BatchTooLarge as e:
+            errors.append({"filename": filename, "error": str(e)})
+            break
+        except (zipfile.BadZipFile, tarfile.TarError, OSError) as e:
+            logger.error(f"解压 {filename} 失败: {e}")
+            errors.append({"filename": filename, "error": f"解压失败: {e}"})
+    return total, errors
+
+async def add_batch_scene(batch, detect_params, use_cache, original_filename, image_path, image_sha256):
+    """为批次中的一景影像提交检测任务，命中缓存或相同检测正在执行时复用"""
+    item = {"original_filename": original_filename, "uploaded_file": image_path.name, "sha256": image_sha256}
+    cache_key = result_cache_key(image_sha256, normalize_params(**detect_params))
+    existing = await find_existing_detection(cache_key, wait=False) if use_cache else None
+    if existing is not None:
+        await io_pool.run(os.remove, image_path)
+        item["uploaded_file"] = existing["uploaded_file"]
+        if existing.get("cached"):
+            item.update(cached=True, result=existing)
+        else:
+            item["job_id"] = existing["job_id"]
+    else:
+        queued = await submit_detection(image_path, detect_params, False, image_sha256, cache_key, batch_id=batch["id"])
+        item["job_id"] = queued["job_id"]
+    batch_store.add_item(batch, item)
+
+def remove_file_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+async def abandon_batch(batch, cancelled, saving, scenes):
+    """停止解压，删除尚未提交的影像，取消本批次已排队的任务并删除批次记录"""
+    cancelled.set()
+    await asyncio.gather(saving, return_exceptions=True)
+    while not scenes.empty():
+        scene = scenes.get_nowait()
+        if scene is not None:
+            await io_pool.run(remove_file_quietly, scene[1])
+    for item in batch["items"]:
+        job = job_queue.get(item["job_id"]) if item.get("job_id") else None
+        # 复用的其他请求的任务不取消
+        if job is not None and job["params"].get("batch_id") == batch["id"]:
+            await job_queue.cancel(job["id"])
+    await io_pool.run(batch_store.discard, batch)
+    logger.info(f"批次 {batch['id']} 未完成创建，已删除")
+
+@app.post("/api/batches")
+async def create_batch(
+    files: List[UploadFile] = File(..., description="多个影像文件，或ZIP/TAR压缩包"),
+    categories: str = Form(...),
+    is_change_detection: bool = Form(True),
+    is_only_change_detection: bool = Form(False),
+    legend_required: bool = Form(False),
+    use_cache: bool = Form(True)
+):
+    """批量上传影像，每景提交一个检测任务，立即返回批次ID
+
+    multipart请求体由Starlette先暂存到临时文件，上传完成后才开始解压(ZIP的中央目录在文件末尾，
+    本来也要等上传完成)；解压过程中每解压出一景立即提交检测任务，不等整个压缩包解压完。
+    """
+    try:
+        detect_params = detection_params(categories, is_change_detection, is_only_change_detection, legend_required)
+        cache_params = normalize_params(**detect_params)
+        batch = batch_store.create(cache_params)
+        loop = asyncio.get_running_loop()
+        scenes = asyncio.Queue()
+        cancelled = threading.Event()
         
-        # 准备调用推理API的数据
-        detect_data = {
-            "image_to_be_detected_address": str(image_path),
-            "categories": categories_list,
-            "is_change_detection": is_change_detection,
-            "is_only_change_detection": is_only_change_detection,
-            "legend_required": legend_required
-        }
+        def on_scene(original_filename, image_path, image_sha256):
+            if cancelled.is_set():
+                os.remove(image_path)
+                raise BatchCancelled()
+            loop.call_soon_threadsafe(scenes.put_nowait, (original_filename, image_path, image_sha256))
         
-        logger.info(f"开始检测图片: {unique_filename}")
-        logger.info(f"检测参数: {detect_data}")
+        def save_all():
+            try:
+                return save_batch_files(files, on_scene)
+            finally:
+                loop.call_soon_threadsafe(scenes.put_nowait, None)
         
-        # 调用推理API
+        # 解压在线程池中进行，每解压出一景立即提交检测任务
+        saving = asyncio.ensure_future(io_pool.run(save_all))
+        completed = False
         try:
-            response = requests.put(
-                "http://127.0.0.1:8085/detect/with_data_base_plate",
-                json=detect_data,
-                timeout=300  # 5分钟超时
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                logger.info(f"检测成功: {result}")
-                # 先尝试从推理API返回的json里提取图片名
-                result_image_filename = ""
-                if isinstance(result, dict):
-                    result_image_path = result.get("最终检测结果路径", "")
-                    if not result_image_path and 'data' in result and isinstance(result['data'], dict):
-                        result_image_path = result['data'].get("最终检测结果路径", "")
-                    if not result_image_path:
-                        for key in result.keys():
-                            if "检测结果路径" in key and isinstance(result[key], str):
-                                result_image_path = result[key]
-                                break
-                    if result_image_path:
-                        result_image_filename = os.path.basename(result_image_path)
-                # 兜底：无论如何都要返回本地最新的图片
-                if not result_image_filename or not (DETECTED_IMAGES_DIR / result_image_filename).exists():
-                    image_files = sorted(DETECTED_IMAGES_DIR.glob('*.png'), key=os.path.getctime, reverse=True)
-                    if image_files:
-                        result_image_filename = image_files[0].name
-                return {
-                    "status": "success",
-                    "message": "检测完成",
-                    "timestamp": datetime.now().isoformat(),
-                    "result_json": result,
-                    "result_images": [result_image_filename] if result_image_filename else [],
-                    "uploaded_file": unique_filename
-                }
-            else:
-                logger.error(f"推理API返回错误: {response.status_code} - {response.text}")
-                raise HTTPException(status_code=500, detail=f"推理服务错误: {response.status_code}")
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"调用推理API失败: {e}")
-            raise HTTPException(status_code=500, detail=f"推理服务连接失败: {str(e)}")
+            while True:
+                scene = await scenes.get()
+                if scene is None:
+                    break
+                try:
+                    await add_batch_scene(batch, detect_params, use_cache, *scene)
+                except Exception:
+                    await io_pool.run(remove_file_quietly, scene[1])
+                    raise
+            total, errors = await saving
             
+            if total == 0:
+                raise HTTPException(status_code=400, detail={"message": "没有可检测的影像", "errors": errors})
+            batch["errors"] = errors
+            await io_pool.run(batch_store.save, batch)
+            completed = True
+        finally:
+            if not completed:
+                # 出错或客户端断开: 停止解压并删除不完整的批次
+                await abandon_batch(batch, cancelled, saving, scenes)
+        logger.info(f"批次 {batch['id']} 已提交 {total} 景影像")
+        return {
+            "status": "queued",
+            "message": f"已提交 {total} 景影像",
+            "batch_id": batch["id"],
+            "total": total,
+            "errors": errors,
+            "status_url": f"/api/batches/{batch['id']}",
+            "download_url": f"/api/batches/{batch['id']}/download"
+        }
+    except (HTTPException, PoolOverloaded):
+        raise
     except Exception as e:
-        logger.error(f"上传检测失败: {e}")
+        logger.error(f"批量上传失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def get_batch_or_404(batch_id):
+    batch = await io_pool.run(batch_store.get, batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="批次不存在")
+    return batch
+
+@app.get("/api/batches/{batch_id}")
+async def get_batch_status(request: Request, batch_id: str, include_results: bool = False):
+    """批次进度、各景状态和吞吐量"""
+    batch = await get_batch_or_404(batch_id)
+    status = await io_pool.run(batch_status, batch, job_queue.get, include_results)
+    status["errors"] = batch.get("errors", [])
+    return await json_response(status, request)
+
+@app.get("/api/batches/{batch_id}/download")
+async def download_batch(batch_id: str):
+    """以ZIP流下载批次中已完成的检测结果"""
+    batch = await get_batch_or_404(batch_id)
+    status = await io_pool.run(batch_status, batch, job_queue.get, True)
+    return StreamingResponse(
+        iter_zip(batch_archive_entries(status, DETECTED_IMAGES_DIR)),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="batch_{batch_id}.zip"'}
+    )
+
+@app.get("/api/jobs")
+async def list_jobs(request: Request, limit: int = Query(50, ge=1, le=500), status: Optional[str] = None):
+    """列出检测任务(包括其他工作进程提交的任务)"""
+    jobs = await io_pool.run(job_queue.list, limit=limit, status=status)
+    return await json_response({"jobs": jobs, "queue_depth": job_queue.queue_depth()}, request)
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """获取检测任务状态"""
+    job = await io_pool.run(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """以SSE推送检测任务状态变化，任务结束后关闭连接
+
+    本进程执行的任务通过订阅实时推送；其他工作进程执行的任务每秒读取一次任务文件。
+    """
+    job = await io_pool.run(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    local = job_queue.is_local(job_id)
+    
+    async def event_stream():
+        queue = job_queue.subscribe(job_id) if local else None
+        try:
+            current = job_queue.get(job_id) if local else job
+            yield f"event: {current['status']}\ndata: {json.dumps(current, ensure_ascii=False)}\n\n"
+            idle = 0.0
+            while current["status"] not in FINISHED_STATES:
+                if local:
+                    try:
+                        latest = await asyncio.wait_for(queue.get(), timeout=15)
+                    except asyncio.TimeoutError:
+                        latest = None
+                        idle = 15.0
+                else:
+                    await asyncio.sleep(1)
+                    latest = await io_pool.run(job_queue.get, job_id)
+                    idle += 1
+                    if latest is None or (latest["status"] == current["status"] and latest["run_ms"] == current["run_ms"]):
+                        latest = None
+                if latest is None:
+                    if idle >= 15:
+                        if await request.is_disconnected():
+                            break
+                        idle = 0.0
+                        yield ": keep-alive\n\n"
+                    continue
+                current = latest
+                idle = 0.0
+                yield f"event: {current['status']}\ndata: {json.dumps(current, ensure_ascii=False)}\n\n"
+        finally:
+            if queue is not None:
+                job_queue.unsubscribe(job_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 if __name__ == "__main__":
     # 从环境变量获取端口，默认为8086
     import os
     port = int(os.environ.get("MONITOR_PORT", 8086))
     
     # 优化启动配置
+    # 多个工作进程时缓存走共享后端，由主进程负责目录监听等后台任务；热重载只在单进程时启用
+    reload = SERVER_WORKERS == 1 and os.environ.get("MONITOR_RELOAD", "1") != "0"
     uvicorn.run(
         "monitor_web:app", 
         host="0.0.0.0", 
         port=port, 
-        reload=True,
+        reload=reload,
         reload_dirs=["templates", "static"],  # 只监控模板和静态文件
         reload_excludes=["*.pyc", "*.log", "data/*", "logs/*", "test/*"],  # 排除不需要监控的文件
-        workers=1,  # 单进程避免缓存冲突
+        workers=SERVER_WORKERS,
         access_log=True,
         log_level="info"
-    ) 
\ No newline at end of file
+    ) 
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+推理服务桩 - 模拟 /detect/with_data_base_plate 接口，用于在没有GPU推理服务时
+测试监控系统的上传检测流程和推理客户端(延迟、失败、并发统计)
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubInferenceServer:
+    """在后台线程中运行的推理服务桩
+
+    delay: 每个请求的处理秒数
+    fail_codes: 依次返回的错误状态码，用完后恢复正常，例如 [503, 503]
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0.0):
+        self.delay = delay
+        self.fail_codes = []
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/detect/with_data_base_plate"
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_PUT(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with stub._lock:
+                    stub.requests += 1
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                    status = stub.fail_codes.pop(0) if stub.fail_codes else 200
+                try:
+                    time.sleep(stub.delay)
+                    if status == 200:
+                        image_path = body.get("image_to_be_detected_address", "")
+                        payload = {
+                            "status": "success",
+                            "最终检测结果路径": f"detected_result_images/result_{int(time.time())}.png",
+                            "输入图片": image_path,
+                            "categories": body.get("categories", []),
+                        }
+                    else:
+                        payload = {"detail": "推理服务桩模拟错误"}
+                    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """在后台线程中启动"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-inference", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务"""
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推理服务桩")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8085)
+    parser.add_argument("--delay", type=float, default=1.0, help="每个请求的处理秒数")
+    args = parser.parse_args()
+
+    stub = StubInferenceServer(args.host, args.port, args.delay)
+    print(f"推理服务桩已启动: {stub.url} (延迟 {args.delay}s)")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
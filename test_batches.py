@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+批量检测测试 - 验证压缩包解压、解压大小和条目数上限、批次吞吐量统计，以及批次创建失败时的清理
+"""
+
+import asyncio
+import importlib
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from monitor.batches import BatchTooLarge, ExtractBudget, batch_status, extract_archive, is_archive, save_stream
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+
+
+def make_zip(names):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for name in names:
+            zf.writestr(name, f"data of {name}")
+    buffer.seek(0)
+    return buffer
+
+
+def test_is_archive():
+    assert is_archive("scenes.zip")
+    assert is_archive("SCENES.TAR.GZ")
+    assert not is_archive("scene.tif")
+    assert not is_archive(None)
+
+
+def test_extract_zip_skips_hidden_and_strips_paths(tmp_path):
+    """只解压影像文件，跳过隐藏文件和macOS元数据，不保留压缩包内的目录"""
+    archive = make_zip(["a/scene1.tif", "scene2.png", "__MACOSX/a/._scene1.tif", ".hidden.tif", "notes.txt"])
+    scenes = []
+    count = extract_archive(archive, "scenes.zip", tmp_path, 10, lambda *scene: scenes.append(scene))
+    assert count == 2
+    assert [name for name, _, _ in scenes] == ["scene1.tif", "scene2.png"]
+    for _, image_path, _ in scenes:
+        assert image_path.parent == tmp_path
+        assert image_path.exists()
+
+
+def test_extract_tar_stream(tmp_path):
+    """TAR按流式模式逐个解压"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tf:
+        for name in ("x/scene1.tif", "x/scene2.jpg"):
+            data = name.encode("utf-8")
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+    scenes = []
+    assert extract_archive(buffer, "scenes.tar.gz", tmp_path, 10, lambda *scene: scenes.append(scene)) == 2
+    assert (tmp_path / scenes[1][1].name).read_bytes() == b"x/scene2.jpg"
+
+
+def test_extract_too_many_scenes(tmp_path):
+    archive = make_zip([f"scene{i}.tif" for i in range(5)])
+    with pytest.raises(BatchTooLarge):
+        extract_archive(archive, "scenes.zip", tmp_path, 3, lambda *scene: None)
+
+
+def test_zip_bomb_rejected_before_writing(tmp_path):
+    """声明的解压大小超过单个文件上限时不解压"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("bomb.tif", b"\0" * (8 * 1024 * 1024))
+    buffer.seek(0)
+    budget = ExtractBudget(max_member_bytes=1024 * 1024, max_total_bytes=10**9, max_members=10)
+    with pytest.raises(BatchTooLarge):
+        extract_archive(buffer, "bomb.zip", tmp_path, 10, lambda *scene: None, budget)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_total_size_and_member_limits(tmp_path):
+    """解压总大小和条目数(含非影像条目)超限时停止，已解压的影像保留"""
+    scenes = []
+    archive = make_zip([f"scene{i}.tif" for i in range(4)])  # 每个16字节
+    budget = ExtractBudget(max_member_bytes=100, max_total_bytes=40, max_members=100)
+    with pytest.raises(BatchTooLarge):
+        extract_archive(archive, "scenes.zip", tmp_path, 10, lambda *scene: scenes.append(scene), budget)
+    assert len(scenes) == 2
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(path.name for _, path, _ in scenes)
+
+    archive = make_zip(["scene.tif"] + [f"notes{i}.txt" for i in range(5)])
+    budget = ExtractBudget(max_member_bytes=100, max_total_bytes=1000, max_members=5)
+    with pytest.raises(BatchTooLarge):
+        extract_archive(archive, "scenes.zip", tmp_path / "members", 10, lambda *scene: None, budget)
+
+
+def test_written_bytes_checked_while_streaming(tmp_path):
+    """实际写入超过上限时(声明的大小不可信)删除已写入的部分"""
+    budget = ExtractBudget(max_member_bytes=1000, max_total_bytes=10**9, max_members=10)
+    with pytest.raises(BatchTooLarge):
+        save_stream(io.BytesIO(b"x" * 5000), tmp_path, "scene.tif", budget)
+    assert list(tmp_path.iterdir()) == []
+    image_path, _ = save_stream(io.BytesIO(b"x" * 1000), tmp_path, "scene.tif", budget)
+    assert image_path.stat().st_size == 1000 == budget.total_bytes
+
+
+def test_throughput_excludes_cached_items():
+    """命中缓存的影像不计入吞吐量"""
+    started = time.time() - 60
+    batch = {
+        "id": "b1",
+        "created_at": "2024-01-01T00:00:00",
+        "started": started,
+        "params": {},
+        "items": [
+            {"original_filename": f"c{i}.tif", "uploaded_file": f"c{i}.tif", "sha256": "x",
+             "cached": True, "result": {"status": "success"}}
+            for i in range(10)
+        ] + [
+            {"original_filename": "j.tif", "uploaded_file": "j.tif", "sha256": "y", "job_id": "job1"},
+        ],
+    }
+    finished_at = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started + 60))
+    job = {"status": "done", "result": {}, "run_ms": 1000.0, "error": None, "finished_at": finished_at}
+    status = batch_status(batch, lambda job_id: job)
+    assert status["complete"]
+    assert status["finished"] == 11
+    assert status["cached"] == 10
+    assert status["throughput_per_minute"] == pytest.approx(1.0, rel=0.05)
+
+
+@pytest.fixture(scope="module")
+def monitor_app(tmp_path_factory):
+    """在临时目录中导入monitor_web(数据目录取当前工作目录)"""
+    root = tmp_path_factory.mktemp("monitor")
+    (root / "data" / "detected_result_json_files").mkdir(parents=True)
+    (root / "logs").mkdir()
+    (root / "logs" / "monitor.log").write_text("", encoding="utf-8")
+
+    cwd = os.getcwd()
+    os.chdir(root)
+    os.environ["MONITOR_WATCH"] = "0"
+    sys.path.insert(0, str(PACKAGE_DIR))
+    try:
+        sys.modules.pop("monitor_web", None)
+        yield importlib.import_module("monitor_web")
+    finally:
+        sys.modules.pop("monitor_web", None)
+        os.chdir(cwd)
+
+
+def test_failed_batch_is_removed(monitor_app, monkeypatch):
+    """提交检测任务出错时删除不完整的批次、未提交的影像，并取消本批次已排队的任务"""
+    import httpx
+
+    batches = []
+    cancelled = []
+
+    async def failing_add_batch_scene(batch, detect_params, use_cache, original_filename, image_path, image_sha256):
+        batches.append(batch)
+        if batch["items"]:
+            raise RuntimeError("提交失败")
+        batch["items"].append({"original_filename": original_filename, "uploaded_file": image_path.name,
+                               "sha256": image_sha256, "job_id": "job1"})
+
+    async def fake_cancel(job_id):
+        cancelled.append(job_id)
+        return True
+
+    monkeypatch.setattr(monitor_app, "add_batch_scene", failing_add_batch_scene)
+    monkeypatch.setattr(monitor_app.job_queue, "get", lambda job_id: {"id": job_id, "params": {"batch_id": batches[0]["id"]}})
+    monkeypatch.setattr(monitor_app.job_queue, "cancel", fake_cancel)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=monitor_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(
+                "/api/batches",
+                files={"files": ("scenes.zip", make_zip([f"scene{i}.tif" for i in range(3)]).getvalue(), "application/zip")},
+                data={"categories": json.dumps(["forest"])},
+            )
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 500
+    batch_id = batches[0]["id"]
+    assert monitor_app.batch_store.get(batch_id) is None
+    assert cancelled == ["job1"]
+    # 只保留已提交任务的第一景影像
+    remaining = [p.name for p in monitor_app.UPLOAD_DIR.iterdir()]
+    assert len(remaining) == 1
+    assert remaining[0] == batches[0]["items"][0]["uploaded_file"]
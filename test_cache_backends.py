@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+缓存后端测试 - 验证SQLite和Redis后端在多个实例(工作进程)间共享条目、失效和锁，以及SQLite后端的LRU淘汰
+"""
+
+import pytest
+
+from monitor import cache_backends
+from monitor.cache_backends import SQLiteCacheBackend, create_cache_backend
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def backend_pair(request, tmp_path):
+    """同一共享存储上的两个后端实例，模拟两个工作进程"""
+    if request.param == "redis":
+        pytest.importorskip("fakeredis")
+        first = create_cache_backend("redis", redis_url="fakeredis://")
+        second = first  # 用同一个fakeredis实例模拟共享的Redis服务
+    else:
+        first = create_cache_backend("sqlite", sqlite_path=tmp_path / "api_cache.db")
+        second = create_cache_backend("sqlite", sqlite_path=tmp_path / "api_cache.db")
+    yield first, second
+    first.close()
+    if second is not first:
+        second.close()
+
+
+def test_entries_shared_between_instances(backend_pair):
+    first, second = backend_pair
+    first.set("task_history:1", {"total": 3})
+    assert second.get("task_history:1") == {"total": 3}
+    assert second.get("task_history:1", max_age=0) is None
+
+
+def test_invalidation_applies_to_all_instances(backend_pair):
+    first, second = backend_pair
+    first.set("task_history:1", {"total": 3})
+    first.set("stats", {"count": 1})
+    second.delete_prefixes("task_history")
+    assert first.get("task_history:1") is None
+    assert first.get("stats") == {"count": 1}
+
+
+def test_lock_is_exclusive(backend_pair):
+    first, second = backend_pair
+    token = first.try_lock("rebuild", ttl=5)
+    assert token
+    assert not second.try_lock("rebuild", ttl=5)
+    first.unlock("rebuild", token)
+    assert second.try_lock("rebuild", ttl=5)
+
+
+def test_sqlite_backend_evicts_least_recently_used_on_insert(tmp_path, monkeypatch):
+    """写入时超出上限立即淘汰最久未访问的条目，读取会更新访问时间"""
+    monkeypatch.setattr(cache_backends, "ACCESS_RESOLUTION", 0)
+    cache = SQLiteCacheBackend(tmp_path / "api_cache.db", max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a 变为最近访问
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get_entry("c")[0] == 3
+    cache.set("d", 4)
+    assert cache.get("a") is None  # get_entry同样更新访问时间，c保留
+    assert cache.get("c") == 3
+    assert cache.stats()["entries"] == 2
+    cache.close()
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_cache_backend("memcached")
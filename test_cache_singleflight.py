@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+缓存请求合并测试 - 验证并发未命中只触发一次计算、LRU淘汰、按键族过期和过期后返回旧值
+"""
+
+import asyncio
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from monitor.cache_backends import MemoryCacheBackend
+from monitor.singleflight import SingleFlight
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_calls_share_one_computation():
+    """同一键的并发调用只执行一次计算，所有调用得到同一结果"""
+    flight = SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"total": 42}
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("task_history", compute) for _ in range(50)))
+
+    results = run(scenario())
+    assert len(calls) == 1
+    assert all(result == {"total": 42} for result in results)
+    assert flight.stats() == {"inflight": 0, "calls": 1, "coalesced": 49}
+
+
+def test_different_keys_compute_separately():
+    """不同键互不合并"""
+    flight = SingleFlight()
+    calls = []
+
+    async def compute(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do(key, lambda key=key: compute(key)) for key in ("a", "b", "a", "b")))
+
+    assert run(scenario()) == ["a", "b", "a", "b"]
+    assert sorted(calls) == ["a", "b"]
+
+
+def test_failure_propagates_and_next_call_recomputes():
+    """计算失败时所有等待者收到异常，之后的调用重新计算"""
+    flight = SingleFlight()
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        raise OSError("扫描失败")
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.do("k", failing) for _ in range(5)), return_exceptions=True)
+        value = await flight.do("k", lambda: asyncio.sleep(0, result="ok"))
+        return results, value
+
+    results, value = run(scenario())
+    assert len(calls) == 1
+    assert all(isinstance(result, OSError) for result in results)
+    assert value == "ok"
+    assert len(flight) == 0
+
+
+def test_cancelled_waiter_does_not_cancel_computation():
+    """等待者被取消不影响共享的计算"""
+    flight = SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def scenario():
+        owner = asyncio.create_task(flight.do("k", compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flight.do("k", compute))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        return await owner
+
+    assert run(scenario()) == "done"
+
+
+def test_cancelled_first_caller_does_not_cancel_computation():
+    """发起计算的第一个调用者被取消时，计算继续进行，其他等待者得到结果"""
+    flight = SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def scenario():
+        owner = asyncio.create_task(flight.do("k", compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flight.do("k", compute))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return await waiter
+
+    assert run(scenario()) == "done"
+    assert calls == [1]
+    assert len(flight) == 0
+
+
+def test_computation_finishes_after_all_callers_cancelled():
+    flight = SingleFlight()
+    finished = []
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        finished.append(1)
+        raise OSError("late failure")
+
+    async def scenario():
+        owner = asyncio.create_task(flight.do("k", compute))
+        await asyncio.sleep(0)
+        owner.cancel()
+        await asyncio.sleep(0.05)
+        return "k" in flight
+
+    assert run(scenario()) is False
+    assert finished == [1]
+
+
+def test_memory_backend_lru_eviction():
+    """超出容量时淘汰最久未使用的条目"""
+    cache = MemoryCacheBackend(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a 变为最近使用
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_memory_backend_max_age():
+    """超过max_age秒的条目视为未命中"""
+    cache = MemoryCacheBackend()
+    cache.set("logs_100", {"logs": []})
+    assert cache.get("logs_100", max_age=10) == {"logs": []}
+    time.sleep(0.05)
+    assert cache.get("logs_100", max_age=0.01) is None
+
+
+@pytest.fixture(scope="module")
+def monitor_app(tmp_path_factory):
+    """在临时目录中导入monitor_web(数据目录取当前工作目录)"""
+    root = tmp_path_factory.mktemp("monitor")
+    json_dir = root / "data" / "detected_result_json_files"
+    json_dir.mkdir(parents=True)
+    (root / "logs").mkdir()
+    (root / "logs" / "monitor.log").write_text("定时任务结束\n", encoding="utf-8")
+    for i in range(20):
+        timestamp_str = time.strftime("%Y%m%d_%H%M%S", time.localtime(1_700_000_000 + i * 60))
+        (json_dir / f"detect_result_{timestamp_str}.json").write_text(
+            json.dumps({"异常区域检测": {"数量": i}}, ensure_ascii=False), encoding="utf-8"
+        )
+
+    cwd = os.getcwd()
+    os.chdir(root)
+    os.environ["MONITOR_WATCH"] = "0"
+    sys.path.insert(0, str(PACKAGE_DIR))
+    try:
+        sys.modules.pop("monitor_web", None)
+        yield importlib.import_module("monitor_web")
+    finally:
+        sys.modules.pop("monitor_web", None)
+        os.chdir(cwd)
+
+
+def test_concurrent_cold_requests_rebuild_once(monitor_app):
+    """缓存未命中时N个并发请求只重建一次历史记录"""
+    import httpx
+
+    rebuilds = []
+    lock = threading.Lock()
+    original = monitor_app.load_task_history
+
+    def counted_load(**kwargs):
+        with lock:
+            rebuilds.append(1)
+        time.sleep(0.1)  # 模拟全量扫描的耗时，让其余请求在计算进行中到达
+        return original(**kwargs)
+
+    async def scenario(count):
+        transport = httpx.ASGITransport(app=monitor_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = await asyncio.gather(*(client.get("/api/tasks/history") for _ in range(count)))
+            # 缓存清空后再次并发请求，同样只重建一次
+            monitor_app.clear_cache()
+            second = await asyncio.gather(*(client.get("/api/tasks/history") for _ in range(count)))
+            return first, second
+
+    monitor_app.load_task_history = counted_load
+    try:
+        monitor_app.clear_cache()
+        first, second = run(scenario(20))
+    finally:
+        monitor_app.load_task_history = original
+
+    assert all(response.status_code == 200 for response in first + second)
+    assert all(response.json()["total"] == 20 for response in first + second)
+    assert len(rebuilds) == 2
+
+
+def test_expired_entry_served_stale_while_rebuilding(monitor_app):
+    """条目过期后立即返回旧值和Age，后台只重建一次"""
+    import httpx
+
+    rebuilds = []
+    original = monitor_app.load_system_logs
+
+    def counted_load(limit):
+        rebuilds.append(limit)
+        time.sleep(0.2)
+        return original(limit)
+
+    async def scenario():
+        monitor_app.cache_refresher.start()
+        try:
+            transport = httpx.ASGITransport(app=monitor_app.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                await client.get("/api/logs?limit=5")
+                monitor_app.CACHE_TTLS["logs"] = 0
+                start = time.perf_counter()
+                stale = await asyncio.gather(*(client.get("/api/logs?limit=5") for _ in range(10)))
+                stale_seconds = time.perf_counter() - start
+                monitor_app.CACHE_TTLS["logs"] = 60
+                await asyncio.sleep(0.5)
+                fresh = await client.get("/api/logs?limit=5")
+                return stale, stale_seconds, fresh
+        finally:
+            monitor_app.CACHE_TTLS["logs"] = 10
+            await monitor_app.cache_refresher.stop()
+
+    monitor_app.load_system_logs = counted_load
+    try:
+        monitor_app.clear_cache()
+        stale, stale_seconds, fresh = run(scenario())
+    finally:
+        monitor_app.load_system_logs = original
+
+    assert all(response.status_code == 200 and "Age" in response.headers for response in stale)
+    # 旧值直接返回，不等待0.2秒的重建
+    assert stale_seconds < 0.2
+    assert len(rebuilds) == 2
+    assert fresh.status_code == 200
+    assert int(fresh.headers["Age"]) < 1
+
+
+def test_old_invalidated_entry_recomputed_synchronously(monitor_app):
+    """已失效且超过旧值年龄上限的条目不再返回，请求等待重建"""
+    import httpx
+
+    rebuilds = []
+    original = monitor_app.load_task_history
+
+    def counted_load(**kwargs):
+        rebuilds.append(1)
+        return original(**kwargs)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=monitor_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.get("/api/tasks/history")
+            # 条目写入于数小时前(键长时间没有被刷新)，随后被文件变化失效
+            backend = monitor_app.cache_backend
+            for key, (created, value, stale) in list(backend._data.items()):
+                if key.startswith("task_history"):
+                    backend._data[key] = (created - 3 * 3600, value, stale)
+            monitor_app.invalidate_cache("task_history")
+            return await client.get("/api/tasks/history")
+
+    monitor_app.load_task_history = counted_load
+    try:
+        monitor_app.clear_cache()
+        response = run(scenario())
+    finally:
+        monitor_app.load_task_history = original
+
+    assert response.status_code == 200
+    assert len(rebuilds) == 2
+    assert int(response.headers["Age"]) == 0
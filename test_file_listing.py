@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+文件列表索引测试 - 验证排序分页、过滤、增量更新和分页游标校验
+"""
+
+import base64
+import json
+import os
+
+import pytest
+
+from monitor.file_listing import FileListing, decode_listing_cursor, encode_listing_cursor
+
+
+@pytest.fixture
+def listing(tmp_path):
+    for i in range(10):
+        path = tmp_path / f"result_{i:02d}.png"
+        path.write_bytes(b"x" * (100 - i))
+        os.utime(path, (1_700_000_000 + i, 1_700_000_000 + i))
+    (tmp_path / "notes.txt").write_text("skip")
+    return FileListing(tmp_path, (".png", ".jpg"))
+
+
+def collect(listing, **params):
+    names, cursor = [], None
+    while True:
+        page = listing.query(cursor=cursor, **params)
+        names.extend(info.name for info in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return names, page["total"]
+
+
+def test_paginate_every_sort(listing):
+    """每种排序分页遍历的结果与完整排序一致，不重复不遗漏"""
+    expected = [f"result_{i:02d}.png" for i in range(10)]
+    assert collect(listing, sort="mtime", descending=False, limit=3) == (expected, 10)
+    assert collect(listing, sort="mtime", descending=True, limit=4) == (expected[::-1], 10)
+    assert collect(listing, sort="size", descending=False, limit=3) == (expected[::-1], 10)
+    assert collect(listing, sort="name", descending=False, limit=5) == (expected, 10)
+
+
+def test_filters(listing):
+    names, total = collect(listing, sort="mtime", descending=False, limit=2,
+                           start_time=1_700_000_003, end_time=1_700_000_005)
+    assert names == ["result_03.png", "result_04.png", "result_05.png"]
+    assert total == 3
+    names, total = collect(listing, sort="name", descending=False, limit=2, prefix="result_0")
+    assert total == 10
+    assert listing.query(extensions=["jpg"])["total"] == 0
+
+
+def test_add_and_remove(listing, tmp_path):
+    """文件事件增量更新索引并递增版本"""
+    listing.query()
+    version = listing.version
+    new_file = tmp_path / "result_99.jpg"
+    new_file.write_bytes(b"y")
+    listing.add(new_file)
+    assert listing.version == version + 1
+    assert listing.query(sort="name", descending=True, limit=1)["items"][0].name == "result_99.jpg"
+    listing.remove(new_file)
+    assert "result_99.jpg" not in [info.name for info in listing.query()["items"]]
+
+
+def raw_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode("utf-8")).decode("ascii")
+
+
+def test_cursor_round_trip():
+    cursor = encode_listing_cursor("mtime", 1_700_000_000.5, "结果.png")
+    assert decode_listing_cursor(cursor, "mtime") == (1_700_000_000.5, "结果.png")
+
+
+@pytest.mark.parametrize("cursor, sort", [
+    ("not base64!", "mtime"),
+    ("中文", "mtime"),
+    (raw_cursor("mtime", 1.0), "mtime"),                 # 缺少字段
+    (raw_cursor("mtime", 1.0, "a", "b"), "mtime"),       # 多余字段
+    (base64.urlsafe_b64encode(b'{"a": 1}').decode("ascii"), "mtime"),
+    (raw_cursor("size", 1, "a.png"), "mtime"),           # 排序字段不一致
+    (raw_cursor("mtime", "abc", "a.png"), "mtime"),      # 值类型与排序字段不符
+    (raw_cursor("mtime", True, "a.png"), "mtime"),
+    (raw_cursor("name", 5, "a.png"), "name"),
+    (raw_cursor("mtime", 1.0, 5), "mtime"),              # 文件名不是字符串
+    (raw_cursor("size", None, "a.png"), "size"),
+])
+def test_invalid_cursor_raises_value_error(cursor, sort):
+    with pytest.raises(ValueError):
+        decode_listing_cursor(cursor, sort)
+
+
+def test_query_with_bad_cursor_type(listing):
+    """类型错误的游标不会在有序列表比较时抛出TypeError"""
+    with pytest.raises(ValueError):
+        listing.query(sort="mtime", cursor=raw_cursor("mtime", "abc", "a.png"))
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+文件下载响应测试 - 验证Range/If-Range断点续传、416、304、HEAD请求和零拷贝发送
+"""
+
+import asyncio
+import os
+from email.utils import formatdate
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Route
+
+from monitor.file_response import RangeFileResponse, RangeNotSatisfiable, parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=0-1,5-6", None),      # 多段范围按完整文件响应
+    ("items=0-1", None),
+    ("bytes=abc", None),
+    ("bytes=5-1", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=-0"])
+def test_parse_range_not_satisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 1000)
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "检测结果.tif"
+    path.write_bytes(os.urandom(3 * 1024 * 1024 + 17))
+    return path
+
+
+def make_app(path):
+    async def download(request):
+        return RangeFileResponse(path, request, filename=path.name, media_type="image/tiff")
+    return Starlette(routes=[Route("/file", download, methods=["GET", "HEAD"])])
+
+
+def fetch(app, method="GET", headers=None):
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, "/file", headers=headers or {})
+    return asyncio.run(scenario())
+
+
+def test_full_download(data_file):
+    response = fetch(make_app(data_file))
+    assert response.status_code == 200
+    assert response.content == data_file.read_bytes()
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-length"] == str(data_file.stat().st_size)
+    assert response.headers["content-disposition"].startswith("attachment; filename*=utf-8''")
+
+
+def test_range_requests(data_file):
+    data = data_file.read_bytes()
+    app = make_app(data_file)
+    response = fetch(app, headers={"Range": "bytes=1048570-2097160"})
+    assert response.status_code == 206
+    assert response.content == data[1048570:2097161]
+    assert response.headers["content-range"] == f"bytes 1048570-2097160/{len(data)}"
+
+    tail = fetch(app, headers={"Range": "bytes=-10"})
+    assert tail.status_code == 206
+    assert tail.content == data[-10:]
+
+    unsatisfiable = fetch(app, headers={"Range": f"bytes={len(data)}-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == f"bytes */{len(data)}"
+
+
+def test_if_range(data_file):
+    """If-Range与当前版本一致时按范围响应，不一致(文件已变化)时返回完整文件"""
+    app = make_app(data_file)
+    etag = fetch(app, method="HEAD").headers["etag"]
+    assert fetch(app, headers={"Range": "bytes=0-9", "If-Range": etag}).status_code == 206
+    stale = fetch(app, headers={"Range": "bytes=0-9", "If-Range": '"old-version"'})
+    assert stale.status_code == 200
+    assert len(stale.content) == data_file.stat().st_size
+
+    last_modified = formatdate(data_file.stat().st_mtime + 10, usegmt=True)
+    assert fetch(app, headers={"Range": "bytes=0-9", "If-Range": last_modified}).status_code == 206
+    earlier = formatdate(data_file.stat().st_mtime - 10, usegmt=True)
+    assert fetch(app, headers={"Range": "bytes=0-9", "If-Range": earlier}).status_code == 200
+
+
+def test_not_modified_and_head(data_file):
+    app = make_app(data_file)
+    head = fetch(app, method="HEAD")
+    assert head.status_code == 200
+    assert head.content == b""
+    assert head.headers["content-length"] == str(data_file.stat().st_size)
+    cached = fetch(app, headers={"If-None-Match": head.headers["etag"]})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+
+def test_zerocopy_extension(data_file):
+    """ASGI服务器支持零拷贝扩展时交给服务器发送文件片段"""
+    messages = []
+
+    async def scenario():
+        scope = {
+            "type": "http", "method": "GET", "path": "/file", "query_string": b"",
+            "headers": [(b"range", b"bytes=10-19")],
+            "extensions": {"http.response.zerocopysend": {}},
+        }
+        from starlette.requests import Request
+        request = Request(scope)
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            if message["type"] == "http.response.zerocopysend":
+                message["file"].seek(message["offset"])
+                message = dict(message, data=message["file"].read(message["count"]))
+            messages.append(message)
+
+        await RangeFileResponse(data_file, request)(scope, receive, send)
+
+    asyncio.run(scenario())
+    assert messages[0]["status"] == 206
+    assert messages[1]["type"] == "http.response.zerocopysend"
+    assert messages[1]["data"] == data_file.read_bytes()[10:20]
+
+
+def test_directory_is_rejected(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        RangeFileResponse(tmp_path, request=None)
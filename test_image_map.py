@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+图片时间戳映射测试 - 验证单次扫描建立映射、按事件增量更新和目录变化后重建
+"""
+
+import os
+
+from monitor.image_map import ImageTimestampMap
+
+
+def names(paths):
+    return [os.path.basename(p) for p in paths]
+
+
+def test_lookup_by_timestamp(tmp_path):
+    for name in ("result_20240101_100000.png", "legend_20240101_100000.jpg", "result_20240101_100001.tif",
+                 "notes_20240101_100000.txt"):
+        (tmp_path / name).write_bytes(b"x")
+    image_map = ImageTimestampMap(tmp_path)
+    assert names(image_map.get("20240101_100000")) == ["legend_20240101_100000.jpg", "result_20240101_100000.png"]
+    assert names(image_map.get("20240101_100001")) == ["result_20240101_100001.tif"]
+    assert image_map.get("20240101_235959") == []
+    assert image_map.get(None) == []
+    # 非标准时间戳按文件名子串匹配
+    assert names(image_map.get("20240101_10000")) == [
+        "legend_20240101_100000.jpg", "result_20240101_100000.png", "result_20240101_100001.tif"
+    ]
+    assert len(image_map) == 3
+
+
+def test_add_remove_and_refresh(tmp_path):
+    image_map = ImageTimestampMap(tmp_path)
+    assert image_map.refresh_if_changed() == set()
+    path = tmp_path / "result_20240101_100000.png"
+    path.write_bytes(b"x")
+    assert image_map.add(path) == {"20240101_100000"}
+    # 事件已同步，目录mtime不再触发重建
+    assert image_map.refresh_if_changed() == set()
+    assert names(image_map.get("20240101_100000")) == [path.name]
+
+    os.remove(path)
+    assert image_map.remove(path) == {"20240101_100000"}
+    assert image_map.get("20240101_100000") == []
+
+    # 没有事件时按目录mtime变化重建，返回变化的时间戳
+    other = tmp_path / "result_20240102_080000.png"
+    other.write_bytes(b"x")
+    os.utime(tmp_path, ns=(1, 1))
+    assert image_map.refresh_if_changed() == {"20240102_080000"}
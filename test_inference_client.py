@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+推理客户端测试 - 使用本地推理服务桩验证并发限制、排队、重试和熔断
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from monitor.inference_client import InferenceClient, InferenceError, InferenceUnavailable
+from stub_inference_server import StubInferenceServer
+
+
+@pytest.fixture
+def stub():
+    server = StubInferenceServer().start()
+    yield server
+    server.stop()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_detect_success(stub):
+    """正常调用返回推理结果并记录指标"""
+    async def scenario():
+        client = InferenceClient(stub.url)
+        try:
+            result = await client.detect({"image_to_be_detected_address": "a.tif", "categories": ["forest"]})
+            result_again = await client.detect({"image_to_be_detected_address": "b.tif", "categories": []})
+        finally:
+            await client.close()
+        return client.metrics(), result, result_again
+
+    metrics, result, result_again = run(scenario())
+    assert result["输入图片"] == "a.tif"
+    assert result["categories"] == ["forest"]
+    assert result_again["输入图片"] == "b.tif"
+    assert metrics["succeeded"] == 2
+    assert metrics["in_flight"] == 0
+    assert metrics["circuit_state"] == "closed"
+
+
+def test_max_in_flight(stub):
+    """同时发往推理服务的请求数不超过max_in_flight"""
+    stub.delay = 0.2
+
+    async def scenario():
+        client = InferenceClient(stub.url, max_in_flight=2)
+        try:
+            await asyncio.gather(*(client.detect({}) for _ in range(6)))
+        finally:
+            await client.close()
+        return client.metrics()
+
+    metrics = run(scenario())
+    assert stub.max_in_flight == 2
+    assert metrics["succeeded"] == 6
+    assert metrics["avg_wait_ms"] > 0
+
+
+def test_queue_full_rejected(stub):
+    """排队已满时立即拒绝"""
+    stub.delay = 0.3
+
+    async def scenario():
+        client = InferenceClient(stub.url, max_in_flight=1, max_queue=1)
+        try:
+            return await asyncio.gather(*(client.detect({}) for _ in range(4)), return_exceptions=True)
+        finally:
+            await client.close()
+
+    results = run(scenario())
+    rejected = [r for r in results if isinstance(r, InferenceUnavailable)]
+    assert len(rejected) == 2
+    assert stub.requests == 2
+
+
+def test_queue_timeout(stub):
+    """排队超时放弃请求"""
+    stub.delay = 0.5
+
+    async def scenario():
+        client = InferenceClient(stub.url, max_in_flight=1, queue_timeout=0.1)
+        try:
+            return await asyncio.gather(client.detect({}), client.detect({}), return_exceptions=True)
+        finally:
+            await client.close()
+
+    first, second = run(scenario())
+    assert isinstance(first, dict)
+    assert isinstance(second, InferenceUnavailable)
+
+
+def test_retry_transient_errors(stub):
+    """503等瞬时错误按退避重试"""
+    stub.fail_codes = [503, 502]
+
+    async def scenario():
+        client = InferenceClient(stub.url, retries=2, backoff=0.01)
+        try:
+            result = await client.detect({})
+        finally:
+            await client.close()
+        return client.metrics(), result
+
+    metrics, result = run(scenario())
+    assert result["status"] == "success"
+    assert stub.requests == 3
+    assert metrics["retried"] == 2
+
+
+def test_non_transient_error_not_retried(stub):
+    """4xx/500错误不重试"""
+    stub.fail_codes = [422]
+
+    async def scenario():
+        client = InferenceClient(stub.url, retries=2, backoff=0.01)
+        try:
+            with pytest.raises(InferenceError):
+                await client.detect({})
+        finally:
+            await client.close()
+
+    run(scenario())
+    assert stub.requests == 1
+
+
+def test_circuit_breaker(stub):
+    """推理服务不可用时熔断，恢复时间后探测成功则关闭熔断"""
+    stub.stop()
+    url = stub.url
+
+    async def scenario():
+        client = InferenceClient(url, retries=0, failure_threshold=2, reset_timeout=0.2)
+        try:
+            for _ in range(2):
+                with pytest.raises(InferenceError):
+                    await client.detect({})
+            assert client.metrics()["circuit_state"] == "open"
+            with pytest.raises(InferenceUnavailable):
+                await client.detect({})
+
+            # 推理服务恢复
+            revived = StubInferenceServer(port=int(url.split(":")[2].split("/")[0])).start()
+            try:
+                await asyncio.sleep(0.25)
+                result = await client.detect({})
+            finally:
+                revived.stop()
+        finally:
+            await client.close()
+        return client.metrics(), result
+
+    metrics, result = run(scenario())
+    assert result["status"] == "success"
+    assert metrics["circuit_state"] == "closed"
+    assert metrics["circuit_opened"] == 1
+    assert metrics["rejected"] == 1
+
+
+def test_client_errors_do_not_open_circuit(stub):
+    """4xx错误不计入熔断，5xx错误计入"""
+    async def scenario():
+        client = InferenceClient(stub.url, retries=0, failure_threshold=2)
+        try:
+            stub.fail_codes = [422, 400, 404]
+            for _ in range(3):
+                with pytest.raises(InferenceError) as exc_info:
+                    await client.detect({})
+                assert exc_info.value.status_code in (400, 404, 422)
+            assert client.metrics()["circuit_state"] == "closed"
+
+            stub.fail_codes = [500, 500]
+            for _ in range(2):
+                with pytest.raises(InferenceError):
+                    await client.detect({})
+            assert client.metrics()["circuit_state"] == "open"
+        finally:
+            await client.close()
+
+    run(scenario())
+
+
+def test_protocol_error_not_retried(stub, monkeypatch):
+    """请求发出后连接中断(RemoteProtocolError)不重试，避免重复检测"""
+    calls = []
+
+    async def scenario():
+        client = InferenceClient(stub.url, retries=2, backoff=0.01)
+        await client.start()
+
+        async def broken_put(url, json):
+            calls.append(url)
+            raise httpx.RemoteProtocolError("Server disconnected without sending a response.")
+
+        monkeypatch.setattr(client._client, "put", broken_put)
+        try:
+            with pytest.raises(InferenceError) as exc_info:
+                await client.detect({})
+            assert exc_info.value.status_code is None
+        finally:
+            await client.close()
+        return client.metrics()
+
+    metrics = run(scenario())
+    assert len(calls) == 1
+    assert metrics["retried"] == 0
+    assert metrics["failed"] == 1
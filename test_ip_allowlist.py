@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+IP白名单测试 - 验证CIDR前缀树的各种前缀长度、IPv4映射和带区域的IPv6地址、主机名条目和热加载
+"""
+
+import asyncio
+import ipaddress
+import random
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from utils.ip_allowlist import IPAllowList, IPAllowListMiddleware, parse_address
+
+
+def reference_allows(entries, host):
+    """逐条用ipaddress比较的参考实现"""
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return any(address in ipaddress.ip_network(entry, strict=False) for entry in entries)
+
+
+@pytest.mark.parametrize("entry, inside, outside", [
+    ("0.0.0.0/0", ["1.2.3.4", "255.255.255.255"], ["::1"]),
+    ("10.0.0.0/7", ["10.0.0.1", "11.255.255.255"], ["12.0.0.0", "9.255.255.255"]),
+    ("192.168.1.128/25", ["192.168.1.128", "192.168.1.255"], ["192.168.1.127", "192.168.2.128"]),
+    ("192.168.1.10/32", ["192.168.1.10"], ["192.168.1.11"]),
+    ("192.168.1.10", ["192.168.1.10"], ["192.168.1.9"]),
+    ("::/0", ["::1", "2001:db8::1"], ["1.2.3.4"]),
+    ("2001:db8::/33", ["2001:db8:7fff::1"], ["2001:db8:8000::1"]),
+    ("fe80::1/128", ["fe80::1"], ["fe80::2"]),
+])
+def test_prefix_lengths(entry, inside, outside):
+    allow_list = IPAllowList([entry])
+    for host in inside:
+        assert host in allow_list, host
+    for host in outside:
+        assert host not in allow_list, host
+
+
+def test_ipv4_mapped_addresses():
+    """IPv4映射的IPv6客户端地址按IPv4匹配，白名单中的映射网段也按IPv4匹配"""
+    allow_list = IPAllowList(["10.1.0.0/16", "::ffff:172.16.0.0/108"])
+    assert "::ffff:10.1.2.3" in allow_list
+    assert "::ffff:10.2.0.1" not in allow_list
+    assert "172.16.5.6" in allow_list
+    assert "::ffff:172.16.5.6" in allow_list
+    assert "172.31.255.255" in allow_list
+    assert "172.32.0.1" not in allow_list
+    assert parse_address("::ffff:10.1.2.3") == bytes([10, 1, 2, 3])
+
+
+def test_zone_scoped_ipv6():
+    """带区域的链路本地地址(fe80::1%eth0)按地址部分匹配"""
+    allow_list = IPAllowList(["fe80::/64"])
+    assert "fe80::1%eth0" in allow_list
+    assert "fe80:0:0:1::1%eth0" not in allow_list
+
+
+def test_hostname_entries_and_invalid_hosts():
+    """无法解析为网段的条目按字符串精确匹配"""
+    allow_list = IPAllowList(["localhost", "testclient", "127.0.0.1"])
+    assert "testclient" in allow_list
+    assert "localhost" in allow_list
+    assert "other-host" not in allow_list
+    assert "127.0.0.1" in allow_list
+    assert not allow_list.allows(None)
+    assert "not an address" not in IPAllowList(["10.0.0.0/8"])
+
+
+def test_overlapping_prefixes_match_reference():
+    """重叠的网段与逐条比较的结果一致"""
+    entries = ["10.0.0.0/8", "10.1.0.0/16", "10.1.2.0/23", "172.16.0.0/12", "192.168.0.0/31",
+               "2001:db8::/32", "2001:db8:1::/48", "fd00::/7"]
+    allow_list = IPAllowList(entries)
+    rng = random.Random(0)
+    hosts = [str(ipaddress.IPv4Address(rng.getrandbits(32))) for _ in range(2000)]
+    hosts += [f"10.1.{rng.randrange(256)}.{rng.randrange(256)}" for _ in range(500)]
+    hosts += [str(ipaddress.IPv6Address((0x20010DB8 << 96) | rng.getrandbits(96))) for _ in range(500)]
+    hosts += [str(ipaddress.IPv6Address(rng.getrandbits(128))) for _ in range(500)]
+    for host in hosts:
+        assert allow_list.allows(host) == reference_allows(entries, host), host
+
+
+def make_app(entries, loader=None, reload_interval=0.0):
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    middleware = IPAllowListMiddleware(app, entries, loader=loader, reload_interval=reload_interval)
+    return middleware
+
+
+async def get_from(middleware, host):
+    transport = httpx.ASGITransport(app=middleware, client=(host, 1234))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get("/ping")
+
+
+def request_from(middleware, host):
+    return asyncio.run(get_from(middleware, host))
+
+
+def test_middleware_blocks_and_allows():
+    middleware = make_app(["10.0.0.0/8"])
+    assert request_from(middleware, "10.2.3.4").status_code == 200
+    response = request_from(middleware, "192.168.1.1")
+    assert response.status_code == 403
+    assert response.json() == {"detail": "IP 192.168.1.1 not allowed."}
+
+
+def test_hot_reload_replaces_list():
+    """loader返回的新白名单替换旧的，旧的地址判断缓存随之失效；加载失败时保留原白名单"""
+    current = {"entries": ["10.0.0.0/8"]}
+
+    def loader():
+        if current["entries"] is None:
+            raise OSError("配置文件读取失败")
+        return current["entries"]
+
+    middleware = make_app(["10.0.0.0/8"], loader=loader, reload_interval=3600)
+    assert request_from(middleware, "10.0.0.1").status_code == 200
+
+    current["entries"] = ["192.168.0.0/16"]
+    middleware.reload()
+    assert middleware.allowed_ips == ("192.168.0.0/16",)
+    assert request_from(middleware, "10.0.0.1").status_code == 403
+    assert request_from(middleware, "192.168.3.4").status_code == 200
+
+    current["entries"] = None
+    middleware.reload()
+    assert middleware.allowed_ips == ("192.168.0.0/16",)
+    assert not middleware.update(["192.168.0.0/16"])
+
+
+def test_reload_is_scheduled_from_requests():
+    """到达重新加载时间后，请求触发后台重新加载"""
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return ["10.0.0.0/8", "127.0.0.1"]
+
+    middleware = make_app(["127.0.0.1"], loader=loader, reload_interval=0.0)
+
+    async def scenario():
+        assert (await get_from(middleware, "127.0.0.1")).status_code == 200
+        await middleware._reloading
+        return await get_from(middleware, "10.9.9.9")
+
+    response = asyncio.run(scenario())
+    assert calls
+    assert response.status_code == 200
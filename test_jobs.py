@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+检测任务队列测试 - 验证任务执行、失败记录、重启恢复和过期任务清理
+"""
+
+import asyncio
+import json
+import os
+import time
+
+from monitor.jobs import DONE, FAILED, QUEUED, JobQueue
+
+
+async def echo(job):
+    if job["params"].get("fail"):
+        raise RuntimeError("推理失败")
+    return {"echo": job["params"]}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_submit_and_wait(tmp_path):
+    """任务执行完成后结果写入内存和磁盘"""
+    async def scenario():
+        queue = JobQueue(tmp_path, echo)
+        await queue.start()
+        try:
+            ok = await queue.submit("detect", {"image": "a.png"})
+            bad = await queue.submit("detect", {"fail": True})
+            ok = await queue.wait(ok["id"], timeout=5)
+            bad = await queue.wait(bad["id"], timeout=5)
+        finally:
+            await queue.stop()
+        return ok, bad
+
+    ok, bad = run(scenario())
+    assert ok["status"] == DONE
+    assert ok["result"] == {"echo": {"image": "a.png"}}
+    assert bad["status"] == FAILED
+    assert bad["error"] == "推理失败"
+    on_disk = json.loads((tmp_path / f"{ok['id']}.json").read_text(encoding="utf-8"))
+    assert on_disk["status"] == DONE
+
+
+def test_recover_requeues_jobs_of_dead_owner(tmp_path):
+    """所有者已退出的未完成任务由recover()重新排队执行"""
+    job = {
+        "id": "a" * 32, "kind": "detect", "status": QUEUED, "owner": "gone",
+        "params": {"image": "b.png"}, "created_at": "2024-01-01T00:00:00",
+        "started_at": None, "finished_at": None, "queue_ms": None, "run_ms": None,
+        "result": None, "error": None,
+    }
+    (tmp_path / f"{job['id']}.json").write_text(json.dumps(job), encoding="utf-8")
+
+    async def scenario():
+        queue = JobQueue(tmp_path, echo)
+        await queue.start()
+        try:
+            await queue.recover()
+            return await queue.wait(job["id"], timeout=5)
+        finally:
+            await queue.stop()
+
+    recovered = run(scenario())
+    assert recovered["status"] == DONE
+    assert recovered["restarts"] == 1
+
+
+def test_prune_expired_finished_jobs(tmp_path):
+    """结束超过保留期的任务从内存和磁盘中删除，未过期和未结束的任务保留"""
+    async def scenario():
+        queue = JobQueue(tmp_path, echo, retention_days=1)
+        await queue.start()
+        try:
+            old = await queue.wait((await queue.submit("detect", {}))["id"], timeout=5)
+            fresh = await queue.wait((await queue.submit("detect", {}))["id"], timeout=5)
+
+            expired = time.time() - 2 * 86400
+            queue._jobs[old["id"]]["finished_at"] = "2000-01-01T00:00:00"
+            os.utime(tmp_path / f"{old['id']}.json", (expired, expired))
+            # 其他进程留下的过期任务文件
+            other = dict(old, id="b" * 32, owner="other")
+            other_path = tmp_path / f"{other['id']}.json"
+            other_path.write_text(json.dumps(other), encoding="utf-8")
+            os.utime(other_path, (expired, expired))
+
+            removed = await queue.prune()
+            return queue, old, fresh, other, removed
+        finally:
+            await queue.stop()
+
+    queue, old, fresh, other, removed = run(scenario())
+    assert removed == 2
+    assert not queue.is_local(old["id"])
+    assert queue.get(old["id"]) is None
+    assert queue.get(other["id"]) is None
+    assert queue.get(fresh["id"])["status"] == DONE
+
+
+def test_submit_prunes_periodically(tmp_path, monkeypatch):
+    """提交任务时按间隔触发清理"""
+    calls = []
+
+    async def scenario():
+        queue = JobQueue(tmp_path, echo)
+
+        async def fake_prune():
+            calls.append(time.monotonic())
+            return 0
+
+        monkeypatch.setattr(queue, "prune", fake_prune)
+        await queue.start()
+        try:
+            await queue.submit("detect", {})
+            queue._next_prune = 0
+            await queue.submit("detect", {})
+            await queue.submit("detect", {})
+        finally:
+            await queue.stop()
+
+    run(scenario())
+    assert len(calls) == 1
+
+
+def test_cancel_queued_job(tmp_path):
+    """排队中的任务可以取消，取消后不再执行"""
+    calls = []
+
+    async def slow(job):
+        calls.append(job["id"])
+        await asyncio.sleep(0.1)
+        return {}
+
+    async def scenario():
+        queue = JobQueue(tmp_path, slow)
+        await queue.start()
+        try:
+            running = await queue.submit("detect", {})
+            queued = await queue.submit("detect", {})
+            await asyncio.sleep(0.02)
+            assert not await queue.cancel(running["id"])
+            assert await queue.cancel(queued["id"])
+            await queue.wait(running["id"], timeout=5)
+            return running, await queue.wait(queued["id"], timeout=5)
+        finally:
+            await queue.stop()
+
+    running, queued = run(scenario())
+    assert calls == [running["id"]]
+    assert queued["status"] == FAILED
+    assert queued["error"] == "任务已取消"
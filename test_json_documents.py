@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+结果JSON文档测试 - 验证流式读取在块边界处的数字、字符串和转义，跳过不需要的成员，缺失字段和格式错误
+"""
+
+import json
+
+import pytest
+
+from monitor.json_documents import DocumentCache, FieldNotFound, extract_sections, parse_fields
+
+DOCUMENT = {
+    "跳过的对象": {"说明": "含有 } ] { [ 和 \" 引号与 \\ 反斜杠的字符串", "嵌套": [[1, 2], {"a": "}"}]},
+    "面积": -15000000000.5,
+    "指数": 1.25e-7,
+    "跳过的字符串": "结尾是反斜杠\\",
+    "跳过的数字": 123456789012,
+    "水体自动提取": {"面积": 98765.4321, "名称": "东湖\n\"北岸\"中", "有效": True},
+    "空值": None,
+    "否": False,
+    "列表": [0, -0.5, "]", {"k": [None]}],
+}
+
+
+def write_document(tmp_path, document=DOCUMENT, indent=None):
+    path = tmp_path / "detect_result.json"
+    path.write_text(json.dumps(document, ensure_ascii=False, indent=indent), encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_extract_sections_across_chunk_boundaries(tmp_path, indent):
+    """任意块大小下，数字、字面量和含转义的字符串都完整解码，不需要的成员正确跳过"""
+    path = write_document(tmp_path, indent=indent)
+    keys = ["面积", "指数", "水体自动提取", "空值", "否", "列表"]
+    expected = {key: DOCUMENT[key] for key in keys}
+    for chunk_size in range(1, 48):
+        assert extract_sections(path, keys, chunk_size=chunk_size) == expected, chunk_size
+
+
+def test_number_cut_at_chunk_end_is_not_truncated(tmp_path):
+    """数字在块末尾被截断时(如 "-15000000000.")读入下一块后重新解码"""
+    path = tmp_path / "number.json"
+    path.write_text('{"面积":-15000000000.5}', encoding="utf-8")
+    # 第一块恰好结束于小数点之后
+    chunk_size = len('{"面积":-15000000000.')
+    assert extract_sections(path, ["面积"], chunk_size=chunk_size) == {"面积": -15000000000.5}
+    path.write_text('{"数量":123456,"是":true}', encoding="utf-8")
+    assert extract_sections(path, ["数量", "是"], chunk_size=len('{"数量":123')) == {"数量": 123456, "是": True}
+
+
+def test_extract_sections_stops_after_wanted_keys(tmp_path):
+    """需要的键全部找到后不再读取后面的内容"""
+    path = tmp_path / "partial.json"
+    path.write_text('{"a": 1, "b": [2], "c": {"不完整', encoding="utf-8")
+    assert extract_sections(path, ["a", "b"], chunk_size=4) == {"a": 1, "b": [2]}
+
+
+def test_missing_keys(tmp_path):
+    path = write_document(tmp_path)
+    assert extract_sections(path, ["不存在", "面积"], chunk_size=8) == {"面积": DOCUMENT["面积"]}
+    empty = tmp_path / "empty.json"
+    empty.write_text("{ }", encoding="utf-8")
+    assert extract_sections(empty, ["面积"]) == {}
+
+
+@pytest.mark.parametrize("text", [
+    '[1, 2]',
+    '{"a" 1}',
+    '{"a": 1 "b": 2}',
+    '{1: 2}',
+    '{"a": {"b": [1, 2}',
+    '{"a": "未结束的字符串',
+    '{"a": tru}',
+    '{"a": 1',
+    '',
+])
+def test_malformed_input(tmp_path, text):
+    path = tmp_path / "bad.json"
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(ValueError):
+        extract_sections(path, ["不存在"], chunk_size=4)
+
+
+def test_document_cache_streams_large_documents(tmp_path):
+    """超过阈值的文件按fields流式读取，不整体缓存；字段不存在时抛出FieldNotFound"""
+    path = write_document(tmp_path)
+    cache = DocumentCache(max_bytes=1 << 20, stream_threshold=16)
+    assert cache.get(path, parse_fields("水体自动提取.面积,面积")) == {
+        "水体自动提取": {"面积": 98765.4321},
+        "面积": -15000000000.5,
+    }
+    assert cache.stats()["streamed"] == 1
+    assert cache.stats()["entries"] == 0
+    with pytest.raises(FieldNotFound):
+        cache.get(path, parse_fields("不存在"))
+
+    small = DocumentCache(max_bytes=1 << 20, stream_threshold=1 << 20)
+    assert small.get(path) == DOCUMENT
+    assert small.get(path, parse_fields("列表.1")) == {"列表": {"1": -0.5}}
+    assert small.stats()["hits"] == 1
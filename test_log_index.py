@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+日志全文索引测试 - 验证增量索引、关键词/级别搜索、分页、轮转和重写后的清理，搜索接口不在请求中建立索引
+"""
+
+import asyncio
+import importlib
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+from monitor import log_index as log_index_module
+from monitor.log_index import LogIndex, build_match, parse_levels
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+
+
+def write_log(path, lines, mode="w"):
+    with open(path, mode, encoding="utf-8") as f:
+        f.writelines(line + "\n" for line in lines)
+
+
+@pytest.fixture
+def logs_dir(tmp_path):
+    directory = tmp_path / "logs"
+    directory.mkdir()
+    write_log(directory / "monitor.log", [
+        "2024-01-01 10:00:00,100 - INFO - 定时任务开始",
+        "2024-01-01 10:00:01,200 - ERROR - 连接失败 timeout",
+        "Traceback (most recent call last):",
+        "2024-01-01 10:00:02,300 - WARNING - 磁盘空间不足",
+    ])
+    return directory
+
+
+@pytest.fixture
+def index(tmp_path, logs_dir):
+    idx = LogIndex(tmp_path / "log_index.db", logs_dir)
+    yield idx
+    idx.close()
+
+
+def fts_rows(idx):
+    return idx._conn.execute("SELECT COUNT(*) FROM log_fts").fetchone()[0]
+
+
+def test_build_match_and_levels():
+    assert build_match("连接 timeout") == '"连 接" AND "timeout"'
+    assert build_match(None) is None
+    with pytest.raises(ValueError):
+        build_match("!!!")
+    assert parse_levels("error, warn") == ["ERROR", "WARNING"]
+    with pytest.raises(ValueError):
+        parse_levels("LOUD")
+
+
+def test_search_keywords_levels_and_time(index):
+    assert index.sync() == 4
+    result = index.search(q="连接失败")
+    assert [log["level"] for log in result["logs"]] == ["ERROR"]
+    assert result["total"] == 1
+
+    # 没有时间的行沿用上一行的级别
+    errors = index.search(levels=["ERROR"], descending=False)
+    assert [log["line"] for log in errors["logs"]] == [
+        "2024-01-01 10:00:01,200 - ERROR - 连接失败 timeout",
+        "Traceback (most recent call last):",
+    ]
+    assert index.search(q="timeout 磁盘")["total"] == 0
+
+
+def test_append_is_indexed_incrementally(index, logs_dir):
+    index.sync()
+    write_log(logs_dir / "monitor.log", ["2024-01-01 10:00:03,000 - INFO - 推理完成"], mode="a")
+    with open(logs_dir / "monitor.log", "a", encoding="utf-8") as f:
+        f.write("2024-01-01 10:00:04,000 - INFO - 未写完")
+    assert index.sync() == 1
+    assert index.search(q="推理完成")["total"] == 1
+    assert index.search(q="未写完")["total"] == 0
+
+
+def test_pagination_counts_total_on_first_page_only(index):
+    index.sync()
+    first = index.search(limit=2, descending=False)
+    assert first["total"] == 4
+    second = index.search(limit=2, cursor=first["next_cursor"], descending=False)
+    assert second["total"] is None
+    assert index.search(limit=2, cursor=first["next_cursor"], with_total=True)["total"] == 4
+    lines = [log["line"] for log in first["logs"] + second["logs"]]
+    assert len(set(lines)) == 4
+    with pytest.raises(ValueError):
+        index.search(cursor="bad cursor")
+
+
+def test_rewritten_and_deleted_files_remove_postings(index, logs_dir):
+    """文件被重写或删除后，FTS5中的词条一并删除"""
+    index.sync()
+    assert fts_rows(index) == 4
+    write_log(logs_dir / "monitor.log", ["2024-01-02 08:00:00,000 - INFO - 新的日志"])
+    index.sync()
+    assert fts_rows(index) == 1
+    assert index.search(q="连接失败")["total"] == 0
+    assert index.search(q="新的日志")["total"] == 1
+
+    os.remove(logs_dir / "monitor.log")
+    index.sync()
+    assert fts_rows(index) == 0
+    assert index.stats()["lines"] == 0
+
+
+def test_rotated_file_is_not_reindexed(index, logs_dir):
+    index.sync()
+    os.rename(logs_dir / "monitor.log", logs_dir / "monitor.log.1")
+    write_log(logs_dir / "monitor.log", ["2024-01-02 08:00:00,000 - INFO - 轮转后"])
+    assert index.sync() == 1
+    assert index.stats()["files"] == 2
+    files = {log["file"] for log in index.search(limit=10)["logs"]}
+    assert files == {"monitor.log", "monitor.log.1"}
+
+
+def test_old_contentless_index_is_rebuilt(tmp_path, logs_dir):
+    """旧版本的无内容FTS5表(不能删除词条)在打开时清空重建"""
+    db_path = tmp_path / "log_index.db"
+    conn = sqlite3.connect(str(db_path))
+    conn.executescript(log_index_module.SCHEMA)
+    conn.execute("CREATE VIRTUAL TABLE log_fts USING fts5(body, content='', tokenize='unicode61')")
+    conn.execute("INSERT INTO log_files VALUES (1, 'gone.log', 1, 10, x'', NULL, 0, NULL)")
+    conn.execute("INSERT INTO log_lines (file_id, byte_offset, length, ts, level) VALUES (1, 0, 9, 0, NULL)")
+    conn.commit()
+    conn.close()
+
+    idx = LogIndex(db_path, logs_dir)
+    try:
+        assert idx._fts_schema(idx._conn) == log_index_module.FTS_SCHEMA
+        assert idx.stats()["lines"] == 0
+        assert idx.sync() == 4
+        assert idx.search(q="磁盘")["total"] == 1
+    finally:
+        idx.close()
+
+
+def test_database_opened_on_first_use(tmp_path, logs_dir):
+    """创建实例不生成数据库文件，第一次查询或同步时才打开"""
+    db_path = tmp_path / "index" / "log_index.db"
+    idx = LogIndex(db_path, logs_dir)
+    try:
+        assert not db_path.exists()
+        assert idx.search(q="磁盘")["total"] == 0
+        assert db_path.exists()
+    finally:
+        idx.close()
+
+
+@pytest.fixture(scope="module")
+def monitor_app(tmp_path_factory):
+    """在临时目录中导入monitor_web(数据目录取当前工作目录)"""
+    root = tmp_path_factory.mktemp("monitor")
+    (root / "data" / "detected_result_json_files").mkdir(parents=True)
+    (root / "logs").mkdir()
+    write_log(root / "logs" / "monitor.log", ["2024-01-01 10:00:00,100 - ERROR - 连接失败"])
+
+    cwd = os.getcwd()
+    os.chdir(root)
+    os.environ["MONITOR_WATCH"] = "0"
+    sys.path.insert(0, str(PACKAGE_DIR))
+    try:
+        sys.modules.pop("monitor_web", None)
+        module = importlib.import_module("monitor_web")
+        yield module
+        module.log_index.close()
+        module.result_index.close()
+    finally:
+        sys.modules.pop("monitor_web", None)
+        os.chdir(cwd)
+
+
+def test_import_does_not_create_index_databases(monitor_app):
+    assert not (monitor_app.DATA_DIR / "log_index.db").exists()
+    assert not (monitor_app.DATA_DIR / "result_index.db").exists()
+
+
+def test_search_returns_indexed_lines_only(monitor_app):
+    """搜索请求不读取日志文件，只返回后台已索引的内容"""
+    import httpx
+
+    async def search():
+        transport = httpx.ASGITransport(app=monitor_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/api/logs/search", params={"q": "连接失败"})
+
+    before = asyncio.run(search())
+    assert before.status_code == 200
+    assert before.json()["total"] == 0
+
+    monitor_app.log_index.sync()  # 后台log_index_loop的一次跟进
+    after = asyncio.run(search())
+    assert after.json()["total"] == 1
+    assert after.json()["logs"][0]["level"] == "ERROR"
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+日志尾部读取测试 - 验证纯ASCII日志、追加读取、编码检测和文件重写后的处理
+"""
+
+from monitor.log_tail import LogTailer
+
+
+def write(path, text, encoding="utf-8", mode="w"):
+    with open(path, mode, encoding=encoding) as f:
+        f.write(text)
+
+
+def test_ascii_only_log_then_non_ascii_append(tmp_path):
+    """纯ASCII日志可以读取，之后追加的中文行按检测出的编码解码"""
+    log = tmp_path / "monitor.log"
+    write(log, "line 1\nline 2\nline 3\n")
+    tailer = LogTailer()
+    assert tailer.tail(log, 5) == ["line 1", "line 2", "line 3"]
+
+    write(log, "任务开始\n定时任务结束\n", mode="a")
+    assert tailer.tail(log, 3) == ["line 3", "任务开始", "定时任务结束"]
+    assert tailer.last_line(log) == "定时任务结束"
+
+
+def test_ascii_log_then_gbk_append(tmp_path):
+    """先是纯ASCII内容，之后追加GBK编码的行"""
+    log = tmp_path / "monitor.log"
+    write(log, "start\n")
+    tailer = LogTailer()
+    assert tailer.tail(log, 1) == ["start"]
+    write(log, "推理完成\n", encoding="gbk", mode="a")
+    assert tailer.tail(log, 2) == ["start", "推理完成"]
+
+
+def test_partial_last_line_and_limit(tmp_path):
+    """没有换行结尾的最后一行也返回，limit大于保留行数时重新倒读"""
+    log = tmp_path / "monitor.log"
+    write(log, "".join(f"row {i}\n" for i in range(500)) + "tail")
+    tailer = LogTailer(block_size=256, keep_lines=10)
+    assert tailer.tail(log, 2) == ["row 499", "tail"]
+    lines = tailer.tail(log, 300)
+    assert len(lines) == 300
+    assert lines[0] == "row 201"
+    assert lines[-1] == "tail"
+
+
+def test_truncated_and_rewritten_file(tmp_path):
+    """文件被截断重写(copytruncate)后不返回旧内容"""
+    log = tmp_path / "monitor.log"
+    write(log, "old 1\nold 2\n")
+    tailer = LogTailer()
+    assert tailer.tail(log, 2) == ["old 1", "old 2"]
+    write(log, "new 1\nnew 2\nnew 3\n")
+    assert tailer.tail(log, 2) == ["new 2", "new 3"]
+
+
+def test_empty_file(tmp_path):
+    log = tmp_path / "monitor.log"
+    log.write_bytes(b"")
+    tailer = LogTailer()
+    assert tailer.tail(log, 5) == []
+    assert tailer.last_line(log) is None
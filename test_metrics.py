@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+运行指标测试 - 验证Prometheus文本格式(HELP/TYPE、直方图累积分桶、标签转义)，
+以及HTTP中间件不统计/metrics本身、流式和零拷贝响应只计一次且状态码正确
+"""
+
+import asyncio
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from monitor.file_response import RangeFileResponse
+from monitor.metrics import HTTP_LATENCY, HTTP_REQUESTS, REGISTRY, Counter, Gauge, Histogram, MetricsMiddleware, Registry
+
+
+def test_render_counter_gauge_and_label_escaping():
+    registry = Registry()
+    counter = Counter("demo_total", "示例计数", ("path",), registry=registry)
+    counter.inc('a"b\\c\nd')
+    counter.inc('a"b\\c\nd', amount=2)
+    Gauge("demo_items", "示例仪表", ("kind",), collect=lambda: {("x",): 1.5}, registry=registry)
+    Gauge("demo_broken", "数据源出错", collect=lambda: 1 / 0, registry=registry)
+
+    lines = registry.render().splitlines()
+    assert lines[:3] == [
+        "# HELP demo_total 示例计数",
+        "# TYPE demo_total counter",
+        'demo_total{path="a\\"b\\\\c\\nd"} 3',
+    ]
+    assert lines[3:6] == ["# HELP demo_items 示例仪表", "# TYPE demo_items gauge", 'demo_items{kind="x"} 1.5']
+    # 数据源出错时只导出HELP/TYPE
+    assert lines[6:] == ["# HELP demo_broken 数据源出错", "# TYPE demo_broken gauge"]
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = Histogram("demo_seconds", "示例耗时", ("op",), buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "read")
+    assert histogram.count("read") == 4
+    assert histogram.count("write") == 0
+    assert registry.render().splitlines() == [
+        "# HELP demo_seconds 示例耗时",
+        "# TYPE demo_seconds histogram",
+        'demo_seconds_bucket{op="read",le="0.1"} 2',
+        'demo_seconds_bucket{op="read",le="1"} 3',
+        'demo_seconds_bucket{op="read",le="+Inf"} 4',
+        'demo_seconds_sum{op="read"} 3.65',
+        'demo_seconds_count{op="read"} 4',
+    ]
+
+
+def make_app(tmp_path):
+    data_file = tmp_path / "scene.tif"
+    data_file.write_bytes(b"0123456789" * 100)
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics")
+    async def metrics():
+        return REGISTRY.render()
+
+    @app.get("/stream/{name}")
+    async def stream(name: str):
+        async def chunks():
+            for i in range(3):
+                yield f"{name}{i}\n".encode("utf-8")
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    @app.get("/file")
+    async def download(request: Request):
+        return RangeFileResponse(data_file, request)
+
+    return app
+
+
+def requests_for(route, status):
+    return HTTP_REQUESTS.value("GET", route, status)
+
+
+def test_middleware_skips_metrics_and_counts_streams_once(tmp_path):
+    app = make_app(tmp_path)
+    before = {
+        "metrics": requests_for("/metrics", "200"),
+        "stream": requests_for("/stream/{name}", "200"),
+        "latency": HTTP_LATENCY.count("GET", "/stream/{name}"),
+        "missing": requests_for("other", "404"),
+    }
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            assert (await client.get("/metrics")).status_code == 200
+            streamed = await client.get("/stream/a")
+            assert streamed.text == "a0\na1\na2\n"
+            await client.get("/stream/b")
+            assert (await client.get("/nothing")).status_code == 404
+
+    asyncio.run(scenario())
+    assert requests_for("/metrics", "200") == before["metrics"]
+    # 路由标签取模板，两个不同路径合并计数
+    assert requests_for("/stream/{name}", "200") == before["stream"] + 2
+    assert HTTP_LATENCY.count("GET", "/stream/{name}") == before["latency"] + 2
+    assert requests_for("other", "404") == before["missing"] + 1
+
+
+def test_zerocopy_range_response_counted_once_with_206(tmp_path):
+    """零拷贝发送的Range响应按206计数一次"""
+    app = make_app(tmp_path)
+    before = requests_for("/file", "206"), requests_for("/file", "200")
+    messages = []
+
+    async def scenario():
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": "/file", "raw_path": b"/file", "root_path": "", "query_string": b"",
+            "headers": [(b"host", b"test"), (b"range", b"bytes=0-9")], "client": ("127.0.0.1", 1),
+            "server": ("test", 80), "extensions": {"http.response.zerocopysend": {}},
+        }
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            messages.append(message["type"])
+
+        await app(scope, receive, send)
+
+    asyncio.run(scenario())
+    assert messages == ["http.response.start", "http.response.zerocopysend"]
+    assert (requests_for("/file", "206"), requests_for("/file", "200")) == (before[0] + 1, before[1])
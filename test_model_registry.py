@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+模型注册表测试 - 验证并行加载、一次加载全部模型、等待超时、加载失败后重试、延迟加载、兼容映射和 /ready 状态码
+"""
+
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+
+from utils.model_registry import (
+    ALL_MODELS, FAILED, PENDING, READY, ModelNotReady, ModelRegistry, model_not_ready_handler, ready_response,
+    require_loaded, require_model
+)
+
+
+class FakeModel:
+    def __init__(self, name):
+        self.name = name
+        self.warmed = False
+
+    def warmup(self):
+        self.warmed = True
+
+
+class Loader:
+    """按模型名控制加载耗时和失败次数的加载函数"""
+
+    def __init__(self, delays=None, failures=None):
+        self.delays = delays or {}
+        self.failures = dict(failures or {})
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, name, config):
+        with self._lock:
+            self.calls.append(name)
+            fail = self.failures.get(name, 0) > 0
+            if fail:
+                self.failures[name] -= 1
+        time.sleep(self.delays.get(name, 0))
+        if fail:
+            raise RuntimeError(f"{name} 权重文件不存在")
+        return FakeModel(name)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_models_load_in_parallel_and_warm_up():
+    loader = Loader(delays={"a": 0.2, "b": 0.2, "c": 0.2})
+
+    async def scenario():
+        registry = ModelRegistry({"a": {}, "b": {}, "c": {}}, loader, concurrency=3)
+        started = time.perf_counter()
+        registry.start()
+        models = await asyncio.gather(*(registry.get(name) for name in "abc"))
+        return registry, models, time.perf_counter() - started
+
+    registry, models, elapsed = run(scenario())
+    assert [model.name for model in models] == ["a", "b", "c"]
+    assert all(model.warmed for model in models)
+    assert elapsed < 0.5
+    status = registry.status()
+    assert status["ready"]
+    assert status["models"]["a"]["state"] == READY
+    assert status["models"]["a"]["warmup_seconds"] is not None
+
+
+def test_wait_timeout_does_not_cancel_loading():
+    """等待超时抛出ModelNotReady，加载继续进行，之后可以取到模型"""
+    loader = Loader(delays={"slow": 0.3})
+
+    async def scenario():
+        registry = ModelRegistry({"slow": {}}, loader)
+        registry.start()
+        with pytest.raises(ModelNotReady):
+            await registry.get("slow", timeout=0.05)
+        return await registry.get("slow", timeout=2)
+
+    assert run(scenario()).name == "slow"
+    assert loader.calls == ["slow"]
+
+
+def test_failure_then_retry():
+    """加载失败时等待者得到ModelNotReady，下一次请求重新加载"""
+    loader = Loader(failures={"flaky": 1})
+
+    async def scenario():
+        registry = ModelRegistry({"flaky": {}}, loader)
+        registry.start()
+        with pytest.raises(ModelNotReady) as exc_info:
+            await registry.get("flaky")
+        failed = registry.status()["models"]["flaky"]
+        model = await registry.get("flaky")
+        return failed, exc_info.value, model, registry.status()
+
+    failed, error, model, status = run(scenario())
+    assert failed["state"] == FAILED
+    assert "权重文件不存在" in failed["error"]
+    assert "权重文件不存在" in str(error)
+    assert model.name == "flaky"
+    assert status["models"]["flaky"]["error"] is None
+    assert loader.calls == ["flaky", "flaky"]
+
+
+def test_lazy_model_loads_on_first_request():
+    loader = Loader()
+
+    async def scenario():
+        registry = ModelRegistry({"eager": {}, "lazy": {"lazy": True}}, loader)
+        registry.start()
+        await registry.get("eager")
+        before = registry.status()
+        model = await registry.get("lazy")
+        return before, model
+
+    before, model = run(scenario())
+    assert before["ready"]  # lazy模型不影响就绪状态
+    assert before["models"]["lazy"]["state"] == PENDING
+    assert model.name == "lazy"
+    assert loader.calls == ["eager", "lazy"]
+
+
+def test_unknown_model():
+    async def scenario():
+        registry = ModelRegistry({}, Loader())
+        registry.start()
+        with pytest.raises(KeyError):
+            await registry.get("missing")
+        with pytest.raises(KeyError):
+            registry.mapping()["missing"]
+
+    run(scenario())
+
+
+def make_app(registry):
+    app = FastAPI()
+    app.add_exception_handler(ModelNotReady, model_not_ready_handler)
+
+    @app.on_event("startup")
+    async def startup():
+        app.state.model_registry = registry
+        app.state.models = registry.mapping()
+        registry.start()
+
+    @app.get("/ready")
+    async def ready():
+        return ready_response(app.state.model_registry)
+
+    @app.get("/detect/{name}")
+    async def detect(name: str, model=Depends(require_model("m", timeout=0.05))):
+        return {"model": model.name}
+
+    @app.get("/legacy")
+    async def legacy():
+        # 旧路由直接从 app.state.models 取模型
+        return {"model": app.state.models["m"].name}
+
+    return app
+
+
+def test_ready_and_routes_while_loading():
+    """加载中 /ready 返回503，按依赖或映射取模型的路由返回503；加载完成后均返回200"""
+    loader = Loader(delays={"m": 0.3})
+    registry = ModelRegistry({"m": {}}, loader)
+    app = make_app(registry)
+
+    async def scenario():
+        await app.router.startup()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            loading = [await client.get(path) for path in ("/ready", "/detect/x", "/legacy")]
+            await registry.get("m", timeout=2)
+            loaded = [await client.get(path) for path in ("/ready", "/detect/x", "/legacy")]
+        return loading, loaded
+
+    loading, loaded = run(scenario())
+    assert [response.status_code for response in loading] == [503, 503, 503]
+    assert loading[0].json()["models"]["m"]["state"] in ("loading", "warming")
+    assert loading[1].headers["retry-after"] == "10"
+    assert loading[2].headers["retry-after"] == "10"
+    assert [response.status_code for response in loaded] == [200, 200, 200]
+    assert loaded[2].json() == {"model": "m"}
+
+
+def test_mapping_starts_lazy_load():
+    """通过映射访问lazy模型时开始加载，不阻塞事件循环"""
+    loader = Loader()
+
+    async def scenario():
+        registry = ModelRegistry({"lazy": {"lazy": True}}, loader)
+        registry.start()
+        models = registry.mapping()
+        assert "lazy" not in models
+        with pytest.raises(ModelNotReady):
+            models["lazy"]
+        await registry.get("lazy")
+        return models
+
+    models = run(scenario())
+    assert models["lazy"].name == "lazy"
+    assert list(models) == ["lazy"]
+    assert loader.calls == ["lazy"]
+
+
+def test_mapping_from_worker_thread():
+    """同步路由在线程池中访问映射时等待模型加载完成，超时返回ModelNotReady"""
+    loader = Loader(delays={"lazy": 0.1, "slow": 0.5})
+
+    async def scenario():
+        registry = ModelRegistry({"lazy": {"lazy": True}, "slow": {"lazy": True}}, loader, wait_timeout=0.2)
+        registry.start()
+
+        def sync_route(name):
+            try:
+                return registry.mapping()[name].name
+            except ModelNotReady:
+                return "not ready"
+
+        return await asyncio.gather(asyncio.to_thread(sync_route, "lazy"), asyncio.to_thread(sync_route, "slow"))
+
+    assert run(scenario()) == ["lazy", "not ready"]
+    assert sorted(loader.calls) == ["lazy", "slow"]
+
+
+def test_all_models_loaded_at_once():
+    """配置中没有按模型划分的列表时一次加载全部模型，名称在加载完成后才知道"""
+    calls = []
+
+    def load_all():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"water": FakeModel("water"), "building": FakeModel("building")}
+
+    async def scenario():
+        registry = ModelRegistry.all_at_once(load_all)
+        registry.start()
+        loading = registry.status()
+        # 加载完成前任何名称都可能由这次加载提供
+        assert "water" in registry and "water" not in registry.mapping()
+        model = await registry.get("water")
+        with pytest.raises(KeyError):
+            await registry.get("missing")
+        with pytest.raises(KeyError):
+            registry.mapping()["missing"]
+        return loading, model, registry
+
+    loading, model, registry = run(scenario())
+    assert not loading["ready"]
+    assert loading["models"][ALL_MODELS]["state"] == "loading"
+    assert model.name == "water" and model.warmed
+    assert registry.mapping()["building"].warmed
+    status = registry.status()
+    assert status["ready"]
+    assert status["loaded"] == ["building", "water"]
+    assert calls == [1]
+
+
+def test_all_models_load_failure():
+    def load_all():
+        raise RuntimeError("模型目录不存在")
+
+    async def scenario():
+        registry = ModelRegistry.all_at_once(load_all)
+        registry.start()
+        with pytest.raises(ModelNotReady):
+            await registry.get("water")
+        return registry.status()
+
+    status = run(scenario())
+    assert status["models"][ALL_MODELS]["state"] == FAILED
+    assert "模型目录不存在" in status["models"][ALL_MODELS]["error"]
+
+
+def test_router_waits_for_startup_models():
+    """路由器依赖等待启动时开始加载的模型，之后异步路由从映射取到模型；超时返回503"""
+    loader = Loader(delays={"m": 0.2})
+    registry = ModelRegistry({"m": {}}, loader)
+    app = FastAPI()
+    app.add_exception_handler(ModelNotReady, model_not_ready_handler)
+
+    @app.on_event("startup")
+    async def startup():
+        app.state.model_registry = registry
+        app.state.models = registry.mapping()
+        registry.start()
+
+    @app.get("/detect", dependencies=[Depends(require_loaded())])
+    async def detect():
+        return {"model": app.state.models["m"].name}
+
+    @app.get("/detect/short", dependencies=[Depends(require_loaded(timeout=0.01))])
+    async def detect_short():
+        return {"model": app.state.models["m"].name}
+
+    async def scenario():
+        await app.router.startup()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            short = await client.get("/detect/short")
+            waited = await client.get("/detect")
+        return short, waited
+
+    short, waited = run(scenario())
+    assert short.status_code == 503
+    assert short.headers["retry-after"] == "10"
+    assert waited.status_code == 200
+    assert waited.json() == {"model": "m"}
+    assert loader.calls == ["m"]
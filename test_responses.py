@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+JSON响应测试 - 验证中文不转义、ETag与If-None-Match返回304、按Accept-Encoding压缩且各编码ETag不同
+"""
+
+import asyncio
+import gzip
+import importlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from monitor import responses
+from monitor.responses import EncodedJSON, dumps, encoding_etag, make_etag, negotiate_encoding
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+
+
+def test_dumps_keeps_chinese():
+    assert dumps({"状态": "完成", 1: "a"}).decode("utf-8") == '{"状态":"完成","1":"a"}'
+
+
+def test_make_etag_is_stable_and_distinguishes_parts():
+    assert make_etag("a", 1) == make_etag("a", 1)
+    assert make_etag("a", 1) != make_etag("a1")
+    assert make_etag(b"body").startswith('"')
+
+
+def test_encoding_etag():
+    assert encoding_etag('"abc"', None) == '"abc"'
+    assert encoding_etag('"abc"', "gzip") == '"abc-gzip"'
+    assert encoding_etag('"abc"', "br") == '"abc-br"'
+
+
+def test_negotiate_encoding(monkeypatch):
+    assert negotiate_encoding(None) is None
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0, deflate") is None
+    assert negotiate_encoding("identity") is None
+    monkeypatch.setattr(responses, "brotli", object())
+    assert negotiate_encoding("gzip, br") == "br"
+    monkeypatch.setattr(responses, "brotli", None)
+    assert negotiate_encoding("gzip, br") == "gzip"
+
+
+def test_encoded_json_compression_and_cache_round_trip():
+    encoded = EncodedJSON.encode({"items": ["检测结果"] * 500})
+    assert encoded.should_compress("gzip")
+    assert not EncodedJSON.encode({"a": 1}).should_compress("gzip")
+    compressed = encoded.compressed("gzip")
+    assert gzip.decompress(compressed) == encoded.body
+    assert encoded.compressed("gzip") is compressed  # 同一ETag只压缩一次
+
+    restored = EncodedJSON.from_cache(json.loads(json.dumps(encoded.to_cache())))
+    assert restored.body == encoded.body
+    assert restored.etag == encoded.etag
+
+
+@pytest.fixture(scope="module")
+def monitor_app(tmp_path_factory):
+    """在临时目录中导入monitor_web(数据目录取当前工作目录)"""
+    root = tmp_path_factory.mktemp("monitor")
+    json_dir = root / "data" / "detected_result_json_files"
+    json_dir.mkdir(parents=True)
+    images_dir = root / "data" / "detected_result_images"
+    images_dir.mkdir(parents=True)
+    (root / "logs").mkdir()
+    (root / "logs" / "monitor.log").write_text("定时任务结束\n", encoding="utf-8")
+    for i in range(30):
+        timestamp_str = time.strftime("%Y%m%d_%H%M%S", time.localtime(1_700_000_000 + i * 60))
+        (json_dir / f"detect_result_{timestamp_str}.json").write_text(
+            json.dumps({"异常区域检测": {"数量": i}}, ensure_ascii=False), encoding="utf-8"
+        )
+        (images_dir / f"result_{timestamp_str}.png").write_bytes(b"png")
+
+    cwd = os.getcwd()
+    os.chdir(root)
+    os.environ["MONITOR_WATCH"] = "0"
+    sys.path.insert(0, str(PACKAGE_DIR))
+    try:
+        sys.modules.pop("monitor_web", None)
+        yield importlib.import_module("monitor_web")
+    finally:
+        sys.modules.pop("monitor_web", None)
+        os.chdir(cwd)
+
+
+def get_all(app, *requests):
+    import httpx
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [await client.get(path, headers=headers) for path, headers in requests]
+
+    return asyncio.run(scenario())
+
+
+def test_history_etag_and_304(monitor_app):
+    first, = get_all(monitor_app.app, ("/api/tasks/history", {}))
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "no-cache"
+    assert first.json()["total"] == 30
+
+    cached, other = get_all(
+        monitor_app.app,
+        ("/api/tasks/history", {"If-None-Match": etag}),
+        ("/api/tasks/history", {"If-None-Match": '"something-else"'}),
+    )
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+    assert other.status_code == 200
+
+
+def test_history_gzip(monitor_app):
+    plain, compressed = get_all(
+        monitor_app.app,
+        ("/api/tasks/history", {"Accept-Encoding": "identity"}),
+        ("/api/tasks/history", {"Accept-Encoding": "gzip"}),
+    )
+    assert "content-encoding" not in plain.headers
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.headers["vary"] == "Accept-Encoding"
+    assert compressed.json() == plain.json()
+    # 不同内容编码的表示使用不同的强ETag
+    assert compressed.headers["etag"] == encoding_etag(plain.headers["etag"], "gzip")
+
+    gzip_cached, plain_with_gzip_etag = get_all(
+        monitor_app.app,
+        ("/api/tasks/history", {"Accept-Encoding": "gzip", "If-None-Match": compressed.headers["etag"]}),
+        ("/api/tasks/history", {"Accept-Encoding": "identity", "If-None-Match": compressed.headers["etag"]}),
+    )
+    assert gzip_cached.status_code == 304
+    assert gzip_cached.headers["etag"] == compressed.headers["etag"]
+    assert plain_with_gzip_etag.status_code == 200
+
+
+def test_listing_version_etag(monitor_app):
+    """文件列表按索引版本生成ETag，目录未变化时返回304，新增文件后ETag变化"""
+    first, = get_all(monitor_app.app, ("/api/images?limit=5", {}))
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    cached, = get_all(monitor_app.app, ("/api/images?limit=5", {"If-None-Match": etag}))
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+
+    new_image = monitor_app.DETECTED_IMAGES_DIR / "result_20300101_000000.png"
+    new_image.write_bytes(b"png")
+    monitor_app.image_listing.add(new_image)
+    changed, = get_all(monitor_app.app, ("/api/images?limit=5", {"If-None-Match": etag}))
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+检测结果缓存测试 - 验证缓存键规范化、结果存取，以及推理API收到的是原始检测参数
+"""
+
+import asyncio
+import importlib
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+from monitor.result_cache import DetectionResultCache, normalize_params, result_cache_key
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+
+
+def test_cache_key_ignores_category_order_and_duplicates():
+    """类别顺序和重复项不影响缓存键，其他参数不同时缓存键不同"""
+    a = normalize_params(["forest", "water", "forest"], True, False, False)
+    b = normalize_params(["water", "forest"], True, False, False)
+    c = normalize_params(["water", "forest"], False, False, False)
+    assert result_cache_key("abc", a) == result_cache_key("abc", b)
+    assert result_cache_key("abc", a) != result_cache_key("abc", c)
+    assert result_cache_key("abc", a) != result_cache_key("abd", a)
+
+
+def test_store_and_lookup(tmp_path):
+    """缓存结果连同结果图片副本一起保存，重新打开缓存后仍可命中"""
+    images_dir = tmp_path / "images"
+    images_dir.mkdir()
+    (images_dir / "result_1.png").write_bytes(b"png")
+    params = normalize_params(["forest"], True, False, False)
+    key = result_cache_key("abc", params)
+    response = {"status": "success", "result_image": "result_1.png"}
+
+    cache = DetectionResultCache(tmp_path / "cache", images_dir, max_bytes=1 << 20)
+    assert cache.lookup(key) is None
+    cache.store(key, response, "abc", params, 12.5)
+    assert cache.lookup(key)["status"] == "success"
+
+    reopened = DetectionResultCache(tmp_path / "cache", images_dir, max_bytes=1 << 20)
+    assert reopened.lookup(key)["status"] == "success"
+
+
+@pytest.fixture(scope="module")
+def monitor_app(tmp_path_factory):
+    """在临时目录中导入monitor_web(数据目录取当前工作目录)"""
+    root = tmp_path_factory.mktemp("monitor")
+    (root / "data" / "detected_result_json_files").mkdir(parents=True)
+    (root / "logs").mkdir()
+    (root / "logs" / "monitor.log").write_text("", encoding="utf-8")
+
+    cwd = os.getcwd()
+    os.chdir(root)
+    os.environ["MONITOR_WATCH"] = "0"
+    sys.path.insert(0, str(PACKAGE_DIR))
+    try:
+        sys.modules.pop("monitor_web", None)
+        yield importlib.import_module("monitor_web")
+    finally:
+        sys.modules.pop("monitor_web", None)
+        os.chdir(cwd)
+
+
+def test_inference_receives_original_params(monitor_app, monkeypatch):
+    """推理API收到请求中的原始类别顺序，规范化参数只用于缓存键"""
+    import httpx
+
+    submitted = []
+
+    async def fake_submit(kind, params):
+        submitted.append(params)
+        return {"id": "0" * 32, "status": "queued", "params": params}
+
+    monkeypatch.setattr(monitor_app.job_queue, "submit", fake_submit)
+    categories = ["water", "forest", "water"]
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=monitor_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(
+                "/api/upload-and-detect",
+                files={"image": ("scene.png", b"fake image", "image/png")},
+                data={"categories": json.dumps(categories), "use_cache": "false"},
+            )
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 200
+    params = submitted[0]
+    assert params["detect_data"]["categories"] == categories
+    assert params["detect_data"]["is_change_detection"] is True
+    assert params["cache_params"]["categories"] == ["forest", "water"]
+    assert params["cache_key"] == result_cache_key(params["image_sha256"], params["cache_params"])
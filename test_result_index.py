@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+结果索引测试 - 验证增量同步、按文件事件更新、图片关联和游标分页
+"""
+
+import json
+import os
+import time
+
+import pytest
+
+from monitor.image_map import ImageTimestampMap
+from monitor.result_index import ResultIndex, decode_cursor, encode_cursor
+
+
+def write_result(json_dir, timestamp_str, count=1, ctime=None):
+    path = json_dir / f"detect_result_{timestamp_str}.json"
+    path.write_text(json.dumps({"异常区域检测": {"数量": count}}, ensure_ascii=False), encoding="utf-8")
+    if ctime is not None:
+        os.utime(path, (ctime, ctime))
+    return path
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    json_dir = tmp_path / "json"
+    images_dir = tmp_path / "images"
+    json_dir.mkdir()
+    images_dir.mkdir()
+    return json_dir, images_dir
+
+
+@pytest.fixture
+def index(tmp_path, dirs):
+    json_dir, images_dir = dirs
+    idx = ResultIndex(tmp_path / "result_index.db", json_dir, ImageTimestampMap(images_dir))
+    yield idx
+    idx.close()
+
+
+def test_sync_is_incremental(index, dirs):
+    json_dir, _ = dirs
+    for i in range(3):
+        write_result(json_dir, f"20240101_10000{i}", count=i)
+    assert index.sync() == {"added": 3, "updated": 0, "removed": 0}
+    # 未变化的文件不重新解析
+    assert index.sync() == {"added": 0, "updated": 0, "removed": 0}
+
+    path = write_result(json_dir, "20240101_100001", count=99)
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 1_000_000))
+    os.remove(json_dir / "detect_result_20240101_100000.json")
+    assert index.sync() == {"added": 0, "updated": 1, "removed": 1}
+    tasks = {task["id"]: task for task in index.query()["tasks"]}
+    assert set(tasks) == {"detect_result_20240101_100001", "detect_result_20240101_100002"}
+    assert tasks["detect_result_20240101_100001"]["summary"]["异常区域"] == {"数量": 99}
+    assert tasks["detect_result_20240101_100001"]["timestamp"] == "2024-01-01T10:00:01"
+
+
+def test_invalid_json_is_skipped_until_changed(index, dirs):
+    json_dir, _ = dirs
+    broken = json_dir / "detect_result_20240101_100000.json"
+    broken.write_text("{", encoding="utf-8")
+    assert index.sync()["added"] == 0
+    assert index.sync()["added"] == 0
+    write_result(json_dir, "20240101_100000")
+    os.utime(broken, ns=(time.time_ns(), time.time_ns() + 1_000_000))
+    assert index.sync()["added"] == 1
+
+
+def test_update_paths_without_scanning(index, dirs):
+    json_dir, _ = dirs
+    path = write_result(json_dir, "20240101_100000")
+    assert index.update_paths([path, json_dir / "notes.txt"]) == {"updated": 1, "removed": 0}
+    assert index.query()["total"] == 1
+    os.remove(path)
+    assert index.update_paths([path]) == {"updated": 0, "removed": 1}
+    assert index.query()["total"] == 0
+
+
+def test_images_linked_by_timestamp(index, dirs):
+    json_dir, images_dir = dirs
+    write_result(json_dir, "20240101_100000")
+    (images_dir / "result_20240101_100000.png").write_bytes(b"png")
+    index.sync()
+    assert [os.path.basename(p) for p in index.query()["tasks"][0]["image_files"]] == ["result_20240101_100000.png"]
+
+    # 图片晚于结果文件生成，按时间戳更新关联
+    new_image = images_dir / "legend_20240101_100000.png"
+    new_image.write_bytes(b"png")
+    index.relink(index.image_map.add(new_image))
+    assert len(index.query()["tasks"][0]["image_files"]) == 2
+
+
+def test_cursor_pagination(index, dirs):
+    json_dir, _ = dirs
+    for i in range(7):
+        write_result(json_dir, f"20240101_1000{i:02d}", ctime=1_700_000_000 + i)
+    index.sync()
+    ids, cursor = [], None
+    while True:
+        page = index.query(limit=3, cursor=cursor)
+        assert page["total"] == 7
+        ids.extend(task["id"] for task in page["tasks"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(ids) == len(set(ids)) == 7
+    with pytest.raises(ValueError):
+        index.query(cursor="not a cursor")
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(1.5, "detect_result_x")) == (1.5, "detect_result_x")
+
+
+def test_rollups_follow_inserts_updates_and_deletes(index, dirs):
+    """汇总表随结果行的增删改由触发器维护，与全量统计一致"""
+    json_dir, images_dir = dirs
+    for name in ("20240101_100000", "20240101_113000", "20240102_090000"):
+        write_result(json_dir, name)
+    (images_dir / "result_20240101_100000.png").write_bytes(b"png")
+    (images_dir / "legend_20240101_100000.png").write_bytes(b"png")
+    index.sync()
+    assert index.counters()["tasks"] == 3
+    assert index.counters()["images"] == 2
+    assert index.rollups("day", "2024-01-01") == {
+        "2024-01-01": {"tasks": 2, "images": 2},
+        "2024-01-02": {"tasks": 1, "images": 0},
+    }
+    assert index.rollups("hour", "2024-01-01T11:00:00") == {
+        "2024-01-01T11:00:00": {"tasks": 1, "images": 0},
+        "2024-01-02T09:00:00": {"tasks": 1, "images": 0},
+    }
+
+    # 更新(UPSERT)不重复计数，删除后减去
+    path = write_result(json_dir, "20240101_100000", count=5)
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 1_000_000))
+    index.sync()
+    assert index.counters()["tasks"] == 3
+    os.remove(json_dir / "detect_result_20240101_113000.json")
+    index.sync()
+    assert index.rollups("day", "2024-01-01")["2024-01-01"] == {"tasks": 1, "images": 2}
+    assert index.counters()["tasks"] == 2
+
+
+def test_rollups_rebuilt_for_old_index(tmp_path, dirs):
+    """汇总表与结果表不一致(旧版本索引)时打开索引会重建汇总"""
+    json_dir, images_dir = dirs
+    write_result(json_dir, "20240101_100000")
+    db_path = tmp_path / "result_index.db"
+    idx = ResultIndex(db_path, json_dir, ImageTimestampMap(images_dir))
+    idx.sync()
+    with idx._lock:
+        idx._conn.execute("DELETE FROM rollups")
+        idx._conn.commit()
+    idx.close()
+
+    reopened = ResultIndex(db_path, json_dir, ImageTimestampMap(images_dir))
+    try:
+        assert reopened.counters()["tasks"] == 1
+        assert reopened.rollups("day", "2024-01-01") == {"2024-01-01": {"tasks": 1, "images": 0}}
+    finally:
+        reopened.close()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+缩略图缓存测试 - 验证缓存命中、源文件变化后重新生成、渲染时不占用IO线程，以及预生成只处理写入完成的文件
+"""
+
+import asyncio
+import os
+import time
+
+from PIL import Image
+
+from monitor.thumbnails import ThumbnailCache, ThumbnailWarmer
+from monitor.workers import BoundedPool
+
+
+def make_image(path, color=(40, 120, 200), size=(800, 600)):
+    Image.new("RGB", size, color).save(path, format="PNG")
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class CountingCache:
+    """记录get调用的缓存替身"""
+
+    def __init__(self):
+        self.calls = []
+
+    def get(self, source_path, fmt):
+        self.calls.append((source_path, fmt, os.path.getsize(source_path)))
+
+
+def test_thumbnail_cached_and_regenerated_after_change(tmp_path):
+    """同一源文件只生成一次，源文件修改后重新生成"""
+    source = tmp_path / "result_1.png"
+    make_image(source)
+    cache = ThumbnailCache(tmp_path / "cache", 10 * 1024 * 1024)
+    first = cache.get(str(source), "jpeg")
+    second = cache.get(str(source), "jpeg")
+    assert first == second
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    make_image(source, color=(200, 10, 10))
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert cache.get(str(source), "jpeg") != first
+
+
+def test_warmer_waits_until_file_stops_changing(tmp_path):
+    """文件仍在写入时不预生成，多次事件只处理一次"""
+    source = tmp_path / "result_big.tif"
+    source.write_bytes(b"x" * 100)
+    cache = CountingCache()
+    warmer = ThumbnailWarmer(cache, ["jpeg"], settle_seconds=0.2)
+    warmer.start()
+    try:
+        for i in range(5):
+            warmer.enqueue(source)
+            with open(source, "ab") as f:
+                f.write(b"x" * 100)
+            time.sleep(0.1)
+        assert cache.calls == []
+        assert wait_for(lambda: cache.calls)
+        time.sleep(0.5)
+        assert cache.calls == [(str(source), "jpeg", 600)]
+        assert warmer.pending() == 0
+    finally:
+        warmer.stop()
+
+
+def test_warmer_queue_is_bounded_and_deduplicated(tmp_path):
+    """重复的路径不重复入队，超过上限的新文件被丢弃"""
+    warmer = ThumbnailWarmer(CountingCache(), ["jpeg"], max_pending=2)
+    assert warmer.enqueue(tmp_path / "a.png")
+    assert warmer.enqueue(tmp_path / "a.png")
+    assert warmer.enqueue(tmp_path / "b.png")
+    assert not warmer.enqueue(tmp_path / "c.png")
+    assert warmer.pending() == 2
+    assert warmer.dropped == 1
+
+
+def test_warmer_skips_deleted_files(tmp_path):
+    source = tmp_path / "gone.png"
+    source.write_bytes(b"x")
+    cache = CountingCache()
+    warmer = ThumbnailWarmer(cache, ["jpeg"], settle_seconds=0.05)
+    warmer.start()
+    try:
+        warmer.enqueue(source)
+        source.unlink()
+        assert wait_for(lambda: warmer.pending() == 0)
+        assert cache.calls == []
+    finally:
+        warmer.stop()
+
+
+def test_fetch_renders_without_holding_io_thread(tmp_path):
+    """未命中时等待进程池渲染期间，只有一个线程的IO池仍可处理其他请求"""
+    source = tmp_path / "result_1.png"
+    make_image(source)
+    cache = ThumbnailCache(tmp_path / "thumbs", max_bytes=10 * 1024 * 1024)
+    io_pool = BoundedPool("io", "thread", max_workers=1, max_queue=0)
+    cpu_pool = BoundedPool("cpu", "thread", max_workers=1, max_queue=0)
+
+    async def scenario():
+        rendering = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_cpu(fn, *args):
+            rendering.set()
+            await release.wait()
+            return await cpu_pool.run(fn, *args)
+
+        fetch = asyncio.ensure_future(cache.fetch(str(source), os.stat(source), "jpeg", io_pool.run, slow_cpu))
+        await rendering.wait()
+        assert io_pool.metrics()["active"] == 0
+        assert await io_pool.run(len, "io") == 2
+        release.set()
+        path, key = await fetch
+        assert path.exists() and key.endswith(".jpeg")
+        # 命中时不再渲染
+        assert await cache.fetch(str(source), os.stat(source), "jpeg", io_pool.run, None) == (path, key)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        io_pool.shutdown()
+        cpu_pool.shutdown()
+    assert (cache.hits, cache.misses) == (1, 1)
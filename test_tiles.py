@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+瓦片金字塔测试 - 验证层级计算、越界坐标、不支持降分辨率解码的格式只解码一次，以及解码像素上限
+"""
+
+import asyncio
+import importlib
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from monitor import tiles
+from monitor.tiles import ImageTooLarge, TileStore, pyramid_levels
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+
+
+def count_decodes(monkeypatch):
+    calls = []
+    original = tiles.open_reduced
+
+    def counted(source_path, factor, max_pixels=None):
+        calls.append(factor)
+        return original(source_path, factor, max_pixels)
+
+    monkeypatch.setattr(tiles, "open_reduced", counted)
+    return calls
+
+
+def test_pyramid_levels():
+    max_zoom, levels = pyramid_levels(1000, 600, tile_size=256)
+    assert max_zoom == 2
+    assert [(level["width"], level["height"]) for level in levels] == [(250, 150), (500, 300), (1000, 600)]
+    assert (levels[2]["cols"], levels[2]["rows"]) == (4, 3)
+    assert pyramid_levels(100, 80)[0] == 0
+
+
+def test_single_page_image_decoded_once_for_all_levels(tmp_path, monkeypatch):
+    """PNG/单页TIFF请求任一层时一次解码构建所有层"""
+    source = tmp_path / "result_big.png"
+    Image.new("RGB", (1100, 700), (10, 200, 30)).save(source)
+    decodes = count_decodes(monkeypatch)
+    pyramid = TileStore(tmp_path / "tiles").get(source)
+
+    overview = pyramid.tile_path(0, 0, 0)
+    assert decodes == [1]
+    for z, level in enumerate(pyramid.meta["levels"]):
+        assert (pyramid.cache_dir / str(z) / ".done").exists()
+        with Image.open(pyramid.tile_path(z, level["cols"] - 1, level["rows"] - 1)) as tile:
+            assert tile.size[0] <= 256 and tile.size[1] <= 256
+    assert decodes == [1]
+    with Image.open(overview) as tile:
+        assert tile.size == (pyramid.meta["levels"][0]["width"], pyramid.meta["levels"][0]["height"])
+
+
+def test_jpeg_builds_requested_level_at_reduced_resolution(tmp_path, monkeypatch):
+    """JPEG按请求的层降分辨率解码，不构建更高的层"""
+    source = tmp_path / "result_big.jpg"
+    Image.new("RGB", (2048, 1024), (200, 30, 30)).save(source, quality=80)
+    decodes = count_decodes(monkeypatch)
+    pyramid = TileStore(tmp_path / "tiles").get(source)
+
+    pyramid.tile_path(0, 0, 0)
+    assert decodes == [8]
+    assert not (pyramid.cache_dir / "3" / ".done").exists()
+    pyramid.tile_path(3, 7, 3)
+    assert decodes == [8, 1]
+
+
+def test_fetch_builds_level_once_in_cpu_runner(tmp_path):
+    """并发请求同一层时只构建一次，构建交给cpu_runner"""
+    source = tmp_path / "result_big.png"
+    Image.new("RGB", (1100, 700)).save(source)
+    pyramid = TileStore(tmp_path / "tiles").get(source)
+    builds = []
+
+    async def io_runner(fn, *args):
+        return fn(*args)
+
+    async def cpu_runner(fn, *args):
+        builds.append(args[3])
+        await asyncio.sleep(0.05)
+        return fn(*args)
+
+    async def scenario():
+        return await asyncio.gather(*(pyramid.fetch(0, 0, 0, io_runner, cpu_runner) for _ in range(3)))
+
+    paths = asyncio.run(scenario())
+    assert builds == [0]
+    assert all(path == paths[0] and path.exists() for path in paths)
+    assert asyncio.run(pyramid.fetch(9, 0, 0, io_runner, cpu_runner)) is None
+
+
+def test_out_of_range_tiles(tmp_path):
+    source = tmp_path / "small.png"
+    Image.new("RGB", (300, 200)).save(source)
+    pyramid = TileStore(tmp_path / "tiles").get(source)
+    assert pyramid.tile_path(5, 0, 0) is None
+    assert pyramid.tile_path(1, 2, 0) is None
+    assert pyramid.tile_path(-1, 0, 0) is None
+
+
+def test_source_change_uses_new_pyramid(tmp_path):
+    """源文件修改后使用新的缓存目录并删除旧版本"""
+    source = tmp_path / "result.png"
+    Image.new("RGB", (600, 400), (0, 0, 0)).save(source)
+    store = TileStore(tmp_path / "tiles")
+    old = store.get(source)
+    old.tile_path(0, 0, 0)
+    Image.new("RGB", (800, 400), (255, 255, 255)).save(source)
+    new = store.get(source)
+    assert new.key != old.key
+    assert new.meta["width"] == 800
+    assert not old.cache_dir.exists()
+
+
+def test_decode_over_pixel_budget_is_rejected(tmp_path):
+    """不支持降分辨率解码的影像超过像素上限时不解码、不写入瓦片"""
+    source = tmp_path / "result_big.png"
+    Image.new("RGB", (1100, 1000)).save(source)
+    pyramid = TileStore(tmp_path / "tiles", max_pixels=1_000_000).get(source)
+    with pytest.raises(ImageTooLarge):
+        pyramid.tile_path(0, 0, 0)
+    assert not (pyramid.cache_dir / "0").exists()
+
+
+def test_reduced_decode_within_pixel_budget(tmp_path):
+    """JPEG低层级按降低后的分辨率计算像素数，只有原始分辨率层超出上限"""
+    source = tmp_path / "result_big.jpg"
+    Image.new("RGB", (2048, 1024)).save(source, quality=80)
+    pyramid = TileStore(tmp_path / "tiles", max_pixels=1_000_000).get(source)
+    assert pyramid.tile_path(0, 0, 0).exists()
+    with pytest.raises(ImageTooLarge):
+        pyramid.tile_path(pyramid.meta["max_zoom"], 0, 0)
+
+
+@pytest.fixture(scope="module")
+def monitor_app(tmp_path_factory):
+    """在临时目录中导入monitor_web(数据目录取当前工作目录)"""
+    root = tmp_path_factory.mktemp("monitor")
+    images_dir = root / "data" / "detected_result_images"
+    images_dir.mkdir(parents=True)
+    (root / "data" / "detected_result_json_files").mkdir()
+    (root / "logs").mkdir()
+    (root / "logs" / "monitor.log").write_text("定时任务结束\n", encoding="utf-8")
+    Image.new("RGB", (300, 200)).save(images_dir / "result_small.png")
+    Image.new("RGB", (1100, 1000)).save(images_dir / "result_big.png")
+
+    cwd = os.getcwd()
+    os.chdir(root)
+    os.environ["MONITOR_WATCH"] = "0"
+    sys.path.insert(0, str(PACKAGE_DIR))
+    try:
+        sys.modules.pop("monitor_web", None)
+        yield importlib.import_module("monitor_web")
+    finally:
+        sys.modules.pop("monitor_web", None)
+        os.chdir(cwd)
+
+
+def get(app, path, headers=None):
+    import httpx
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path, headers=headers or {})
+
+    return asyncio.run(scenario())
+
+
+def test_tile_endpoint_etag_and_pixel_budget(monitor_app, tmp_path, monkeypatch):
+    monkeypatch.setattr(monitor_app, "tile_store", TileStore(tmp_path / "tiles", max_pixels=1_000_000))
+    tile = get(monitor_app.app, "/api/images/result_small.png/tiles/0/0/0")
+    assert tile.status_code == 200
+    etag = tile.headers["etag"]
+    # 弱ETag和ETag列表同样命中
+    for if_none_match in (etag, f"W/{etag}", f'"other", {etag}'):
+        response = get(monitor_app.app, "/api/images/result_small.png/tiles/0/0/0", {"If-None-Match": if_none_match})
+        assert response.status_code == 304
+
+    too_large = get(monitor_app.app, "/api/images/result_big.png/tiles/0/0/0")
+    assert too_large.status_code == 422
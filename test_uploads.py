@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+分块上传测试 - 验证按偏移续传、哈希校验、跨实例(工作进程)接续、并发写入冲突和过期清理
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import pytest
+
+from monitor.uploads import UploadConflict, UploadNotFound, UploadStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(tmp_path / "uploads", tmp_path / "sessions")
+
+
+def append(store, upload_id, offset, *chunks):
+    session = store.begin_append(upload_id, offset)
+    for chunk in chunks:
+        store.write(session, chunk)
+    return store.end_append(session)
+
+
+def test_chunked_upload_and_finalize(store):
+    data = os.urandom(300_000)
+    status = store.create("scene.tif", total_size=len(data))
+    upload_id = status["upload_id"]
+    assert status["offset"] == 0 and not status["complete"]
+
+    assert append(store, upload_id, 0, data[:100_000], data[100_000:150_000])["offset"] == 150_000
+    assert append(store, upload_id, 150_000, data[150_000:])["complete"]
+
+    path, digest, size = store.finalize(upload_id, hashlib.sha256(data).hexdigest())
+    assert path.read_bytes() == data
+    assert path.suffix == ".tif"
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert size == len(data)
+    with pytest.raises(UploadNotFound):
+        store.get(upload_id)
+
+
+def test_offset_mismatch_and_oversize(store):
+    upload_id = store.create("a.png", total_size=10)["upload_id"]
+    append(store, upload_id, 0, b"12345")
+    with pytest.raises(UploadConflict) as exc_info:
+        store.begin_append(upload_id, 0)
+    assert exc_info.value.offset == 5
+    session = store.begin_append(upload_id, 5)
+    with pytest.raises(ValueError):
+        store.write(session, b"too many bytes")
+    store.end_append(session)
+    with pytest.raises(UploadConflict):
+        store.finalize(upload_id)
+
+
+def test_unconfirmed_data_is_discarded(store):
+    """写入后未确认(请求中断)的数据在下次续传时丢弃"""
+    upload_id = store.create("a.png")["upload_id"]
+    append(store, upload_id, 0, b"hello ")
+    session = store.begin_append(upload_id, 6)
+    store.write(session, b"garbage")
+    session._file.close()  # 模拟请求中断，没有调用end_append
+
+    assert store.get(upload_id)["offset"] == 6
+    append(store, upload_id, 6, b"world")
+    path, digest, _ = store.finalize(upload_id)
+    assert path.read_bytes() == b"hello world"
+    assert digest == hashlib.sha256(b"hello world").hexdigest()
+
+
+def test_resume_in_another_instance(tmp_path, store):
+    """另一个工作进程(独立的UploadStore)按磁盘上的元数据接续上传，哈希从文件重新计算"""
+    upload_id = store.create("a.png")["upload_id"]
+    append(store, upload_id, 0, b"part one, ")
+    other = UploadStore(tmp_path / "uploads", tmp_path / "sessions")
+    append(other, upload_id, 10, b"part two")
+    path, digest, _ = store.finalize(upload_id)
+    assert digest == hashlib.sha256(b"part one, part two").hexdigest()
+
+
+def test_concurrent_append_conflicts(store):
+    upload_id = store.create("a.png")["upload_id"]
+    session = store.begin_append(upload_id, 0)
+    try:
+        with pytest.raises(UploadConflict):
+            store.begin_append(upload_id, 0)
+    finally:
+        store.end_append(session)
+
+
+def test_checksum_mismatch_keeps_session(store):
+    upload_id = store.create("a.png")["upload_id"]
+    append(store, upload_id, 0, b"data")
+    with pytest.raises(ValueError):
+        store.finalize(upload_id, "0" * 64)
+    assert store.get(upload_id)["offset"] == 4
+    assert store.finalize(upload_id, hashlib.sha256(b"data").hexdigest())[2] == 4
+
+
+def test_abort_and_expire(tmp_path, store):
+    aborted = store.create("a.png")["upload_id"]
+    store.abort(aborted)
+    with pytest.raises(UploadNotFound):
+        store.get(aborted)
+
+    stale = store.create("b.png")["upload_id"]
+    fresh = store.create("c.png")["upload_id"]
+    meta_path = tmp_path / "sessions" / f"{stale}.json"
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    meta["updated_at"] = time.time() - 25 * 3600
+    meta_path.write_text(json.dumps(meta), encoding="utf-8")
+
+    store.expire()
+    with pytest.raises(UploadNotFound):
+        store.get(stale)
+    assert not os.path.exists(meta["path"] + ".part")
+    assert store.get(fresh)["offset"] == 0
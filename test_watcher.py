@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+目录监听测试 - 验证轮询和inotify两种模式下的新增、修改、删除事件，以及回调异常不会停止监听
+"""
+
+import os
+import threading
+import time
+
+import pytest
+
+from monitor import watcher as watcher_module
+from monitor.watcher import ADDED, DELETED, MODIFIED, DirectoryWatcher
+
+
+class Recorder:
+    def __init__(self, fail_first=False):
+        self.events = []
+        self.fail_first = fail_first
+        self._cond = threading.Condition()
+
+    def __call__(self, changes):
+        with self._cond:
+            self.events.extend((change, os.path.basename(path)) for change, path in changes)
+            self._cond.notify_all()
+        if self.fail_first:
+            self.fail_first = False
+            raise RuntimeError("回调失败")
+
+    def wait_for(self, event, timeout=5):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while event not in self.events:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+
+@pytest.fixture(params=["polling", "inotify"])
+def mode(request, monkeypatch):
+    if request.param == "polling":
+        monkeypatch.setenv("MONITOR_WATCH_POLLING", "1")
+    else:
+        if watcher_module.watchfiles is None:
+            pytest.skip("未安装watchfiles")
+        monkeypatch.delenv("MONITOR_WATCH_POLLING", raising=False)
+    return request.param
+
+
+def test_added_modified_deleted(tmp_path, mode):
+    recorder = Recorder()
+    watcher = DirectoryWatcher([tmp_path], recorder, poll_interval=0.05, debounce_ms=20)
+    watcher.start()
+    try:
+        time.sleep(0.2)  # 等待监听建立
+        assert watcher.active
+        path = tmp_path / "detect_result_20240101_100000.json"
+        path.write_text("{}")
+        assert recorder.wait_for((ADDED, path.name))
+        time.sleep(0.1)
+        path.write_text('{"a": 1}')
+        assert recorder.wait_for((MODIFIED, path.name))
+        os.remove(path)
+        assert recorder.wait_for((DELETED, path.name))
+    finally:
+        watcher.stop()
+    assert not watcher.active
+    if mode == "polling":
+        assert watcher.mode == "polling"
+
+
+def test_callback_error_does_not_stop_watching(tmp_path, monkeypatch):
+    monkeypatch.setenv("MONITOR_WATCH_POLLING", "1")
+    recorder = Recorder(fail_first=True)
+    watcher = DirectoryWatcher([tmp_path], recorder, poll_interval=0.05)
+    watcher.start()
+    try:
+        time.sleep(0.1)
+        (tmp_path / "a.json").write_text("{}")
+        assert recorder.wait_for((ADDED, "a.json"))
+        (tmp_path / "b.json").write_text("{}")
+        assert recorder.wait_for((ADDED, "b.json"))
+    finally:
+        watcher.stop()
+
+
+def test_missing_directory_is_picked_up_when_created(tmp_path, mode):
+    """监听的目录启动时不存在，创建后开始产生事件"""
+    directory = tmp_path / "later"
+    recorder = Recorder()
+    watcher = DirectoryWatcher([directory], recorder, poll_interval=0.05, debounce_ms=20)
+    watcher.start()
+    try:
+        time.sleep(0.1)
+        directory.mkdir()
+        time.sleep(0.3)
+        (directory / "a.png").write_bytes(b"png")
+        assert recorder.wait_for((ADDED, "a.png"))
+    finally:
+        watcher.stop()
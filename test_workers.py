@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+工作池测试 - 验证排队满载拒绝、inline/线程/进程三种模式、指标统计、503响应和事件循环延迟测量
+"""
+
+import asyncio
+import importlib
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from monitor.metrics import EVENT_LOOP_LAG
+from monitor.workers import BoundedPool, EventLoopLagMonitor, PoolOverloaded
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+
+
+def fail():
+    raise RuntimeError("boom")
+
+
+def test_thread_pool_rejects_when_queue_full():
+    """执行和排队的任务达到 max_workers + max_queue 时拒绝新任务"""
+    pool = BoundedPool("io", "thread", max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        blocked = [asyncio.ensure_future(pool.run(release.wait, 5)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        metrics = pool.metrics()
+        assert (metrics["active"], metrics["queued"]) == (1, 1)
+        with pytest.raises(PoolOverloaded):
+            await pool.run(time.sleep, 0)
+        release.set()
+        assert await asyncio.gather(*blocked) == [True, True]
+        # 排队的任务结束后可以继续提交
+        assert await pool.run(len, "abc") == 3
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    metrics = pool.metrics()
+    assert metrics["submitted"] == 3
+    assert metrics["completed"] == 3
+    assert metrics["rejected"] == 1
+    assert metrics["active"] == metrics["queued"] == 0
+    assert metrics["avg_wait_ms"] > 0
+    assert metrics["max_run_ms"] >= metrics["avg_run_ms"] > 0
+
+
+def test_inline_pool_runs_in_caller_and_counts_failures():
+    pool = BoundedPool("inline", "inline", max_workers=1, max_queue=0)
+    assert asyncio.run(pool.run(threading.get_ident)) == threading.get_ident()
+    assert pool.call(sum, [1, 2, 3]) == 6
+    with pytest.raises(RuntimeError):
+        pool.call(fail)
+    metrics = pool.metrics()
+    assert (metrics["completed"], metrics["failed"], metrics["rejected"]) == (2, 1, 0)
+
+
+def test_process_pool_runs_in_another_process():
+    pool = BoundedPool("cpu", "process", max_workers=1, max_queue=2)
+    try:
+        assert asyncio.run(pool.run(os.getpid)) != os.getpid()
+        # call供工作线程同步调用
+        assert pool.call(pow, 2, 10) == 1024
+        with pytest.raises(RuntimeError):
+            pool.call(fail)
+    finally:
+        pool.shutdown()
+    metrics = pool.metrics()
+    assert (metrics["kind"], metrics["completed"], metrics["failed"]) == ("process", 2, 1)
+
+
+def test_unknown_pool_kind():
+    with pytest.raises(ValueError):
+        BoundedPool("x", "fiber", 1, 1)
+
+
+def test_event_loop_lag_monitor():
+    """阻塞事件循环的时间计入延迟，并记录到直方图"""
+    monitor = EventLoopLagMonitor(interval=0.01)
+    observed = EVENT_LOOP_LAG.count()
+
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        time.sleep(0.2)  # 阻塞事件循环
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+
+    assert monitor.metrics() == {"current_ms": 0.0, "avg_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    asyncio.run(scenario())
+    metrics = monitor.metrics()
+    assert metrics["max_ms"] >= 150
+    assert metrics["p99_ms"] <= metrics["max_ms"]
+    assert EVENT_LOOP_LAG.count() > observed
+
+
+@pytest.fixture(scope="module")
+def monitor_app(tmp_path_factory):
+    """在临时目录中导入monitor_web(数据目录取当前工作目录)"""
+    root = tmp_path_factory.mktemp("monitor")
+    (root / "data" / "detected_result_json_files").mkdir(parents=True)
+    (root / "logs").mkdir()
+    (root / "logs" / "monitor.log").write_text("定时任务结束\n", encoding="utf-8")
+
+    cwd = os.getcwd()
+    os.chdir(root)
+    os.environ["MONITOR_WATCH"] = "0"
+    sys.path.insert(0, str(PACKAGE_DIR))
+    try:
+        sys.modules.pop("monitor_web", None)
+        yield importlib.import_module("monitor_web")
+    finally:
+        sys.modules.pop("monitor_web", None)
+        os.chdir(cwd)
+
+
+def test_overloaded_pool_returns_503(monitor_app, monkeypatch):
+    import httpx
+
+    monkeypatch.setattr(monitor_app, "io_pool", BoundedPool("io", "inline", max_workers=0, max_queue=0))
+    monitor_app.clear_cache()
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=monitor_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/api/tasks/current")
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert "io" in response.json()["detail"]
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+流式ZIP打包测试 - 验证生成的压缩包可以正常解压、影像直接存储、缺失文件跳过
+"""
+
+import io
+import zipfile
+
+from monitor.zipstream import COPY_CHUNK_SIZE, iter_zip
+
+
+def test_iter_zip_round_trip(tmp_path):
+    """文件和内存数据都能写入，结果可以被zipfile读取"""
+    image = tmp_path / "result.png"
+    image_data = bytes(range(256)) * (COPY_CHUNK_SIZE // 256 * 3 + 7)
+    image.write_bytes(image_data)
+    entries = [
+        ("0001_scene/result.json", '{"数量": 1}'.encode("utf-8")),
+        ("0001_scene/result.png", image),
+        ("0002_scene/missing.png", tmp_path / "missing.png"),
+        ("manifest.json", b"{}"),
+    ]
+    chunks = list(iter_zip(entries))
+    assert len(chunks) > 2  # 大文件分块输出，而不是最后一次性输出
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ["0001_scene/result.json", "0001_scene/result.png", "manifest.json"]
+        assert zf.read("0001_scene/result.png") == image_data
+        assert zf.getinfo("0001_scene/result.png").compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo("0001_scene/result.json").compress_type == zipfile.ZIP_DEFLATED
+        assert zf.read("0001_scene/result.json").decode("utf-8") == '{"数量": 1}'
+
+
+def test_iter_zip_empty():
+    with zipfile.ZipFile(io.BytesIO(b"".join(iter_zip([])))) as zf:
+        assert zf.namelist() == []
@@ -0,0 +1,165 @@
+"""IP白名单 - 预编译的IPv4/IPv6 CIDR前缀树和纯ASGI访问控制中间件，白名单可从配置热加载"""
+
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+STRIDE = 8  # 每层按一个字节分支，IPv4最多4层，IPv6最多16层
+HOST_CACHE_SIZE = 4096
+_IPV4_MAPPED = b"\0" * 10 + b"\xff\xff"
+
+
+def _insert(root, network):
+    """插入一个网段；前缀长度不是8的倍数时把最后一层展开为它覆盖的所有字节值"""
+    prefix = network.network_address.packed
+    length = network.prefixlen
+    last = (length - 1) // STRIDE
+    node = root
+    for i in range(last):
+        child = node.get(prefix[i])
+        if child is True:
+            return  # 已被更短的前缀覆盖
+        if child is None:
+            child = node[prefix[i]] = {}
+        node = child
+    free_bits = (last + 1) * STRIDE - length
+    base = prefix[last] & (0xFF << free_bits) & 0xFF
+    for value in range(base, base + (1 << free_bits)):
+        node[value] = True
+
+
+def parse_address(host):
+    """把客户端地址解析为网络字节序的bytes，IPv4映射的IPv6地址按IPv4处理，无法解析时返回None"""
+    try:
+        return socket.inet_pton(socket.AF_INET, host)
+    except (OSError, TypeError):
+        pass
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, host.split("%", 1)[0])
+    except (OSError, TypeError, AttributeError):
+        return None
+    return packed[12:] if packed.startswith(_IPV4_MAPPED) else packed
+
+
+class IPAllowList:
+    """IPv4/IPv6 CIDR白名单
+
+    网段编译为按字节分支的前缀树，匹配时最多4次(IPv4)或16次(IPv6)字典查找，
+    与白名单条目数无关。无法解析为地址或网段的条目(如主机名)按字符串精确匹配。
+    allows() 缓存每个客户端地址的判断结果。
+    """
+
+    def __init__(self, entries=()):
+        self.entries = tuple(entries)
+        self._host_cache = {}
+        self._trees = {4: {}, 16: {}}
+        self._allow_all = {4: False, 16: False}
+        self._names = set()
+        for entry in self.entries:
+            entry = str(entry).strip()
+            try:
+                network = ipaddress.ip_network(entry, strict=False)
+            except ValueError:
+                self._names.add(entry)
+                continue
+            mapped = getattr(network.network_address, "ipv4_mapped", None)
+            if mapped is not None and network.prefixlen >= 96:
+                # 客户端的IPv4映射地址按IPv4匹配，白名单中的映射网段也转换为IPv4
+                network = ipaddress.ip_network(f"{mapped}/{network.prefixlen - 96}")
+            size = 4 if network.version == 4 else 16
+            if network.prefixlen == 0:
+                self._allow_all[size] = True
+            else:
+                _insert(self._trees[size], network)
+
+    def __contains__(self, host):
+        if host in self._names:
+            return True
+        packed = parse_address(host)
+        if packed is None:
+            return False
+        if self._allow_all[len(packed)]:
+            return True
+        node = self._trees[len(packed)]
+        for byte in packed:
+            node = node.get(byte)
+            if node is None:
+                return False
+            if node is True:
+                return True
+        return False
+
+    def allows(self, host):
+        allowed = self._host_cache.get(host)
+        if allowed is None:
+            allowed = host is not None and host in self
+            if len(self._host_cache) >= HOST_CACHE_SIZE:
+                self._host_cache.clear()
+            self._host_cache[host] = allowed
+        return allowed
+
+
+class IPAllowListMiddleware:
+    """按客户端IP限制访问的纯ASGI中间件
+
+    不经过BaseHTTPMiddleware，放行的请求直接调用下游应用，不包装响应体。
+    loader 返回最新的白名单条目，每隔 reload_interval 秒在线程池中重新加载，
+    条目变化时重新编译，加载失败时保留原白名单。
+    """
+
+    def __init__(self, app, allowed_ips, loader=None, reload_interval=5.0):
+        self.app = app
+        self.loader = loader
+        self.reload_interval = reload_interval
+        self._allow_list = IPAllowList(allowed_ips)
+        self._next_reload = time.monotonic() + reload_interval
+        self._reloading = None
+
+    @property
+    def allowed_ips(self):
+        return self._allow_list.entries
+
+    def update(self, allowed_ips):
+        """替换白名单，条目未变化时不重新编译"""
+        allowed_ips = tuple(allowed_ips)
+        if allowed_ips == self._allow_list.entries:
+            return False
+        # 编译完成后整体替换引用(连同地址判断缓存)，正在处理的请求仍使用旧的白名单
+        self._allow_list = IPAllowList(allowed_ips)
+        logger.info(f"IP白名单已更新: {len(allowed_ips)} 条")
+        return True
+
+    def reload(self):
+        """从loader重新加载白名单"""
+        try:
+            self.update(self.loader() or [])
+        except Exception as e:
+            logger.warning(f"重新加载IP白名单失败，继续使用原白名单: {e}")
+
+    def _schedule_reload(self):
+        self._next_reload = time.monotonic() + self.reload_interval
+        if self._reloading is None or self._reloading.done():
+            self._reloading = asyncio.get_running_loop().run_in_executor(None, self.reload)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        if self.loader is not None and time.monotonic() >= self._next_reload:
+            self._schedule_reload()
+        client = scope.get("client")
+        host = client[0] if client else None
+        if self._allow_list.allows(host):
+            await self.app(scope, receive, send)
+            return
+        if scope["type"] == "websocket":
+            await send({"type": "websocket.close", "code": 1008})
+            return
+        response = JSONResponse(status_code=403, content={"detail": f"IP {host} not allowed."})
+        await response(scope, receive, send)
@@ -0,0 +1,290 @@
+"""模型注册表 - 多个模型并行加载、按配置延迟加载、加载完成后预热，请求未就绪的模型时等待加载完成"""
+
+import asyncio
+import logging
+import time
+from collections.abc import Mapping
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"  # 延迟加载，尚未被请求
+LOADING = "loading"
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_WAIT_TIMEOUT = 120
+RETRY_AFTER_SECONDS = 10
+# 一次加载全部模型的加载单元在状态中的名称
+ALL_MODELS = "*"
+
+
+class ModelNotReady(Exception):
+    """模型在等待时间内没有加载完成，或加载失败"""
+
+
+def default_warmup(name, model):
+    """模型提供 warmup() 时调用它完成一次预热推理"""
+    warmup = getattr(model, "warmup", None)
+    if callable(warmup):
+        warmup()
+        return True
+    return False
+
+
+class _ModelState:
+    __slots__ = ("name", "config", "bundle", "lazy", "state", "task", "load_seconds", "warmup_seconds",
+                 "loaded_at", "error", "warmup_error")
+
+    def __init__(self, name, config, bundle=False):
+        self.name = name
+        self.config = config
+        # bundle为True时加载函数返回 {名称: 模型}，一次提供多个模型
+        self.bundle = bundle
+        self.lazy = bool(config.get("lazy", False)) if isinstance(config, dict) else False
+        self.state = PENDING
+        self.task = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.loaded_at = None
+        self.error = None
+        self.warmup_error = None
+
+
+class ModelRegistry:
+    """按名称管理模型的加载状态
+
+    start() 在后台并行加载所有非lazy的模型(同时加载的数量不超过concurrency)，不阻塞服务启动；
+    lazy模型在第一次被请求时才加载。load(name, config) 和 warmup(name, model) 为同步函数，
+    在线程池中执行；预热失败只记录错误，模型仍可使用。
+    get() 等待模型加载完成，超过wait_timeout秒或加载失败时抛出ModelNotReady，
+    加载失败的模型下一次被请求时重新加载。加载完成的模型同时放入 models 字典，
+    mapping() 返回只读映射，供仍按 app.state.models[name] 取模型的路由使用。
+    配置中没有按模型划分的列表时用 ModelRegistry.all_at_once() 把全部模型作为一个加载单元。
+    """
+
+    def __init__(self, model_configs, load, warmup=default_warmup,
+                 concurrency=DEFAULT_CONCURRENCY, wait_timeout=DEFAULT_WAIT_TIMEOUT):
+        self.load = load
+        self.warmup = warmup
+        self.wait_timeout = wait_timeout
+        self.models = {}
+        self._states = {name: _ModelState(name, config) for name, config in model_configs.items()}
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._loop = None
+
+    @classmethod
+    def all_at_once(cls, load_all, warmup=default_warmup, wait_timeout=DEFAULT_WAIT_TIMEOUT):
+        """load_all() 一次加载全部模型并返回 {名称: 模型}；模型名称在加载完成后才知道"""
+        registry = cls({}, lambda name, config: load_all(), warmup=warmup, wait_timeout=wait_timeout)
+        registry._states[ALL_MODELS] = _ModelState(ALL_MODELS, None, bundle=True)
+        return registry
+
+    def _state_for(self, name):
+        """提供该模型的加载单元；全部模型一起加载且尚未完成时，任何名称都可能由它提供"""
+        state = self._states.get(name)
+        if state is not None:
+            return state
+        bundle = self._states.get(ALL_MODELS)
+        if bundle is not None and bundle.bundle and bundle.state != READY:
+            return bundle
+        raise KeyError(name)
+
+    def __contains__(self, name):
+        if name in self.models:
+            return True
+        try:
+            self._state_for(name)
+        except KeyError:
+            return False
+        return True
+
+    def start(self):
+        """在后台开始加载所有非lazy的模型"""
+        self._loop = asyncio.get_running_loop()
+        for state in self._states.values():
+            if not state.lazy:
+                self._ensure_loading(state)
+
+    def _ensure_loading(self, state):
+        if state.task is None or (state.task.done() and state.state == FAILED):
+            state.state = LOADING
+            state.task = asyncio.get_running_loop().create_task(self._load(state))
+        return state.task
+
+    async def _load(self, state):
+        async with self._semaphore:
+            state.error = None
+            logger.info(f"开始加载模型: {state.name}")
+            started = time.perf_counter()
+            try:
+                model = await asyncio.to_thread(self.load, state.name, state.config)
+                loaded = dict(model) if state.bundle else {state.name: model}
+            except Exception as e:
+                state.state = FAILED
+                state.error = str(e)
+                state.load_seconds = round(time.perf_counter() - started, 3)
+                logger.error(f"加载模型 {state.name} 失败: {e}")
+                return
+            state.load_seconds = round(time.perf_counter() - started, 3)
+
+            state.state = WARMING
+            started = time.perf_counter()
+            warmed = False
+            for name, model in loaded.items():
+                try:
+                    warmed = await asyncio.to_thread(self.warmup, name, model) or warmed
+                except Exception as e:
+                    state.warmup_error = str(e)
+                    logger.warning(f"模型 {name} 预热失败: {e}")
+            if warmed:
+                state.warmup_seconds = round(time.perf_counter() - started, 3)
+
+        self.models.update(loaded)
+        state.state = READY
+        state.loaded_at = time.time()
+        logger.info(f"模型 {state.name} 已就绪: 加载 {state.load_seconds}s, 预热 {state.warmup_seconds}s")
+
+    def request_load(self, name):
+        """开始加载尚未加载(或加载失败)的模型，不等待；可以在线程池中调用"""
+        state = self._state_for(name)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not None and running is self._loop:
+            self._ensure_loading(state)
+        elif self._loop is not None:
+            self._loop.call_soon_threadsafe(self._ensure_loading, state)
+
+    def mapping(self):
+        return ModelMapping(self)
+
+    async def get(self, name, timeout=None):
+        """返回已加载的模型，未加载完成时等待(lazy模型在此时开始加载)"""
+        if name in self.models:
+            return self.models[name]
+        state = self._state_for(name)
+        task = self._ensure_loading(state)
+        timeout = self.wait_timeout if timeout is None else timeout
+        try:
+            # 等待者超时不能取消共享的加载任务
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            raise ModelNotReady(f"模型 {name} 正在加载，等待 {timeout}s 超时")
+        if state.state != READY:
+            raise ModelNotReady(f"模型 {name} 加载失败: {state.error}")
+        if name not in self.models:
+            raise KeyError(name)
+        return self.models[name]
+
+    def get_blocking(self, name, timeout=None):
+        """在线程池中等待模型加载完成并返回模型
+
+        在事件循环线程中调用时不能阻塞等待，开始加载后直接抛出ModelNotReady。
+        """
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if self._loop is None or running is self._loop:
+            self.request_load(name)
+            raise ModelNotReady(f"模型 {name} 正在加载，请稍后重试")
+        return asyncio.run_coroutine_threadsafe(self.get(name, timeout), self._loop).result()
+
+    async def wait_loaded(self, timeout=None):
+        """等待正在加载的非lazy模型加载结束(成功或失败)，超过timeout秒抛出ModelNotReady"""
+        tasks = [state.task for state in self._states.values()
+                 if not state.lazy and state.task is not None and not state.task.done()]
+        if not tasks:
+            return
+        timeout = self.wait_timeout if timeout is None else timeout
+        # 等待者超时不能取消共享的加载任务
+        done, _ = await asyncio.wait([asyncio.shield(task) for task in tasks], timeout=timeout)
+        if len(done) < len(tasks):
+            raise ModelNotReady(f"模型正在加载，等待 {timeout}s 超时")
+
+    def status(self):
+        """各模型的加载状态和耗时；所有非lazy模型加载完成后ready为True"""
+        return {
+            "ready": all(state.state == READY for state in self._states.values() if not state.lazy),
+            "loaded": sorted(self.models),
+            "models": {
+                name: {
+                    "state": state.state,
+                    "lazy": state.lazy,
+                    "load_seconds": state.load_seconds,
+                    "warmup_seconds": state.warmup_seconds,
+                    "loaded_at": state.loaded_at,
+                    "error": state.error,
+                    "warmup_error": state.warmup_error,
+                }
+                for name, state in self._states.items()
+            },
+        }
+
+
+class ModelMapping(Mapping):
+    """已加载模型的只读映射(app.state.models)
+
+    已就绪的模型直接返回；已配置但尚未就绪的模型在线程池中(同步路由)等待加载完成，
+    超时或加载失败时抛出ModelNotReady，由 model_not_ready_handler 转换为503；未配置的模型抛出KeyError。
+    事件循环中(异步路由)不能阻塞等待，只开始加载并抛出ModelNotReady，
+    这类路由应改用 Depends(require_model(name))，或在路由器上加 Depends(require_loaded())。
+    """
+
+    def __init__(self, registry):
+        self._registry = registry
+
+    def __getitem__(self, name):
+        models = self._registry.models
+        if name in models:
+            return models[name]
+        return self._registry.get_blocking(name)
+
+    def __contains__(self, name):
+        return name in self._registry.models
+
+    def __iter__(self):
+        return iter(list(self._registry.models))
+
+    def __len__(self):
+        return len(self._registry.models)
+
+
+async def model_not_ready_handler(request: Request, exc: ModelNotReady):
+    """异常处理器: 模型未就绪时返回503"""
+    return JSONResponse(status_code=503, content={"detail": str(exc)},
+                        headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+
+def ready_response(registry):
+    """就绪检查响应: 所有非lazy模型就绪前返回503"""
+    status = registry.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
+def require_loaded(timeout=None):
+    """路由器依赖: 等待启动时开始加载的模型加载结束，超时返回503；加载失败的模型由取模型处返回503"""
+    async def dependency(request: Request):
+        try:
+            await request.app.state.model_registry.wait_loaded(timeout)
+        except ModelNotReady as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    return dependency
+
+
+def require_model(name, timeout=None):
+    """路由依赖: 等待模型就绪后返回模型，超时或加载失败时返回503"""
+    async def dependency(request: Request):
+        try:
+            return await request.app.state.model_registry.get(name, timeout)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"模型 {name} 未配置")
+        except ModelNotReady as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    return dependency